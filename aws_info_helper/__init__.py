@@ -1,74 +1,434 @@
+import hashlib
+import json
 import re
 import os.path
-import boto3
+import random
+import sys
+import threading
+import time
 import settings_helper as sh
-import bg_helper as bh
+from importlib import import_module
 from os import walk
-from botocore.exceptions import EndpointConnectionError, ClientError, ProfileNotFound
+from aws_info_helper.rate_limit import RateLimiter
 try:
     ModuleNotFoundError
 except NameError:
     class ModuleNotFoundError(ImportError):
         pass
 
-try:
-    import redis_helper as rh
-    from redis import ConnectionError as RedisConnectionError
-except (ImportError, ModuleNotFoundError):
-    AWS_IP = None
-else:
-    try:
-        AWS_IP = rh.Collection(
-            'aws',
-            'ip',
-            index_fields='profile, ip, name, source, instance',
-            reference_fields='instance--aws:ec2',
-            insert_ts=True
-        )
-    except RedisConnectionError:
-        AWS_IP = None
-
 
 get_setting = sh.settings_getter(__name__)
 EC2_INSTANCE_KEYS = get_setting('EC2_INSTANCE_KEYS')
 EC2_INSTANCE_INFO_FORMAT = get_setting('EC2_INSTANCE_INFO_FORMAT')
 EC2_ADDRESS_KEYS = get_setting('EC2_ADDRESS_KEYS')
+EC2_PAGE_SIZE = get_setting('EC2_PAGE_SIZE', 1000)
+EC2_REGIONS = get_setting('EC2_REGIONS', '')
 ROUTE53_ZONE_KEYS = get_setting('ROUTE53_ZONE_KEYS')
 ROUTE53_RESOURCE_KEYS = get_setting('ROUTE53_RESOURCE_KEYS')
 ROUTE53_RESOURCE_INFO_FORMAT = get_setting('ROUTE53_RESOURCE_INFO_FORMAT')
+MAX_WORKERS = get_setting('MAX_WORKERS', 8)
+MAX_POOL_CONNECTIONS = get_setting('MAX_POOL_CONNECTIONS', 50)
+EC2_REQUESTS_PER_SECOND = get_setting('EC2_REQUESTS_PER_SECOND', 20)
+ROUTE53_REQUESTS_PER_SECOND = get_setting('ROUTE53_REQUESTS_PER_SECOND', 5)
+S3_REQUESTS_PER_SECOND = get_setting('S3_REQUESTS_PER_SECOND', 100)
+SSM_REQUESTS_PER_SECOND = get_setting('SSM_REQUESTS_PER_SECOND', 10)
+REQUESTS_PER_SECOND = {
+    'ec2': EC2_REQUESTS_PER_SECOND,
+    'route53': ROUTE53_REQUESTS_PER_SECOND,
+    's3': S3_REQUESTS_PER_SECOND,
+    'ssm': SSM_REQUESTS_PER_SECOND,
+}
+THROTTLE_RETRIES = get_setting('THROTTLE_RETRIES', 5)
+S3_CHECKPOINT_PAGES = get_setting('S3_CHECKPOINT_PAGES', 10)
+S3_MULTIPART_CHUNKSIZE = get_setting('S3_MULTIPART_CHUNKSIZE', 8388608)
+S3_MAX_CONCURRENCY = get_setting('S3_MAX_CONCURRENCY', 10)
+SNAPSHOT_DIR = get_setting('SNAPSHOT_DIR', '')
+SNAPSHOT_TTL_EC2 = get_setting('SNAPSHOT_TTL_EC2', 300)
+SNAPSHOT_TTL_ROUTE53 = get_setting('SNAPSHOT_TTL_ROUTE53', 900)
+SNAPSHOT_TTL_S3 = get_setting('SNAPSHOT_TTL_S3', 3600)
+SNAPSHOT_TTL_SSM = get_setting('SNAPSHOT_TTL_SSM', 900)
+SNAPSHOT_STALE_TTL = get_setting('SNAPSHOT_STALE_TTL', 86400)
+SNAPSHOT_REFRESH_WAIT = get_setting('SNAPSHOT_REFRESH_WAIT', 10)
+CACHE_TTL = get_setting('CACHE_TTL', 3600)
+CACHE_MAX_SIZE = get_setting('CACHE_MAX_SIZE', 128)
+S3_LAST_FILE_CACHE_SIZE = get_setting('S3_LAST_FILE_CACHE_SIZE', 1000)
+ASYNC_MAX_CONCURRENCY = get_setting('ASYNC_MAX_CONCURRENCY', 16)
+SSH_USER_CACHE_FILE = get_setting('SSH_USER_CACHE_FILE', '')
+THROTTLE_ERROR_CODES = {
+    'PriorRequestNotComplete',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'SlowDown',
+    'Throttling',
+    'ThrottlingException',
+    'TooManyRequestsException',
+}
+_collection_specs = {}
+_collections = {}
+_collections_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+_pool_lock = threading.RLock()
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
 IP_RX = re.compile(r'(?:\d{1,3}\.)+\d{1,3}')
 
+# Names available from this package that are only imported on first access
+_lazy_attrs = {
+    'EC2': 'aws_info_helper.ec2',
+    'AWS_EC2': 'aws_info_helper.ec2',
+    'Route53': 'aws_info_helper.route53',
+    'AWS_ROUTE53': 'aws_info_helper.route53',
+    'S3': 'aws_info_helper.s3',
+    'AWS_S3': 'aws_info_helper.s3',
+    'AWS_S3_LAST_FILE': 'aws_info_helper.s3',
+    'ParameterStore': 'aws_info_helper.parameter_store',
+}
+
+# Pagination details for client methods that return results across pages
+# - tokens: names of request params and the response keys that feed them
+# - limit_key: name of the request param that sets the page size
+# - max_page_size: largest page size the server will accept
+# - min_page_size: smallest page size the server will accept
+# - limit_as_string: if True, the page size must be passed as a string
+PAGINATION = {
+    'describe_instances': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_internet_gateways': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_nat_gateways': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_network_acls': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 100, 'min_page_size': 5,
+    },
+    'describe_network_interfaces': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_route_tables': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 100, 'min_page_size': 5,
+    },
+    'describe_security_groups': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_subnets': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_tags': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_volume_status': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_volumes': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 500, 'min_page_size': 5,
+    },
+    'describe_vpcs': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 1000, 'min_page_size': 5,
+    },
+    'describe_parameters': {
+        'tokens': {'NextToken': 'NextToken'},
+        'limit_key': 'MaxResults', 'max_page_size': 50,
+    },
+    'list_hosted_zones': {
+        'tokens': {'Marker': 'NextMarker'},
+        'limit_key': 'MaxItems', 'max_page_size': 100, 'limit_as_string': True,
+    },
+    'list_resource_record_sets': {
+        'tokens': {
+            'StartRecordName': 'NextRecordName',
+            'StartRecordType': 'NextRecordType',
+            'StartRecordIdentifier': 'NextRecordIdentifier',
+        },
+        'limit_key': 'MaxItems', 'max_page_size': 300, 'limit_as_string': True,
+    },
+    'list_objects_v2': {
+        'tokens': {'ContinuationToken': 'NextContinuationToken'},
+        'limit_key': 'MaxKeys', 'max_page_size': 1000,
+    },
+}
+
+
+def register_collection(var_name, namespace, name, **kwargs):
+    """Register the init args of a redis-helper Collection created on first use
+
+    - var_name: name the collection is accessed by (i.e. 'AWS_EC2')
+    - namespace: namespace passed to rh.Collection
+    - name: name passed to rh.Collection
+    - kwargs: any other keyword args passed to rh.Collection
+    """
+    _collection_specs[var_name] = (namespace, name, kwargs)
+
+
+def get_collection(var_name):
+    """Return the redis-helper Collection registered as var_name
+
+    The Collection (and redis-helper itself) is only created/imported the first
+    time this is called. None is returned if redis-helper is not installed or
+    Redis can't be reached
+    """
+    with _collections_lock:
+        if var_name not in _collections:
+            try:
+                import redis_helper as rh
+                from redis import ConnectionError as RedisConnectionError
+            except (ImportError, ModuleNotFoundError):
+                collection = None
+            else:
+                namespace, name, kwargs = _collection_specs[var_name]
+                try:
+                    collection = rh.Collection(namespace, name, **kwargs)
+                except RedisConnectionError:
+                    collection = None
+            _collections[var_name] = collection
+        return _collections[var_name]
+
 
 def get_session(profile_name='default'):
-    """Return a boto3.Session instance for profile"""
-    try:
-        session = boto3.Session(profile_name=profile_name)
-    except ProfileNotFound:
-        if profile_name == 'default':
-            session = boto3.Session()
-        else:
-            raise
-    return session
+    """Return a boto3.Session instance for profile
+
+    Sessions are created once per profile and reused
+    """
+    import boto3
+    from botocore.exceptions import ProfileNotFound
+    with _pool_lock:
+        if profile_name not in _sessions:
+            try:
+                session = boto3.Session(profile_name=profile_name)
+            except ProfileNotFound:
+                if profile_name == 'default':
+                    session = boto3.Session()
+                else:
+                    raise
+            _sessions[profile_name] = session
+        return _sessions[profile_name]
+
+
+def get_client(service, profile_name='default', region_name=None):
+    """Return a boto3 client for a service/profile/region combo
+
+    - service: name of the AWS service (i.e. 'ec2', 'route53', 's3', 'ssm')
+    - profile_name: name of the AWS profile
+    - region_name: name of the AWS region (default region of profile if None)
+
+    Clients are created on first request and reused after that (boto3 clients
+    are thread-safe), so their service models and keep-alive HTTP connections
+    stay warm. Each client's connection pool holds up to MAX_POOL_CONNECTIONS
+    """
+    from botocore.config import Config
+    with _pool_lock:
+        session = get_session(profile_name)
+        key = (service, profile_name, region_name or session.region_name)
+        if key not in _clients:
+            _clients[key] = session.client(
+                service,
+                region_name=region_name,
+                config=Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+            )
+        return _clients[key]
+
+
+def clear_client_pool():
+    """Forget all cached sessions and clients (i.e. after credentials change)"""
+    with _pool_lock:
+        _sessions.clear()
+        _clients.clear()
+
+
+class ClientCallError(Exception):
+    """Raised when a client call fails in a way that must not look like 'no data'"""
+    def __init__(self, method_name, error):
+        self.method_name = method_name
+        self.error = error
+        super(ClientCallError, self).__init__(
+            '{} failed: {}'.format(method_name, repr(error))
+        )
 
 
-def client_call(client, method_name, main_key='', **kwargs):
+class ThrottlingError(ClientCallError):
+    """Raised when a client call is still throttled after THROTTLE_RETRIES"""
+    pass
+
+
+def get_rate_limiter(service, profile_name='default', region_name=None):
+    """Return the shared RateLimiter for a service/profile/region combo
+
+    - service: name of the AWS service (i.e. 'ec2', 'route53', 's3', 'ssm')
+    - profile_name: name of the AWS profile
+    - region_name: name of the AWS region
+
+    The max rate comes from the REQUESTS_PER_SECOND dict (with values from the
+    *_REQUESTS_PER_SECOND settings)
+    """
+    key = (service, profile_name, region_name)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(REQUESTS_PER_SECOND.get(service, 10))
+        return _rate_limiters[key]
+
+
+def client_call(client, method_name, main_key='', rate_limiter=None,
+                allowed_errors=(), **kwargs):
     """Call a boto client method and return retrieved data
 
     - client: boto3.Session.client instance
     - method_name: name of the client method to execute
     - main_key: the name of the main top-level key in the response that has the
       actual relevant info
+    - rate_limiter: a RateLimiter instance to wait on before each attempt
+    - allowed_errors: error codes that are an expected answer for this call
+      (i.e. 'ParameterNotFound' for get_parameter); they are printed and an
+      empty list is returned
     - kwargs: any keyword args that need to be passed to the client method
+
+    Throttling errors are retried up to THROTTLE_RETRIES times with
+    exponential backoff and full jitter (and the rate_limiter slows down). If
+    still throttled, ThrottlingError is raised. Any other client error (i.e.
+    AccessDenied, ExpiredToken) or an unreachable endpoint raises
+    ClientCallError, so a failed call never looks like 'no data'
     """
+    from botocore.exceptions import EndpointConnectionError, ClientError
     results = []
-    try:
-        results = getattr(client, method_name)(**kwargs)
-    except (EndpointConnectionError, ClientError) as e:
-        print(repr(e))
-    else:
-        if main_key:
-            results = results.get(main_key)
-    return results
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            results = getattr(client, method_name)(**kwargs)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in THROTTLE_ERROR_CODES:
+                if rate_limiter is not None:
+                    rate_limiter.throttled()
+                if attempt >= THROTTLE_RETRIES:
+                    raise ThrottlingError(method_name, e)
+                time.sleep(random.uniform(0, min(20, 0.5 * 2 ** attempt)))
+                attempt += 1
+                continue
+            if code not in allowed_errors:
+                raise ClientCallError(method_name, e)
+            print(repr(e))
+        except EndpointConnectionError as e:
+            raise ClientCallError(method_name, e)
+        else:
+            if rate_limiter is not None:
+                rate_limiter.succeeded()
+            if main_key:
+                results = results.get(main_key)
+        return results
+
+
+def iter_client_call(client, method_name, main_key='', page_size=None,
+                     max_items=None, **kwargs):
+    """Call a boto client method and yield retrieved data from every page
+
+    - client: boto3.Session.client instance
+    - method_name: name of the client method to execute
+    - main_key: the name of the main top-level key in the response that has the
+      actual relevant info
+        - if empty, each full response (page) is yielded instead of items
+    - page_size: max number of items the server should return per page; if
+      None, use the server default
+    - max_items: max number of items to yield before stopping (None for all)
+    - kwargs: any keyword args that need to be passed to the client method
+
+    If method_name is not in PAGINATION, a single client_call is made. Pages
+    are only fetched as the generator is consumed, so stopping early avoids
+    requesting the remaining pages. If any page after the first fails (even
+    with one of the allowed_errors passed to client_call), ClientCallError is
+    raised instead of ending early with partial results
+    """
+    spec = PAGINATION.get(method_name)
+    if spec is None:
+        results = client_call(client, method_name, main_key, **kwargs)
+        if not main_key:
+            results = [results] if results else []
+        for count, item in enumerate(results or [], start=1):
+            yield item
+            if max_items and count >= max_items:
+                return
+        return
+
+    kwargs = kwargs.copy()
+    limit_key = spec.get('limit_key')
+    count = 0
+    page = 0
+    while True:
+        if limit_key and (page_size or max_items):
+            limit = page_size or spec['max_page_size']
+            if max_items:
+                limit = min(limit, max_items - count)
+            limit = min(limit, spec['max_page_size'])
+            limit = max(limit, spec.get('min_page_size', 1))
+            kwargs[limit_key] = str(limit) if spec.get('limit_as_string') else limit
+        resp = client_call(client, method_name, **kwargs)
+        page += 1
+        if not resp:
+            if page > 1:
+                raise ClientCallError(
+                    method_name, 'no response for page {}'.format(page)
+                )
+            return
+        items = (resp.get(main_key) or []) if main_key else [resp]
+        for item in items:
+            yield item
+            count += 1
+            if max_items and count >= max_items:
+                return
+        tokens = {
+            param: resp[response_key]
+            for param, response_key in spec['tokens'].items()
+            if resp.get(response_key)
+        }
+        if not tokens:
+            return
+        for param in spec['tokens']:
+            kwargs.pop(param, None)
+        kwargs.update(tokens)
+
+
+def paginated_client_call(client, method_name, main_key='', page_size=None,
+                          max_items=None, **kwargs):
+    """Call a boto client method and return retrieved data from all pages
+
+    Wrapper to iter_client_call
+    """
+    return list(iter_client_call(
+        client, method_name, main_key, page_size=page_size, max_items=max_items,
+        **kwargs
+    ))
+
+
+def fingerprint(data, exclude=('fp',)):
+    """Return a short hash of the contents of a dict
+
+    - data: dict of field names and values
+    - exclude: field names to leave out of the hash
+
+    Stored in the 'fp' field of collection records, so a refresh can tell
+    which records actually changed without fetching all their fields
+    """
+    return hashlib.sha1(json.dumps(
+        {k: v for k, v in data.items() if k not in exclude},
+        sort_keys=True,
+        default=str
+    ).encode('utf-8')).hexdigest()[:16]
 
 
 def get_profiles():
@@ -89,7 +449,326 @@ def get_profiles():
     return profiles
 
 
-from aws_info_helper.ec2 import EC2, AWS_EC2
-from aws_info_helper.route53 import Route53, AWS_ROUTE53
-from aws_info_helper.s3 import S3, AWS_S3, AWS_S3_LAST_FILE
-from aws_info_helper.parameter_store import ParameterStore
+# Serializes redis-helper collection writes made by worker threads in this
+# process, so find-then-add sequences stay consistent and threads don't end up
+# polling each other's redis-side collection lock
+COLLECTION_LOCK = threading.RLock()
+
+
+def get_hash_ids_for_unique_values(collection, values):
+    """Return dict of unique field values and their hash_ids (values that
+    aren't stored are left out), looked up in one pipeline
+
+    - collection: a redis-helper Collection with a unique_field
+    - values: iterable of unique field values
+    """
+    import redis_helper as rh
+    values = list(values)
+    if not values:
+        return {}
+    pipe = rh.REDIS.pipeline(transaction=False)
+    for value in values:
+        pipe.zscore(collection._id_zset_key, value)
+    return {
+        value: collection._make_key(collection._base_key, int(score))
+        for value, score in zip(values, pipe.execute())
+        if score
+    }
+
+
+def read_collection_records(collection, index_field, value, fields):
+    """Return list of dicts (with '_id' and the fields) for every record that
+    has value for index_field, read with one SMEMBERS and one pipeline of HMGET
+
+    - collection: a redis-helper Collection (from get_collection)
+    - index_field: name of an index field of the collection
+    - value: value of index_field to read records for
+    - fields: list of field names to get for each record
+
+    Unlike Collection.find, no get stats are written and stored values are not
+    converted with ih.from_string (only decoded, or loaded for json/pickle
+    fields), so the Redis work is the same for any number of records
+    """
+    import json
+    import pickle
+    import redis_helper as rh
+    fields = list(fields)
+    hash_ids = sorted(
+        x.decode('utf-8') if isinstance(x, bytes) else x
+        for x in rh.REDIS.smembers(
+            collection._make_key(collection._index_base_keys[index_field], str(value))
+        )
+    )
+    if not hash_ids:
+        return []
+    pipe = rh.REDIS.pipeline(transaction=False)
+    for hash_id in hash_ids:
+        pipe.hmget(hash_id, *fields)
+    results = []
+    for hash_id, values in zip(hash_ids, pipe.execute()):
+        if not any(x is not None for x in values):
+            continue
+        data = {'_id': hash_id}
+        for field, val in zip(fields, values):
+            if val is not None and field in collection._pickle_fields:
+                val = pickle.loads(val)
+            elif isinstance(val, bytes):
+                val = val.decode('utf-8', 'replace')
+                if field in collection._json_fields:
+                    try:
+                        val = json.loads(val)
+                    except ValueError:
+                        pass
+            data[field] = val
+        results.append(data)
+    return results
+
+
+def write_collection_changes(collection, adds=(), updates=(), deletes=()):
+    """Write many changes to a redis-helper Collection in one transaction
+
+    - collection: a redis-helper Collection (from get_collection)
+    - adds: list of dicts to add (unique field values must not exist yet)
+    - updates: list of (hash_id, dict of fields) tuples
+    - deletes: list of hash_ids to remove
+
+    Current values of updated and deleted records are read in one pipeline and
+    hash ids for adds are reserved with one INCRBY. Then every add, update, and
+    delete is queued in a single MULTI/EXEC, so readers see all of the changes
+    or none of them. The same keys are written as Collection.add/update/delete
+    (indexes, unique values, timestamps, and change history).
+
+    Return a dict with 'updates' (hash ids of adds and change strings of
+    updates, like Collection.add/update) and 'deletes'
+    """
+    import pickle
+    import redis_helper as rh
+    from redis_helper.collection import dumps
+    adds = list(adds)
+    updates = list(updates)
+    deletes = list(deletes)
+    result = {'updates': [], 'deletes': deletes}
+    if not adds and not updates and not deletes:
+        return result
+
+    def _stored(field, value):
+        if field in collection._json_fields:
+            return dumps(value)
+        if field in collection._pickle_fields:
+            return pickle.dumps(value)
+        if type(value) not in (bytes, str, int, float):
+            return str(value)
+        return value
+
+    def _raw(value):
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def _text(value):
+        return value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+
+    for data in adds:
+        errors = collection.validate(**data)
+        if errors:
+            raise Exception('Validation errors: ' + repr(errors))
+    for hash_id, data in updates:
+        errors = collection.validate(**data)
+        if errors:
+            raise Exception('Validation errors: ' + repr(errors))
+
+    index_fields = sorted(collection._index_base_keys)
+    unique_field = collection._unique_field
+    collection.wait_for_unlock()
+    collection._lock()
+    try:
+        pipe = rh.REDIS.pipeline(transaction=False)
+        for hash_id, data in updates:
+            pipe.zscore(collection._ts_zset_key, hash_id)
+            pipe.hgetall(hash_id)
+        for hash_id in deletes:
+            pipe.zscore(collection._ts_zset_key, hash_id)
+            pipe.hgetall(hash_id)
+        if adds:
+            pipe.setnx(collection._next_id_string_key, 1)
+            pipe.incrby(collection._next_id_string_key, len(adds))
+        found = pipe.execute()
+        old = [
+            (found[i], {_text(k): v for k, v in found[i + 1].items()})
+            for i in range(0, 2 * (len(updates) + len(deletes)), 2)
+        ]
+        next_id = int(found[-1]) - len(adds) if adds else 0
+
+        now = collection.now_utc_float
+        pipe = rh.REDIS.pipeline()
+        for i, data in enumerate(adds):
+            key = collection._make_key(collection._base_key, next_id + i)
+            data = {field: _stored(field, value) for field, value in data.items()}
+            if unique_field:
+                pipe.zadd(collection._id_zset_key, {data[unique_field]: next_id + i})
+            pipe.zadd(collection._ts_zset_key, {key: now})
+            if collection._insert_ts:
+                pipe.zadd(collection._in_zset_key, {key: now})
+            pipe.hset(key, mapping=data)
+            for field in index_fields:
+                value = str(data.get(field))
+                pipe.sadd(collection._make_key(collection._index_base_keys[field], value), key)
+                pipe.zincrby(collection._index_base_keys[field], 1, value)
+            result['updates'].append(key)
+
+        for (hash_id, data), (score, old_data) in zip(updates, old):
+            if score is None:
+                continue
+            changed = {}
+            for field, value in data.items():
+                value = _stored(field, value)
+                if _raw(value) == old_data.get(field):
+                    continue
+                old_value = _text(old_data.get(field))
+                changed[field] = value
+                result['updates'].append('{} {}: {} | {}'.format(
+                    hash_id, field, old_value, _text(value)
+                ))
+                pipe.hset(
+                    collection._make_key(hash_id, '_changes'),
+                    '{}--{}'.format(field, score),
+                    str(old_value)
+                )
+                if field in collection._index_base_keys:
+                    base_key = collection._index_base_keys[field]
+                    pipe.srem(collection._make_key(base_key, old_value), hash_id)
+                    pipe.zincrby(base_key, -1, str(old_value))
+                    pipe.sadd(collection._make_key(base_key, value), hash_id)
+                    pipe.zincrby(base_key, 1, str(value))
+            if changed:
+                pipe.hset(hash_id, mapping=changed)
+                pipe.zadd(collection._ts_zset_key, {hash_id: now})
+
+        for hash_id, (score, old_data) in zip(deletes, old[len(updates):]):
+            pipe.delete(hash_id)
+            pipe.delete(collection._make_key(hash_id, '_changes'))
+            pipe.hdel(
+                collection._get_id_stats_hash_key,
+                hash_id + '--count',
+                hash_id + '--last_access',
+            )
+            pipe.zrem(collection._ts_zset_key, hash_id)
+            pipe.zrem(collection._in_zset_key, hash_id)
+            if unique_field and old_data.get(unique_field) is not None:
+                pipe.zrem(collection._id_zset_key, old_data[unique_field])
+            if score is None and not old_data:
+                continue
+            for field in index_fields:
+                value = str(_text(old_data.get(field)))
+                base_key = collection._index_base_keys[field]
+                pipe.srem(collection._make_key(base_key, value), hash_id)
+                pipe.zincrby(base_key, -1, value)
+
+        pipe.hset(
+            '_REDIS_HELPER_COLLECTION', collection._base_key + '--last_update', now
+        )
+        pipe.execute()
+        rh.REDIS.hset(
+            '_REDIS_HELPER_COLLECTION', collection._base_key + '--last_size',
+            collection.size
+        )
+    finally:
+        collection._unlock()
+    return result
+
+
+def concurrent_map(func, items, max_workers=MAX_WORKERS, max_pending=None):
+    """Call func on each item using a bounded pool of threads
+
+    - func: a single-var func
+    - items: an iterable of items to pass to func
+    - max_workers: max number of threads to run at once (default from
+      MAX_WORKERS setting)
+    - max_pending: max number of items submitted and not yet yielded (None to
+      submit every item up front); with a lazy iterable of items, only this
+      many are pulled from it ahead of the results
+
+    Return a generator of (item, result, exception) tuples in the order they
+    finish; exception is None if the call succeeded
+    """
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers or 1) as executor:
+        futures = {}
+        while True:
+            for item in items:
+                futures[executor.submit(func, item)] = item
+                if max_pending and len(futures) >= max_pending:
+                    break
+            if not futures:
+                return
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield (item, None, e)
+                else:
+                    yield (item, result, None)
+
+
+def update_collection_for_profiles(cls, profiles=None, max_workers=MAX_WORKERS,
+                                   **kwargs):
+    """Call update_collection on a cls instance for each profile concurrently
+
+    - cls: EC2, Route53, S3, or ip_index.IPCollection
+    - profiles: list of profile names (default is all from get_profiles())
+    - max_workers: max number of profiles to update at once (default from
+      MAX_WORKERS setting)
+    - kwargs: any keyword args that need to be passed to update_collection
+
+    Return a dict with combined 'updates' and 'deletes', and an 'errors' dict of
+    profile names and the exception raised while updating that profile
+    """
+    if profiles is None:
+        profiles = get_profiles()
+    summary = {'updates': [], 'deletes': [], 'errors': {}}
+
+    def _update(profile):
+        return cls(profile).update_collection(**kwargs) or {}
+
+    for profile, result, exc in concurrent_map(
+        _update, sorted(set(profiles)), max_workers=max_workers
+    ):
+        if exc is not None:
+            summary['errors'][profile] = exc
+            continue
+        summary['updates'].extend(result.get('updates', []))
+        summary['deletes'].extend(result.get('deletes', []))
+    return summary
+
+
+register_collection(
+    'AWS_IP',
+    'aws',
+    'ip',
+    index_fields='profile, ip, name, source, instance',
+    reference_fields='instance--aws:ec2',
+    insert_ts=True
+)
+
+
+def __getattr__(name):
+    """Import submodules and create redis-helper collections on first access"""
+    if name in _lazy_attrs:
+        return getattr(import_module(_lazy_attrs[name]), name)
+    if name in _collection_specs:
+        return get_collection(name)
+    raise AttributeError('module {} has no attribute {}'.format(repr(__name__), repr(name)))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attrs) | set(_collection_specs))
+
+
+if sys.version_info < (3, 7):
+    # Module-level __getattr__ is not supported, so import everything now
+    AWS_IP = get_collection('AWS_IP')
+    from aws_info_helper.ec2 import EC2, AWS_EC2
+    from aws_info_helper.route53 import Route53, AWS_ROUTE53
+    from aws_info_helper.s3 import S3, AWS_S3, AWS_S3_LAST_FILE
+    from aws_info_helper.parameter_store import ParameterStore
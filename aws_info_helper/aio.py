@@ -0,0 +1,156 @@
+import asyncio
+import inspect
+import threading
+import weakref
+import aws_info_helper as ah
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+
+_executor = None
+_semaphores = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+try:
+    _get_running_loop = asyncio.get_running_loop
+except AttributeError:  # python < 3.7
+    _get_running_loop = asyncio.get_event_loop
+
+
+def get_executor():
+    """Return the shared thread pool that blocking calls are run in"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ah.ASYNC_MAX_CONCURRENCY)
+        return _executor
+
+
+def get_semaphore(loop=None):
+    """Return the shared semaphore (for the running event loop) that limits
+    how many blocking calls are in flight at once
+    """
+    loop = loop or _get_running_loop()
+    with _lock:
+        if loop not in _semaphores:
+            _semaphores[loop] = asyncio.Semaphore(ah.ASYNC_MAX_CONCURRENCY)
+        return _semaphores[loop]
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking func in the shared thread pool and return its result
+
+    Calls wait on the shared semaphore, so no more than ASYNC_MAX_CONCURRENCY
+    run at once across every async object
+    """
+    loop = _get_running_loop()
+    async with get_semaphore(loop):
+        return await loop.run_in_executor(
+            get_executor(), partial(func, *args, **kwargs)
+        )
+
+
+def _collect(func, *args, **kwargs):
+    return list(func(*args, **kwargs))
+
+
+class AsyncWrapper(object):
+    """Wrap an EC2, Route53, S3, or ParameterStore instance so that each of its
+    methods returns an awaitable
+
+    Methods run in the shared thread pool (see run_blocking), so they use the
+    exact same filtering, casting, and renaming logic. Generator methods
+    (i.e. iter_*) are collected into lists. Non-callable attributes (i.e.
+    cached_* properties) are returned as is
+    """
+    sync_class = None
+
+    def __init__(self, *args, **kwargs):
+        self._sync = self.sync_class(*args, **kwargs)
+
+    @classmethod
+    def wrap(cls, instance):
+        """Return an async wrapper around an existing instance (i.e. one whose
+        client is stubbed with botocore.stub.Stubber)
+        """
+        obj = cls.__new__(cls)
+        obj._sync = instance
+        return obj
+
+    @property
+    def sync(self):
+        return self._sync
+
+    def __getattr__(self, name):
+        if name == '_sync':
+            raise AttributeError(name)
+        attr = getattr(self._sync, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        if inspect.isgeneratorfunction(getattr(attr, '__func__', attr)):
+            func = partial(_collect, attr)
+        else:
+            func = attr
+
+        @wraps(attr)
+        async def method(*args, **kwargs):
+            return await run_blocking(func, *args, **kwargs)
+
+        return method
+
+    def __dir__(self):
+        return sorted(set(dir(type(self))) | set(dir(self._sync)))
+
+
+class AsyncEC2(AsyncWrapper):
+    @property
+    def sync_class(self):
+        return ah.EC2
+
+
+class AsyncRoute53(AsyncWrapper):
+    @property
+    def sync_class(self):
+        return ah.Route53
+
+
+class AsyncS3(AsyncWrapper):
+    @property
+    def sync_class(self):
+        return ah.S3
+
+
+class AsyncParameterStore(AsyncWrapper):
+    @property
+    def sync_class(self):
+        return ah.ParameterStore
+
+
+async def call_for_profiles(cls, method_name, profiles=None, *args, **kwargs):
+    """Await the same method for many profiles concurrently
+
+    - cls: AsyncEC2, AsyncRoute53, AsyncS3, or AsyncParameterStore
+    - method_name: name of the method to call for each profile
+    - profiles: list of profile names (default is every profile from
+      ah.get_profiles)
+    - args/kwargs: passed to the method
+
+    Return a dict with 'results' and 'errors', both keyed on profile name
+    """
+    profiles = profiles or ah.get_profiles()
+
+    async def _call(profile):
+        obj = await run_blocking(cls, profile)
+        return await getattr(obj, method_name)(*args, **kwargs)
+
+    outcomes = await asyncio.gather(
+        *[_call(profile) for profile in profiles],
+        return_exceptions=True
+    )
+    summary = {'results': {}, 'errors': {}}
+    for profile, outcome in zip(profiles, outcomes):
+        if isinstance(outcome, Exception):
+            summary['errors'][profile] = outcome
+        else:
+            summary['results'][profile] = outcome
+    return summary
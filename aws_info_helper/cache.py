@@ -0,0 +1,146 @@
+import threading
+import time
+import weakref
+import aws_info_helper as ah
+from collections import OrderedDict
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+_registry = weakref.WeakValueDictionary()
+_registry_lock = threading.Lock()
+
+
+class TTLCache(MutableMapping):
+    def __init__(self, maxsize=None, ttl=None, **tags):
+        """Dict-like cache where keys expire and least recently used keys are
+        evicted once there are more than maxsize
+
+        - maxsize: max number of keys (default is CACHE_MAX_SIZE from settings;
+          0 for no limit)
+        - ttl: default number of seconds a key is kept (default is CACHE_TTL
+          from settings; 0 for no expiry)
+        - tags: values that identify what the cache holds (i.e. profile='dev',
+          resource='ec2'), so it can be found by invalidate and get_stats
+
+        Every cache is added to a registry (held with weak references)
+        """
+        self._maxsize = ah.CACHE_MAX_SIZE if maxsize is None else maxsize
+        self._ttl = ah.CACHE_TTL if ttl is None else ttl
+        self._tags = tags
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        with _registry_lock:
+            _registry[id(self)] = self
+
+    @property
+    def tags(self):
+        return self._tags
+
+    @property
+    def stats(self):
+        """Return dict of hits, misses, evictions, expirations, size, and tags
+        (dict of the cache's tags)
+        """
+        with self._lock:
+            self._purge()
+            return dict(self._stats, size=len(self._data), tags=dict(self._tags))
+
+    def matches(self, **tags):
+        """Return True if every given tag has the same value for this cache"""
+        return all(self._tags.get(k) == v for k, v in tags.items())
+
+    def _purge(self):
+        now = time.time()
+        expired = [
+            key for key, (_, expires) in self._data.items()
+            if expires and expires <= now
+        ]
+        for key in expired:
+            del self._data[key]
+        self._stats['expirations'] += len(expired)
+
+    def set(self, key, value, ttl=None):
+        """Set a key with its own ttl (seconds, 0 for no expiry)"""
+        ttl = self._ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            if self._maxsize and len(self._data) > self._maxsize:
+                self._purge()
+                while len(self._data) > self._maxsize:
+                    self._data.popitem(last=False)
+                    self._stats['evictions'] += 1
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self._stats['misses'] += 1
+                raise
+            if expires and expires <= time.time():
+                del self._data[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                raise KeyError(key)
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __iter__(self):
+        with self._lock:
+            self._purge()
+            return iter(list(self._data))
+
+    def __len__(self):
+        with self._lock:
+            self._purge()
+            return len(self._data)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, repr(self._tags))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def invalidate_keys(self, func):
+        """Delete keys where func(key) is True and return how many"""
+        with self._lock:
+            keys = [key for key in self._data if func(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+
+def get_caches(**tags):
+    """Return list of TTLCache instances matching the given tags"""
+    with _registry_lock:
+        caches = list(_registry.values())
+    return [cache for cache in caches if cache.matches(**tags)]
+
+
+def invalidate(**tags):
+    """Clear every TTLCache matching the given tags (i.e. profile='dev',
+    resource='s3') and return how many caches were cleared
+    """
+    caches = get_caches(**tags)
+    for cache in caches:
+        cache.clear()
+    return len(caches)
+
+
+def get_stats(**tags):
+    """Return list of stats dicts for every TTLCache matching the given tags"""
+    return [cache.stats for cache in get_caches(**tags)]
@@ -1,30 +1,38 @@
+import sys
 import aws_info_helper as ah
 import input_helper as ih
 import dt_helper as dh
 from functools import partial
-try:
-    ModuleNotFoundError
-except NameError:
-    class ModuleNotFoundError(ImportError):
-        pass
-
-try:
-    import redis_helper as rh
-    from redis import ConnectionError as RedisConnectionError
-except (ImportError, ModuleNotFoundError):
-    AWS_EC2 = None
-else:
-    try:
-        AWS_EC2 = rh.Collection(
-            'aws',
-            'ec2',
-            unique_field='id',
-            index_fields='profile, type, pem, az, subnet, ami, name, status, sshuser',
-            json_fields='sg',
-            insert_ts=True
-        )
-    except RedisConnectionError:
-        AWS_EC2 = None
+from aws_info_helper.cache import TTLCache
+from aws_info_helper.index import SubstringIndex
+from aws_info_helper.ip_index import (
+    iter_address_ip_entries, iter_instance_ip_entries, sync_ip_entries
+)
+from aws_info_helper.records import field_names, record_class, record_maker
+from aws_info_helper.snapshot import snapshot_call
+from aws_info_helper.transform import compile_transform
+
+
+ah.register_collection(
+    'AWS_EC2',
+    'aws',
+    'ec2',
+    unique_field='id',
+    index_fields='profile, region, type, pem, az, subnet, ami, name, status, sshuser',
+    json_fields='sg',
+    insert_ts=True
+)
+
+
+def __getattr__(name):
+    """Create the redis-helper collection(s) on first access"""
+    if name == 'AWS_EC2':
+        return ah.get_collection(name)
+    raise AttributeError('module {} has no attribute {}'.format(repr(__name__), repr(name)))
+
+
+if sys.version_info < (3, 7):  # no module-level __getattr__
+    AWS_EC2 = ah.get_collection('AWS_EC2')
 
 
 INSTANCE_FILTER_KEY_CONDITIONS = {
@@ -56,20 +64,70 @@ INSTANCE_KEY_NAME_MAPPING = {
     'VpcId': 'vpc',
 }
 
+# Fields of serialized instance data that find_instances matches terms against
+INSTANCE_FIND_FIELDS = 'name, id, ip, ip_private'
+
 ADDRESS_KEY_NAME_MAPPING = {
     'PublicIp': 'ip',
     'InstanceId': 'instance',
 }
 
+InstanceRecord = record_class(
+    'InstanceRecord',
+    field_names(ah.EC2_INSTANCE_KEYS, INSTANCE_KEY_NAME_MAPPING) + ['profile', 'region']
+)
+
+AddressRecord = record_class(
+    'AddressRecord',
+    field_names(ah.EC2_ADDRESS_KEYS, ADDRESS_KEY_NAME_MAPPING) + ['profile', 'region']
+)
+
+make_instance_record = record_maker(
+    InstanceRecord,
+    ah.EC2_INSTANCE_KEYS,
+    INSTANCE_FILTER_KEY_CONDITIONS,
+    INSTANCE_KEY_VALUE_CASTING,
+    INSTANCE_KEY_NAME_MAPPING
+)
+
+make_address_record = record_maker(
+    AddressRecord,
+    ah.EC2_ADDRESS_KEYS,
+    name_mapping=ADDRESS_KEY_NAME_MAPPING
+)
+
 
 class EC2(object):
-    def __init__(self, profile_name='default'):
-        session = ah.get_session(profile_name)
-        self._client = session.client('ec2')
+    def __init__(self, profile_name='default', region_name=None, snapshots=False):
+        self._client = ah.get_client('ec2', profile_name, region_name)
         self._profile = profile_name
-        self._cache = {}
-        self._collection = AWS_EC2
-        self.client_call = partial(ah.client_call, self._client)
+        self._region = self._client.meta.region_name
+        self._cache = TTLCache(profile=profile_name, region=self._region, resource='ec2')
+        self._rate_limiter = ah.get_rate_limiter(
+            'ec2', profile_name, self._client.meta.region_name
+        )
+        self.client_call = partial(
+            ah.client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.iter_client_call = partial(
+            ah.iter_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.paginated_client_call = partial(
+            ah.paginated_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self._snapshots = snapshots
+        if snapshots:
+            self.iter_client_call = snapshot_call(
+                self.iter_client_call, profile_name, self._client.meta.region_name,
+                lazy=True
+            )
+            self.paginated_client_call = snapshot_call(
+                self.paginated_client_call, profile_name, self._client.meta.region_name
+            )
+
+    @property
+    def _collection(self):
+        return ah.get_collection('AWS_EC2')
 
     def get_cached(self):
         return self._cache
@@ -78,9 +136,13 @@ class EC2(object):
     def cached_instances(self):
         return self._cache.get('instances', [])
 
+    @property
+    def cached_instance_records(self):
+        return self._cache.get('instance_records', [])
+
     @property
     def cached_addressess(self):
-        return self._cache.get('addressess', [])
+        return self._cache.get('addresses', [])
 
     @property
     def cached_instance_strings(self):
@@ -146,14 +208,68 @@ class EC2(object):
     def cached_vpcs(self):
         return self._cache.get('vpcs', [])
 
+    def iter_instances_full_data(self, page_size=ah.EC2_PAGE_SIZE):
+        """Yield instances with full data, one describe_instances page at a time
+
+        - page_size: max number of instances the server should return per page
+          (default from EC2_PAGE_SIZE setting); if None, use the server default
+        """
+        for reservation in self.iter_client_call(
+            'describe_instances',
+            'Reservations',
+            page_size=page_size
+        ):
+            for instance in reservation['Instances']:
+                yield instance
+
+    def iter_instances_filtered_data(self, filter_keys=ah.EC2_INSTANCE_KEYS,
+                                     conditions=INSTANCE_FILTER_KEY_CONDITIONS):
+        """Yield instances filtered on specified keys
+
+        - filter_keys: the keys that should be returned from full data with
+          nesting allowed (default from EC2_INSTANCE_KEYS setting)
+        - conditions: dict of key names and single-var funcs that return bool
+          (default from INSTANCE_FILTER_KEY_CONDITIONS variable)
+        """
+        transform = compile_transform(filter_keys, conditions)
+        for instance in self.iter_instances_full_data():
+            yield transform(instance)
+
+    def iter_instances_serialized_data(self, filtered_data=None,
+                                       value_casting=INSTANCE_KEY_VALUE_CASTING,
+                                       name_mapping=INSTANCE_KEY_NAME_MAPPING):
+        """Yield instances with casted values and renamed keys
+
+        - filtered_data: instance data from self.get_all_instances_filtered_data()
+          or self.iter_instances_filtered_data()
+        - value_casting: dict of key names and single-var funcs that return casted
+          value for that key name (default from INSTANCE_KEY_VALUE_CASTING variable)
+        - name_mapping: dict of key names and new key names they should be mapped to
+          (default from INSTANCE_KEY_NAME_MAPPING variable)
+
+        If filtered_data is None, instances are filtered, casted, and renamed
+        in a single pass over full data (see transform.compile_transform)
+        """
+        if filtered_data is None:
+            transform = compile_transform(
+                ah.EC2_INSTANCE_KEYS, INSTANCE_FILTER_KEY_CONDITIONS,
+                value_casting, name_mapping
+            )
+            filtered_data = self.iter_instances_full_data()
+        else:
+            transform = compile_transform(None, None, value_casting, name_mapping)
+        for instance in filtered_data:
+            data = transform(instance)
+            data['profile'] = self._profile
+            data['region'] = self._region
+            yield data
+
     def get_all_instances_full_data(self, cache=False):
         """Get all instances with full data
 
         - cache: if True, cache results in self._cache['instances']
         """
-        instances = []
-        for x in self.client_call('describe_instances', 'Reservations'):
-            instances.extend(x['Instances'])
+        instances = list(self.iter_instances_full_data())
         if cache:
             self._cache['instances'] = instances
         return instances
@@ -172,10 +288,7 @@ class EC2(object):
             - key name format: simple
             - key name format: some__nested__key
         """
-        instances = [
-            ih.filter_keys(instance, filter_keys, **conditions)
-            for instance in self.get_all_instances_full_data()
-        ]
+        instances = list(self.iter_instances_filtered_data(filter_keys, conditions))
         if cache:
             self._cache['instances'] = instances
         return instances
@@ -192,24 +305,71 @@ class EC2(object):
         - name_mapping: dict of key names and new key names they should be mapped to
           (default from INSTANCE_KEY_NAME_MAPPING variable)
         """
-        if filtered_data is None:
-            filtered_data = self.get_all_instances_filtered_data()
-        results = []
-        for instance in filtered_data:
-            data = ih.cast_keys(instance, **value_casting)
-            data = ih.rename_keys(data, **name_mapping)
-            data.update(dict(profile=self._profile))
-            results.append(data)
+        results = list(self.iter_instances_serialized_data(
+            filtered_data, value_casting, name_mapping
+        ))
         if cache:
             self._cache['instances'] = results
         return results
 
+    def iter_instance_records(self):
+        """Yield InstanceRecord objects built in one pass from full data
+
+        Records have the same fields as the dicts from
+        self.iter_instances_serialized_data (with default args), but are
+        read-only and use __slots__ instead of a dict per instance
+        """
+        for instance in self.iter_instances_full_data():
+            yield make_instance_record(
+                instance, profile=self._profile, region=self._region
+            )
+
+    def get_all_instance_records(self, cache=False):
+        """Get all instances as InstanceRecord objects
+
+        - cache: if True, cache results in self._cache['instance_records']
+        """
+        records = list(self.iter_instance_records())
+        if cache:
+            self._cache['instance_records'] = records
+        return records
+
+    def get_elastic_address_records(self):
+        """Get all elastic ip addresses as AddressRecord objects"""
+        return [
+            make_address_record(address, profile=self._profile, region=self._region)
+            for address in self.get_elastic_addresses_full_data()
+        ]
+
+    def find_instances(self, terms, instances=None, fields=INSTANCE_FIND_FIELDS,
+                       exact=False):
+        """Return instances where any of the fields matches any of the terms
+
+        - terms: list of terms or string of terms separated by any of , ; |
+        - instances: list of instance dicts (default is running instances from
+          self.get_all_instances_serialized_data())
+        - fields: names of the fields to match terms against (default from
+          INSTANCE_FIND_FIELDS variable)
+        - exact: if True, only match field values equal to a term (ignoring
+          case) instead of either one containing the other
+
+        Each instance is returned once, in its original order. See
+        index.SubstringIndex
+        """
+        if instances is None:
+            instances = [
+                instance
+                for instance in self.get_all_instances_serialized_data()
+                if instance['status'] == 'running'
+            ]
+        return SubstringIndex(instances, fields).find(terms, exact)
+
     def get_elastic_addresses_full_data(self, cache=False):
         """Get all elastic ip addresses with full data
 
         - cache: if True, cache results in self._cache['addresses']
         """
-        addresses = self.client_call('describe_addresses', 'Addresses')
+        addresses = self.paginated_client_call('describe_addresses', 'Addresses')
         if cache:
             self._cache['addresses'] = addresses
         return addresses
@@ -223,8 +383,9 @@ class EC2(object):
             - key name format: simple
             - key name format: some.nested.key
         """
+        transform = compile_transform(filter_keys)
         addresses = [
-            ih.filter_keys(address, filter_keys)
+            transform(address)
             for address in self.get_elastic_addresses_full_data()
         ]
         if cache:
@@ -236,7 +397,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['azs']
         """
-        azs = self.client_call('describe_availability_zones', 'AvailabilityZones')
+        azs = self.paginated_client_call('describe_availability_zones', 'AvailabilityZones')
         if cache:
             self._cache['azs'] = azs
         return azs
@@ -246,7 +407,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['customer_gateways']
         """
-        gateways = self.client_call('describe_customer_gateways', 'CustomerGateways')
+        gateways = self.paginated_client_call('describe_customer_gateways', 'CustomerGateways')
         if cache:
             self._cache['customer_gateways'] = gateways
         return gateways
@@ -256,7 +417,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['internet_gateways']
         """
-        gateways = self.client_call('describe_internet_gateways', 'InternetGateways')
+        gateways = self.paginated_client_call('describe_internet_gateways', 'InternetGateways')
         if cache:
             self._cache['internet_gateways'] = gateways
         return gateways
@@ -266,7 +427,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['keypairs']
         """
-        keypairs = self.client_call('describe_key_pairs', 'KeyPairs')
+        keypairs = self.paginated_client_call('describe_key_pairs', 'KeyPairs')
         if cache:
             self._cache['keypairs'] = keypairs
         return keypairs
@@ -276,7 +437,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['nat_gateways']
         """
-        gateways = self.client_call('describe_nat_gateways', 'NatGateways')
+        gateways = self.paginated_client_call('describe_nat_gateways', 'NatGateways')
         if cache:
             self._cache['nat_gateways'] = gateways
         return gateways
@@ -286,7 +447,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['network_acls']
         """
-        network_acls = self.client_call('describe_network_acls', 'NetworkAcls')
+        network_acls = self.paginated_client_call('describe_network_acls', 'NetworkAcls')
         if cache:
             self._cache['network_acls'] = network_acls
         return network_acls
@@ -296,7 +457,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['network_interfaces']
         """
-        network_interfaces = self.client_call('describe_network_interfaces', 'NetworkInterfaces')
+        network_interfaces = self.paginated_client_call('describe_network_interfaces', 'NetworkInterfaces')
         if cache:
             self._cache['network_interfaces'] = network_interfaces
         return network_interfaces
@@ -306,17 +467,90 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['regions']
         """
-        regions = self.client_call('describe_regions', 'Regions')
+        regions = self.paginated_client_call('describe_regions', 'Regions')
         if cache:
             self._cache['regions'] = regions
         return regions
 
+    def get_enabled_region_names(self):
+        """Return a list of names of the regions enabled for the account"""
+        return sorted([
+            region['RegionName']
+            for region in self.get_all_regions_full_data()
+        ])
+
+    def get_region_names(self, regions=ah.EC2_REGIONS):
+        """Return a list of region names to use for multi-region methods
+
+        - regions: list or comma-separated string of region names (default from
+          EC2_REGIONS setting)
+            - if empty, only the region of self._client is used
+            - if 'all', every region enabled for the account is used
+        """
+        if type(regions) == str:
+            regions = ih.string_to_list(regions)
+        if not regions:
+            return [self._region]
+        if 'all' in regions:
+            return self.get_enabled_region_names()
+        return list(regions)
+
+    def _iter_for_regions(self, method_name, regions=ah.EC2_REGIONS,
+                          max_workers=ah.MAX_WORKERS):
+        """Call a method on an EC2 instance per region in parallel and yield items
+
+        - method_name: name of a method returning an iterable of items
+        - regions: see self.get_region_names (default from EC2_REGIONS setting)
+        - max_workers: max number of regions to fetch at once (default from
+          MAX_WORKERS setting)
+
+        Items are yielded as each region finishes; an error in any region is
+        raised so callers never mistake a failed region for an empty one
+        """
+        def _fetch(region):
+            ec2 = self if region == self._region else EC2(self._profile, region, snapshots=self._snapshots)
+            return list(getattr(ec2, method_name)())
+
+        for region, items, exc in ah.concurrent_map(
+            _fetch, self.get_region_names(regions), max_workers=max_workers
+        ):
+            if exc is not None:
+                raise exc
+            for item in items:
+                yield item
+
+    def iter_instances_for_regions(self, regions=ah.EC2_REGIONS,
+                                   max_workers=ah.MAX_WORKERS):
+        """Yield serialized instance data (tagged with region) from many regions
+
+        - regions: see self.get_region_names (default from EC2_REGIONS setting)
+        - max_workers: max number of regions to fetch at once (default from
+          MAX_WORKERS setting)
+        """
+        return self._iter_for_regions(
+            'iter_instances_serialized_data', regions, max_workers
+        )
+
+    def get_all_instances_for_regions(self, cache=False, regions=ah.EC2_REGIONS,
+                                      max_workers=ah.MAX_WORKERS):
+        """Get serialized instance data (tagged with region) from many regions
+
+        - cache: if True, cache results in self._cache['instances']
+        - regions: see self.get_region_names (default from EC2_REGIONS setting)
+        - max_workers: max number of regions to fetch at once (default from
+          MAX_WORKERS setting)
+        """
+        instances = list(self.iter_instances_for_regions(regions, max_workers))
+        if cache:
+            self._cache['instances'] = instances
+        return instances
+
     def get_all_route_tables_full_data(self, cache=False):
         """Get all route tables with full data
 
         - cache: if True, cache results in self._cache['route_tables']
         """
-        route_tables = self.client_call('describe_route_tables', 'RouteTables')
+        route_tables = self.paginated_client_call('describe_route_tables', 'RouteTables')
         if cache:
             self._cache['route_tables'] = route_tables
         return route_tables
@@ -326,7 +560,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['security_groups']
         """
-        security_groups = self.client_call('describe_security_groups', 'SecurityGroups')
+        security_groups = self.paginated_client_call('describe_security_groups', 'SecurityGroups')
         if cache:
             self._cache['security_groups'] = security_groups
         return security_groups
@@ -336,7 +570,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['subnets']
         """
-        subnets = self.client_call('describe_subnets', 'Subnets')
+        subnets = self.paginated_client_call('describe_subnets', 'Subnets')
         if cache:
             self._cache['subnets'] = subnets
         return subnets
@@ -346,7 +580,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['tags']
         """
-        tags = self.client_call('describe_tags', 'Tags')
+        tags = self.paginated_client_call('describe_tags', 'Tags')
         if cache:
             self._cache['tags'] = tags
         return tags
@@ -356,7 +590,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['volume_statuses']
         """
-        volume_statuses = self.client_call('describe_volume_status', 'VolumeStatuses')
+        volume_statuses = self.paginated_client_call('describe_volume_status', 'VolumeStatuses')
         if cache:
             self._cache['volume_statuses'] = volume_statuses
         return volume_statuses
@@ -366,7 +600,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['volumes']
         """
-        volumes = self.client_call('describe_volumes', 'Volumes')
+        volumes = self.paginated_client_call('describe_volumes', 'Volumes')
         if cache:
             self._cache['volumes'] = volumes
         return volumes
@@ -376,7 +610,7 @@ class EC2(object):
 
         - cache: if True, cache results in self._cache['vpcs']
         """
-        vpcs = self.client_call('describe_vpcs', 'Vpcs')
+        vpcs = self.paginated_client_call('describe_vpcs', 'Vpcs')
         if cache:
             self._cache['vpcs'] = vpcs
         return vpcs
@@ -408,93 +642,111 @@ class EC2(object):
             self._cache['instance_strings'] = strings
         print('\n'.join(strings))
 
+    def save_ssh_users(self, users):
+        """Save the SSH user of many instances to the rh.Collection in one batch
+
+        - users: dict of instance ids and SSH users (empty users are skipped)
 
-    def update_collection(self):
-        """Update the rh.Collection object if redis-helper installed"""
+        Return list of update ids
+        """
+        if self._collection is None:
+            return []
+
+        users = {instance_id: user for instance_id, user in users.items() if user}
+        with ah.COLLECTION_LOCK:
+            hash_ids = ah.get_hash_ids_for_unique_values(self._collection, sorted(users))
+            result = ah.write_collection_changes(
+                self._collection,
+                updates=[
+                    (hash_id, dict(sshuser=users[instance_id]))
+                    for instance_id, hash_id in sorted(hash_ids.items())
+                ]
+            )
+        return result['updates']
+
+    def update_collection(self, regions=ah.EC2_REGIONS, max_workers=ah.MAX_WORKERS):
+        """Update the rh.Collection object if redis-helper installed
+
+        - regions: see self.get_region_names (default from EC2_REGIONS setting)
+        - max_workers: max number of regions to fetch at once (default from
+          MAX_WORKERS setting)
+
+        The id, region, and fingerprint ('fp' field, see ah.fingerprint) of
+        existing records for the profile are fetched once and compared to the
+        current instances in memory, so only new, changed, or removed records
+        are written, all in one transaction (see ah.write_collection_changes).
+        Only instances stored for the profile in the given regions are removed
+        when they are no longer returned, and AWS_IP entries of those instances
+        are synced with ip_index.sync_ip_entries
+        """
         if self._collection is None:
             return
 
-        ids_for_profile = set([
-            x.get(self._collection._unique_field)
-            for x in self._collection.find(
-                'profile:{}'.format(self._profile),
-                include_meta=False,
-                get_fields=self._collection._unique_field,
-                limit=self._collection.size
+        regions = self.get_region_names(regions)
+        unique_field = self._collection._unique_field
+        existing = {
+            x[unique_field]: x
+            for x in ah.read_collection_records(
+                self._collection, 'profile', self._profile,
+                [unique_field, 'region', 'fp']
             )
-        ])
+            if (x.get('region') or self._region) in regions
+        }
+
+        to_add = []
+        to_update = []
         ids = set()
-        updates = []
-        deletes = []
-        ip_hash_ids_to_delete = []
-
-        for instance in self.get_all_instances_filtered_data():
-            data = ih.cast_keys(instance, **INSTANCE_KEY_VALUE_CASTING)
-            data = ih.rename_keys(data, **INSTANCE_KEY_NAME_MAPPING)
-            data.update(dict(profile=self._profile))
-            old_data = self._collection[data['id']]
-            ids.add(data['id'])
-            if not old_data:
-                updates.append(self._collection.add(**data))
-                if data['ip']:
-                  updates.append(ah.AWS_IP.add(
-                      ip=data['ip'],
-                      instance=data['id'],
-                      source='ec2',
-                      profile=self._profile
-                  ))
-            else:
-                hash_id = old_data['_id']
-                try:
-                    instance_id = data.pop(self._collection._unique_field)
-                except KeyError:
-                    pass
-                updates.extend(self._collection.update(hash_id, **data))
-                if data['ip'] != old_data['ip']:
-                    ip_hash_ids_to_delete.extend(ah.AWS_IP.find(
-                        'ip:{}, instance:{}'.format(old_data['ip'], old_data['id']),
-                        item_format='{_id}'
-                    ))
-                if data['ip']:
-                    existing = ah.AWS_IP.find(
-                        'ip:{}, instance:{}'.format(data['ip'], instance_id),
-                        include_meta=False
-                    )
-                    if not existing:
-                        updates.append(ah.AWS_IP.add(
-                            ip=data['ip'],
-                            instance=instance_id,
-                            source='ec2',
-                            profile=self._profile
-                        ))
-
-        for instance_id in ids_for_profile - ids:
-            hash_id = self._collection.get_hash_id_for_unique_value(instance_id)
-            if hash_id is not None:
-                old_data = self._collection.get(hash_id, 'id, ip')
-                ip_hash_ids_to_delete.extend(ah.AWS_IP.find(
-                    'ip:{}, instance:{}'.format(old_data['ip'], old_data['id']),
-                    item_format='{_id}'
-                ))
-                self._collection.delete(hash_id)
-                deletes.append(hash_id)
-
-        if ip_hash_ids_to_delete:
-            ah.AWS_IP.delete_many(*ip_hash_ids_to_delete)
-            deletes.extend(ip_hash_ids_to_delete)
-
-        for address in self.get_elastic_addresses_filtered_data():
-            data = ih.rename_keys(address, **ADDRESS_KEY_NAME_MAPPING)
-            existing = ah.AWS_IP.find(
-                'ip:{}, source:eip'.format(data['ip']),
-                include_meta=False
+        ip_entries = set()
+        for data in self.iter_instances_for_regions(regions, max_workers):
+            data['fp'] = ah.fingerprint(data)
+            instance_id = data[unique_field]
+            ids.add(instance_id)
+            ip_entries.update(iter_instance_ip_entries([data], self._profile))
+            old_data = existing.get(instance_id)
+            if old_data is None:
+                to_add.append(data)
+                continue
+            if data['fp'] != old_data.get('fp'):
+                changed = data.copy()
+                changed.pop(unique_field)
+                to_update.append((old_data['_id'], changed))
+
+        stale_ids = set(existing) - ids
+        addresses = [
+            ih.rename_keys(address, **ADDRESS_KEY_NAME_MAPPING)
+            for address in self._iter_for_regions(
+                'get_elastic_addresses_filtered_data', regions, max_workers
             )
-            if not existing and data['instance']:
-                updates.append(ah.AWS_IP.add(
-                    ip=data['ip'],
-                    instance=data['instance'],
-                    source='eip',
-                    profile=self._profile
-                ))
+        ]
 
+        with ah.COLLECTION_LOCK:
+            # Instances stored under another profile/region are taken over
+            taken = ah.get_hash_ids_for_unique_values(
+                self._collection, [data[unique_field] for data in to_add]
+            )
+            for data in to_add:
+                hash_id = taken.get(data[unique_field])
+                if hash_id is not None:
+                    changed = data.copy()
+                    changed.pop(unique_field)
+                    to_update.append((hash_id, changed))
+            result = ah.write_collection_changes(
+                self._collection,
+                adds=[data for data in to_add if data[unique_field] not in taken],
+                updates=to_update,
+                deletes=[existing[instance_id]['_id'] for instance_id in sorted(stale_ids)]
+            )
+        updates = result['updates']
+        deletes = result['deletes']
+
+        # AWS_IP entries ('ec2' and 'eip') of instances in scope are diffed
+        # against the current ones and written in one batch
+        ip_result = sync_ip_entries(
+            ip_entries | set(iter_address_ip_entries(addresses, self._profile)),
+            self._profile,
+            sources=('ec2', 'eip'),
+            in_scope=lambda entry: entry.instance in ids or entry.instance in stale_ids
+        )
+        updates.extend(ip_result['updates'])
+        deletes.extend(ip_result['deletes'])
         return {'updates': updates, 'deletes': deletes}
@@ -0,0 +1,112 @@
+import input_helper as ih
+from aws_info_helper.transform import compile_getter
+
+
+_sloppy_equal = ih.FIND_OPERATORS['$']
+_NOT_STRINGS = {'true', 'false', 'none', 'inf', 'infinity', 'nan'}
+
+
+def _from_string(value):
+    """Return ih.from_string(value), skipping the float/int attempts for
+    strings that can't be converted (i.e. names, ids, and ip addresses)
+    """
+    if type(value) == str and value:
+        if value.count('.') > 1:
+            return value
+        first = value[0]
+        if not (first.isdecimal() or first.isspace() or first in '+-.'):
+            if value.lower() not in _NOT_STRINGS:
+                return value
+    return ih.from_string(value)
+
+
+class SubstringIndex(object):
+    def __init__(self, items, fields='name, id, ip, ip_private'):
+        """In-memory index of dicts for sloppy (case-insensitive, two-way
+        substring) matching on a few fields
+
+        - items: list of dicts (i.e. serialized instance data)
+        - fields: names of the fields to match terms against (nested.key.name
+          supported)
+
+        Field values are normalized once and the positions of the items that
+        have them are kept in a dict, so exact matches are a single lookup and
+        substring matches scan each distinct value once (not every item for
+        every field). Values that are not strings after ih.from_string (i.e.
+        None, numbers, lists of tags) are checked with the same '$' operator
+        ih.find_items uses
+        """
+        self._items = list(items)
+        self._fields = ih.get_list_from_arg_strings(fields)
+        self._exact = None
+        values = {}
+        self._other = []
+        for field in self._fields:
+            get = compile_getter(field)
+            for pos, item in enumerate(self._items):
+                value = _from_string(get(item))
+                if type(value) == str:
+                    if value in values:
+                        values[value].append(pos)
+                    else:
+                        values[value] = [pos]
+                else:
+                    self._other.append((pos, value))
+        self._values = values
+        self._strings = [
+            (value, value.lower(), positions)
+            for value, positions in values.items()
+        ]
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def fields(self):
+        return self._fields
+
+    def _positions(self, term, exact=False):
+        """Return set of positions of items with a field matching term"""
+        term = ih.from_string(term)
+        if type(term) == str:
+            needle = term.lower()
+            use_lower = True
+        else:
+            # Same as the '$' operator: compare repr of a non-string term with
+            # the string values as they are
+            needle = repr(term).lower()
+            use_lower = False
+        if exact:
+            if use_lower:
+                if self._exact is None:
+                    self._exact = {}
+                    for _, lower, value_positions in self._strings:
+                        self._exact.setdefault(lower, []).extend(value_positions)
+                return set(self._exact.get(needle, ()))
+            return {pos for pos, value in self._other if value == term}
+
+        positions = set()
+        for value, lower, value_positions in self._strings:
+            value = lower if use_lower else value
+            if needle in value or value in needle:
+                positions.update(value_positions)
+        for pos, value in self._other:
+            if pos not in positions and _sloppy_equal(value, term):
+                positions.add(pos)
+        return positions
+
+    def find(self, terms, exact=False):
+        """Return list of items where any field matches any of the terms
+
+        - terms: list of terms or string of terms separated by any of , ; |
+        - exact: if True, only match field values equal to a term (ignoring
+          case) instead of either one containing the other
+
+        Matching (without exact) is the same as calling
+        ih.find_items(items, '<field>:$<term>') for every field and term, with
+        the results deduped. Items are returned in their original order
+        """
+        positions = set()
+        for term in ih.string_to_list(terms):
+            positions.update(self._positions(term, exact))
+        return [self._items[pos] for pos in sorted(positions)]
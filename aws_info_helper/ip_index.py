@@ -0,0 +1,324 @@
+import ipaddress
+import socket
+import struct
+import aws_info_helper as ah
+import input_helper as ih
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+
+IPEntry = namedtuple('IPEntry', 'ip, source, instance, name, profile')
+IP_SOURCES = ('ec2', 'eip', 'route53')
+_IP_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
+_unpack_ip = struct.Struct('!I').unpack
+
+
+def ip_to_int(ip):
+    """Return an IPv4 address string as an int (ValueError if it isn't one)"""
+    if ip.count('.') != 3:
+        raise ValueError('{} is not an IPv4 address'.format(repr(ip)))
+    try:
+        return _unpack_ip(socket.inet_aton(ip))[0]
+    except OSError:
+        raise ValueError('{} is not an IPv4 address'.format(repr(ip)))
+
+
+def network_range(network):
+    """Return (first, last) ip ints of an IPv4 network
+
+    - network: CIDR string (i.e. '10.20.0.0/16'), single ip, or
+      ipaddress.IPv4Network
+    """
+    if not isinstance(network, ipaddress.IPv4Network):
+        network = ipaddress.IPv4Network(network, strict=False)
+    return int(network.network_address), int(network.broadcast_address)
+
+
+def entry_from_record(record, profile=None):
+    """Return an IPEntry for a dict from AWS_IP (missing fields are None)"""
+    return IPEntry(
+        record['ip'],
+        record.get('source'),
+        record.get('instance') or None,
+        record.get('name') or None,
+        record.get('profile') or profile,
+    )
+
+
+def iter_instance_ip_entries(instances, profile='default'):
+    """Yield 'ec2' IPEntry tuples for serialized instances that have a public ip"""
+    for instance in instances:
+        if instance.get('ip'):
+            yield IPEntry(instance['ip'], 'ec2', instance['id'], None, profile)
+
+
+def iter_address_ip_entries(addresses, profile='default'):
+    """Yield 'eip' IPEntry tuples for elastic addresses (with keys renamed by
+    ec2.ADDRESS_KEY_NAME_MAPPING) that are associated with an instance
+    """
+    for address in addresses:
+        if address.get('instance') and address.get('ip'):
+            yield IPEntry(address['ip'], 'eip', address['instance'], None, profile)
+
+
+def iter_record_set_ip_entries(record_sets, profile='default'):
+    """Yield 'route53' IPEntry tuples for record set values that are ips"""
+    for data in record_sets:
+        values = data.get('value')
+        if type(values) != list:
+            values = [values]
+        for value in values:
+            if type(value) == str and ah.IP_RX.match(value):
+                yield IPEntry(value, 'route53', None, data['name'], profile)
+
+
+def gather_ip_entries(profile='default', regions=ah.EC2_REGIONS,
+                      max_workers=ah.MAX_WORKERS):
+    """Return (set of IPEntry tuples, set of instance ids) for a profile from
+    instances, elastic addresses, and Route53 record sets
+
+    - profile: name of AWS profile
+    - regions: see EC2.get_region_names (default from EC2_REGIONS setting)
+    - max_workers: max number of regions/zones to fetch at once (default from
+      MAX_WORKERS setting)
+    """
+    from aws_info_helper.ec2 import EC2, ADDRESS_KEY_NAME_MAPPING
+    from aws_info_helper.route53 import Route53
+    ec2 = EC2(profile)
+    instances = list(ec2.iter_instances_for_regions(regions, max_workers))
+    addresses = [
+        ih.rename_keys(address, **ADDRESS_KEY_NAME_MAPPING)
+        for address in ec2._iter_for_regions(
+            'get_elastic_addresses_filtered_data', regions, max_workers
+        )
+    ]
+    entries = set(iter_instance_ip_entries(instances, profile))
+    entries.update(iter_address_ip_entries(addresses, profile))
+    entries.update(iter_record_set_ip_entries(
+        Route53(profile).iter_record_sets_for_all_zones(max_workers), profile
+    ))
+    return entries, {instance['id'] for instance in instances}
+
+
+def get_existing_ip_entries(profile='default', sources=IP_SOURCES):
+    """Return dict of IPEntry tuples in AWS_IP for a profile and the list of
+    hash ids stored for each (more than one if there are duplicates)
+
+    The profile's entries are read in one pipeline (see
+    ah.read_collection_records) and filtered by sources
+    """
+    existing = {}
+    sources = set(sources)
+    for record in ah.read_collection_records(
+        ah.AWS_IP, 'profile', profile, ['ip', 'source', 'instance', 'name']
+    ):
+        if record['ip'] is None or record['source'] not in sources:
+            continue
+        existing.setdefault(
+            entry_from_record(record, profile), []
+        ).append(record['_id'])
+    return existing
+
+
+def sync_ip_entries(entries, profile='default', sources=IP_SOURCES, in_scope=None):
+    """Make the AWS_IP entries of a profile match entries, writing in bulk
+
+    - entries: iterable of IPEntry tuples that should exist
+    - profile: name of AWS profile
+    - sources: only existing entries with these sources are compared
+    - in_scope: single-var func that returns True if an existing IPEntry
+      (not in entries) should be deleted; if None, all of them are
+
+    Existing entries are read in one pipeline and set-diffed against entries,
+    then missing ones are added and stale or duplicate ones are deleted in one
+    transaction (see ah.write_collection_changes). Return a dict with
+    'updates' and 'deletes'
+    """
+    if ah.AWS_IP is None:
+        return {'updates': [], 'deletes': []}
+
+    entries = set(entries)
+    existing = get_existing_ip_entries(profile, sources)
+    to_add = sorted(entries - set(existing))
+    to_delete = [
+        hash_id
+        for entry, hash_ids in existing.items()
+        for hash_id in (
+            hash_ids[1:] if entry in entries
+            else hash_ids if in_scope is None or in_scope(entry)
+            else []
+        )
+    ]
+
+    adds = []
+    for entry in to_add:
+        data = dict(ip=entry.ip, source=entry.source, profile=entry.profile)
+        if entry.instance:
+            data['instance'] = entry.instance
+        if entry.name:
+            data['name'] = entry.name
+        adds.append(data)
+    with ah.COLLECTION_LOCK:
+        return ah.write_collection_changes(ah.AWS_IP, adds, [], to_delete)
+
+
+def rebuild_ip_index(profile='default', regions=ah.EC2_REGIONS,
+                     max_workers=ah.MAX_WORKERS):
+    """Rebuild the AWS_IP entries of a profile from every source in one pass
+
+    - profile: name of AWS profile
+    - regions: see EC2.get_region_names (default from EC2_REGIONS setting)
+    - max_workers: max number of regions/zones to fetch at once (default from
+      MAX_WORKERS setting)
+
+    'ec2' and 'eip' entries are only removed for instances found in the given
+    regions, or stored in AWS_EC2 for those regions (or not at all), so
+    rebuilding one region never drops entries of another. All stale
+    'route53' entries are removed. Return a dict with 'updates' and 'deletes'
+    """
+    if ah.AWS_IP is None:
+        return {'updates': [], 'deletes': []}
+
+    from aws_info_helper.ec2 import EC2
+    entries, instance_ids = gather_ip_entries(profile, regions, max_workers)
+    region_names = set(EC2(profile).get_region_names(regions))
+    stored_regions = {}
+    if ah.AWS_EC2 is not None:
+        stored_regions = {
+            x['id']: x.get('region')
+            for x in ah.read_collection_records(
+                ah.AWS_EC2, 'profile', profile, ['id', 'region']
+            )
+        }
+
+    def in_scope(entry):
+        if entry.source == 'route53':
+            return True
+        if entry.instance in instance_ids or entry.instance not in stored_regions:
+            return True
+        return stored_regions[entry.instance] in region_names
+
+    return sync_ip_entries(entries, profile, IP_SOURCES, in_scope)
+
+
+class IPCollection(object):
+    def __init__(self, profile_name='default'):
+        """Rebuilds the AWS_IP entries of a profile (see rebuild_ip_index), so
+        ah.update_collection_for_profiles can refresh AWS_IP on its own
+
+        - profile_name: name of AWS profile
+        """
+        self._profile = profile_name
+
+    def update_collection(self, regions=ah.EC2_REGIONS, max_workers=ah.MAX_WORKERS):
+        """Rebuild the AWS_IP entries of the profile and return a dict with
+        'updates' and 'deletes'
+        """
+        return rebuild_ip_index(self._profile, regions, max_workers)
+
+
+def lookup_ip(ip):
+    """Return list of IPEntry tuples in AWS_IP for an ip (any profile)
+
+    The ip field is indexed, so this is a single index lookup
+    """
+    if ah.AWS_IP is None:
+        return []
+    return [
+        entry_from_record(record)
+        for record in ah.AWS_IP.find(
+            'ip:{}'.format(ip),
+            get_fields='ip, source, instance, name, profile',
+            limit=None
+        )
+    ]
+
+
+class IPIndex(object):
+    def __init__(self, entries=()):
+        """In-memory dict of ips and the IPEntry tuples for each, for answering
+        "what is this ip" many times without a round trip per lookup
+
+        - entries: iterable of IPEntry tuples (i.e. from gather_ip_entries)
+
+        For network (CIDR) queries, the distinct ips are also kept as a sorted
+        array of ints (built on first use), so a query is two bisects and a
+        slice no matter how many ips are indexed
+        """
+        self._ips = {}
+        for entry in entries:
+            self._ips.setdefault(entry.ip, []).append(entry)
+        self._sorted = None
+
+    @classmethod
+    def from_collection(cls, profile=None):
+        """Return an IPIndex of every AWS_IP entry (for a profile, or all)"""
+        if ah.AWS_IP is None:
+            return cls()
+        return cls(
+            entry_from_record(record)
+            for record in ah.AWS_IP.find(
+                'profile:{}'.format(profile) if profile else '',
+                get_fields='ip, source, instance, name, profile',
+                limit=None
+            )
+        )
+
+    def __len__(self):
+        return len(self._ips)
+
+    def __contains__(self, ip):
+        return ip in self._ips
+
+    def _sorted_ips(self):
+        """Return (array of sorted ip ints, list of ip strings in the same order)"""
+        if self._sorted is None:
+            pairs = []
+            for ip in self._ips:
+                try:
+                    pairs.append((ip_to_int(ip), ip))
+                except ValueError:
+                    continue
+            pairs.sort()
+            self._sorted = (
+                array(_IP_TYPECODE, [pair[0] for pair in pairs]),
+                [pair[1] for pair in pairs]
+            )
+        return self._sorted
+
+    def lookup(self, ip):
+        """Return list of IPEntry tuples for an ip (empty if unknown)"""
+        return list(self._ips.get(ip, []))
+
+    def lookup_many(self, ips):
+        """Return dict of the ips that are known and their IPEntry tuples
+
+        - ips: iterable of ip strings (i.e. every address in a flow log)
+        """
+        found = self._ips
+        return {ip: list(found[ip]) for ip in ips if ip in found}
+
+    def find_in_network(self, network):
+        """Return list of IPEntry tuples for ips in a network, ordered by ip
+
+        - network: CIDR string (i.e. '10.20.0.0/16'), single ip, or
+          ipaddress.IPv4Network
+        """
+        first, last = network_range(network)
+        keys, ips = self._sorted_ips()
+        results = []
+        for ip in ips[bisect_left(keys, first):bisect_right(keys, last)]:
+            results.extend(self._ips[ip])
+        return results
+
+    def find_in_networks(self, networks):
+        """Return dict of networks and the list of IPEntry tuples in each
+
+        - networks: list of networks or string of networks separated by any
+          of , ; |
+        """
+        return {
+            network: self.find_in_network(network)
+            for network in ih.string_to_list(networks)
+        }
@@ -1,15 +1,36 @@
 import aws_info_helper as ah
 import input_helper as ih
 from functools import partial
+from aws_info_helper.cache import TTLCache
+from aws_info_helper.snapshot import snapshot_call
 
 
 class ParameterStore(object):
-    def __init__(self, profile_name='default'):
-        session = ah.get_session(profile_name)
-        self._client = session.client('ssm')
+    def __init__(self, profile_name='default', snapshots=False):
+        self._client = ah.get_client('ssm', profile_name)
         self._profile = profile_name
-        self._cache = {}
-        self.client_call = partial(ah.client_call, self._client)
+        self._cache = TTLCache(profile=profile_name, resource='ssm')
+        self._rate_limiter = ah.get_rate_limiter(
+            'ssm', profile_name, self._client.meta.region_name
+        )
+        self.client_call = partial(
+            ah.client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.iter_client_call = partial(
+            ah.iter_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.paginated_client_call = partial(
+            ah.paginated_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self._snapshots = snapshots
+        if snapshots:
+            self.iter_client_call = snapshot_call(
+                self.iter_client_call, profile_name, self._client.meta.region_name,
+                lazy=True
+            )
+            self.paginated_client_call = snapshot_call(
+                self.paginated_client_call, profile_name, self._client.meta.region_name
+            )
 
     def get_cached(self):
         return self._cache
@@ -27,11 +48,7 @@ class ParameterStore(object):
 
         - cache: if True, cache results in self._cache['parameters']
         """
-        resp = self.client_call('describe_parameters')
-        parameters = resp.get('Parameters', [])
-        while 'NextToken' in resp:
-            resp = self.client_call('describe_parameters', NextToken=resp['NextToken'])
-            parameters.extend(resp.get('Parameters', []))
+        parameters = self.paginated_client_call('describe_parameters', 'Parameters')
         if cache:
             self._cache['parameters'] = parameters
         return parameters
@@ -56,7 +73,10 @@ class ParameterStore(object):
 
     def get_value(self, parameter):
         """Return the value for a specific parameter"""
-        param = self.client_call('get_parameter', 'Parameter', Name=parameter, WithDecryption=True)
+        param = self.client_call(
+            'get_parameter', 'Parameter', Name=parameter, WithDecryption=True,
+            allowed_errors=('ParameterNotFound',)
+        )
         if param:
             return param['Value']
 
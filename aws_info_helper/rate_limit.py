@@ -0,0 +1,65 @@
+import threading
+import time
+
+
+class RateLimiter(object):
+    def __init__(self, rate, burst=None, min_rate=None):
+        """Adaptive token bucket allowing up to 'rate' calls per second
+
+        - rate: max number of calls allowed per second
+        - burst: max number of calls that can be made at once after being idle
+          (default is rate, at least 1)
+        - min_rate: the rate will never be lowered below this (default is 1/20
+          of rate)
+
+        Call throttled() when the server rejects a call for going too fast, and
+        succeeded() after each successful call. The current rate is halved on
+        throttling and recovers linearly back to the max rate on success
+        """
+        self._max_rate = float(rate)
+        self._min_rate = float(min_rate or self._max_rate / 20)
+        self._rate = self._max_rate
+        self._burst = float(burst or max(rate, 1))
+        self._tokens = self._burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def max_rate(self):
+        return self._max_rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def acquire(self):
+        """Block until a call is allowed; return number of seconds waited"""
+        waited = 0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+            waited += wait
+
+    def throttled(self):
+        """Cut the current rate in half (down to min_rate) and drop any burst"""
+        with self._lock:
+            self._refill()
+            self._rate = max(self._min_rate, self._rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def succeeded(self):
+        """Raise the current rate a step back toward max_rate"""
+        if self._rate < self._max_rate:
+            with self._lock:
+                self._refill()
+                self._rate = min(self._max_rate, self._rate + self._max_rate / 20)
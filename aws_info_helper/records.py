@@ -0,0 +1,145 @@
+import sys
+import input_helper as ih
+from aws_info_helper.transform import compile_steps
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+# Records are read-only, so fields are only set (while a record is being built)
+# through object.__setattr__
+_set_field = object.__setattr__
+
+
+class Record(Mapping):
+    """Read-only dict-like object that stores its fields in __slots__
+
+    Subclasses are made with record_class. A record can be used anywhere a
+    read-only dict is expected (record['name'], record.get('ip'), **record,
+    dict(record)) while using a fraction of the memory of a dict. Setting or
+    deleting a field after construction raises AttributeError
+    """
+    __slots__ = ()
+    _fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, *args, **kwargs):
+        for field, value in zip(self._fields, args):
+            _set_field(self, field, value)
+        for field in self._fields[len(args):]:
+            _set_field(self, field, kwargs.pop(field, None))
+        if kwargs:
+            raise TypeError('Unknown field(s) for {}: {}'.format(
+                self.__class__.__name__, ', '.join(sorted(kwargs))
+            ))
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return a record from a dict (keys that aren't fields are ignored)"""
+        get = data.get
+        return cls(*[get(field) for field in cls._fields])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is read-only'.format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError('{} is read-only'.format(self.__class__.__name__))
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, key):
+        return key in self._field_set
+
+    def __repr__(self):
+        return '{}({})'.format(
+            self.__class__.__name__,
+            ', '.join('{}={}'.format(f, repr(getattr(self, f))) for f in self._fields)
+        )
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def __setstate__(self, state):
+        for field, value in zip(self._fields, state):
+            _set_field(self, field, value)
+
+    def to_dict(self):
+        """Return a plain dict copy of the record"""
+        return {field: getattr(self, field) for field in self._fields}
+
+
+def record_class(name, fields, module=None):
+    """Return a new Record subclass
+
+    - name: name of the class
+    - fields: list of field names (or a string of names separated by one of
+      , ; |)
+    - module: name of the module the class is defined in, so records can be
+      pickled (default is the calling module)
+    """
+    fields = tuple(ih.get_list_from_arg_strings(fields))
+    return type(name, (Record,), {
+        '__slots__': fields,
+        '_fields': fields,
+        '_field_set': frozenset(fields),
+        '__module__': module or sys._getframe(1).f_globals.get('__name__', '__main__'),
+    })
+
+
+def field_names(filter_keys, name_mapping=None):
+    """Return list of the names keys will have after ih.filter_keys and
+    ih.rename_keys
+
+    - filter_keys: the keys that should be read from full data with nesting
+      allowed
+    - name_mapping: dict of key names and new key names they should be mapped to
+    """
+    name_mapping = name_mapping or {}
+    return [
+        name_mapping.get(key.replace('.', '__'), key.replace('.', '__'))
+        for key in ih.get_list_from_arg_strings(filter_keys)
+    ]
+
+
+def record_maker(cls, filter_keys, conditions=None, value_casting=None,
+                 name_mapping=None):
+    """Return a func that builds a cls record from a full data dict in one pass
+
+    - cls: a Record subclass from record_class
+    - filter_keys: the keys that should be read from full data with nesting
+      allowed (i.e. EC2_INSTANCE_KEYS setting)
+    - conditions: dict of key names and single-var funcs that return bool
+    - value_casting: dict of key names and single-var funcs that return casted
+      value for that key name
+    - name_mapping: dict of key names and the record field names they go in
+
+    Keys are the same as for ih.filter_keys, ih.cast_keys, and ih.rename_keys,
+    but the key spec is only parsed once (see transform.compile_steps) and no
+    intermediate dicts are made.
+    The returned func takes the full data dict and keyword args for any
+    record fields that don't come from full data (i.e. profile, region)
+    """
+    steps = compile_steps(filter_keys, conditions, value_casting, name_mapping)
+
+    def make(full_data, **extra):
+        record = cls(**extra)
+        for field, get, cast in steps:
+            value = get(full_data)
+            if cast is not None:
+                try:
+                    value = cast(value)
+                except Exception:
+                    pass
+            _set_field(record, field, value)
+        return record
+
+    return make
@@ -1,28 +1,32 @@
+import sys
 import aws_info_helper as ah
 import input_helper as ih
-import dt_helper as dh
 from functools import partial
-try:
-    ModuleNotFoundError
-except NameError:
-    class ModuleNotFoundError(ImportError):
-        pass
-
-try:
-    import redis_helper as rh
-    from redis import ConnectionError as RedisConnectionError
-except (ImportError, ModuleNotFoundError):
-    AWS_ROUTE53 = None
-else:
-    try:
-        AWS_ROUTE53 = rh.Collection(
-            'aws',
-            'route53',
-            index_fields='profile, domain, subdomain, type, external',
-            rx_external='(yes|no)',
-        )
-    except RedisConnectionError:
-        AWS_ROUTE53 = None
+from aws_info_helper.cache import TTLCache
+from aws_info_helper.ip_index import iter_record_set_ip_entries, sync_ip_entries
+from aws_info_helper.records import field_names, record_class
+from aws_info_helper.snapshot import snapshot_call
+from aws_info_helper.transform import compile_transform
+
+
+ah.register_collection(
+    'AWS_ROUTE53',
+    'aws',
+    'route53',
+    index_fields='profile, domain, subdomain, type, external',
+    rx_external='(yes|no)',
+)
+
+
+def __getattr__(name):
+    """Create the redis-helper collection(s) on first access"""
+    if name == 'AWS_ROUTE53':
+        return ah.get_collection(name)
+    raise AttributeError('module {} has no attribute {}'.format(repr(__name__), repr(name)))
+
+
+if sys.version_info < (3, 7):  # no module-level __getattr__
+    AWS_ROUTE53 = ah.get_collection('AWS_ROUTE53')
 
 
 ZONE_KEY_VALUE_CASTING = {
@@ -46,15 +50,56 @@ RESOURCE_KEY_NAME_MAPPING = {
     'AliasTarget__DNSName': 'alias',
 }
 
+serialize_zone = compile_transform(
+    None,
+    value_casting=ZONE_KEY_VALUE_CASTING,
+    name_mapping=ZONE_KEY_NAME_MAPPING
+)
+
+serialize_record_set = compile_transform(
+    ah.ROUTE53_RESOURCE_KEYS,
+    value_casting=RESOURCE_KEY_VALUE_CASTING,
+    name_mapping=RESOURCE_KEY_NAME_MAPPING
+)
+
+RecordSetRecord = record_class(
+    'RecordSetRecord',
+    field_names(ah.ROUTE53_RESOURCE_KEYS, RESOURCE_KEY_NAME_MAPPING) +
+    field_names(ah.ROUTE53_ZONE_KEYS, ZONE_KEY_NAME_MAPPING) +
+    ['external', 'name', 'profile']
+)
+
 
 class Route53(object):
-    def __init__(self, profile_name='default'):
-        session = ah.get_session(profile_name)
-        self._client = session.client('route53')
+    def __init__(self, profile_name='default', snapshots=False):
+        self._client = ah.get_client('route53', profile_name)
         self._profile = profile_name
-        self._cache = {}
-        self._collection = AWS_ROUTE53
-        self.client_call = partial(ah.client_call, self._client)
+        self._cache = TTLCache(profile=profile_name, resource='route53')
+        self._rate_limiter = ah.get_rate_limiter(
+            'route53', profile_name, self._client.meta.region_name
+        )
+        self.client_call = partial(
+            ah.client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.iter_client_call = partial(
+            ah.iter_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.paginated_client_call = partial(
+            ah.paginated_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self._snapshots = snapshots
+        if snapshots:
+            self.iter_client_call = snapshot_call(
+                self.iter_client_call, profile_name, self._client.meta.region_name,
+                lazy=True
+            )
+            self.paginated_client_call = snapshot_call(
+                self.paginated_client_call, profile_name, self._client.meta.region_name
+            )
+
+    @property
+    def _collection(self):
+        return ah.get_collection('AWS_ROUTE53')
 
     def get_cached(self):
         return self._cache
@@ -67,6 +112,10 @@ class Route53(object):
     def cached_record_sets(self):
         return self._cache.get('record_sets', [])
 
+    @property
+    def cached_record_set_records(self):
+        return self._cache.get('record_set_records', [])
+
     @property
     def cached_resource_strings(self):
         return self._cache.get('resource_strings', [])
@@ -76,7 +125,7 @@ class Route53(object):
 
         - cache: if True, cache results in self._cache['zones']
         """
-        zones = self.client_call('list_hosted_zones', 'HostedZones')
+        zones = self.paginated_client_call('list_hosted_zones', 'HostedZones')
         if cache:
             self._cache['zones'] = zones
         return zones
@@ -86,9 +135,10 @@ class Route53(object):
 
         - cache: if True, cache results in self._cache['zones']
         """
+        transform = compile_transform(filter_keys)
         zones = [
-            ih.filter_keys(zone, filter_keys)
-            for zone in self.client_call('list_hosted_zones', 'HostedZones')
+            transform(zone)
+            for zone in self.get_all_hosted_zones_full_data()
         ]
         if cache:
             self._cache['zones'] = zones
@@ -99,7 +149,7 @@ class Route53(object):
 
         - zone: the hosted zone id
         """
-        return self.client_call(
+        return self.paginated_client_call(
             'list_resource_record_sets',
             'ResourceRecordSets',
             HostedZoneId=zone
@@ -115,44 +165,104 @@ class Route53(object):
         - types: string containing allowed record types ('A, CNAME' by default)
         """
         types = ih.string_to_set(types)
+        transform = compile_transform(filter_keys)
         return [
-            ih.filter_keys(record, filter_keys)
+            transform(record)
             for record in self.get_record_sets_for_zone_full_data(zone)
             if record['Type'] in types
         ]
 
-    def get_all_record_sets_for_all_zones(self, cache=False):
-        """For each hosted zone, get the record sets and return list of dicts"""
+    def get_record_sets_for_zone_serialized_data(self, zone):
+        """Get record sets for zone with casted values, renamed keys, and zone info
+
+        - zone: a hosted zone dict from self.get_all_hosted_zones_filtered_data()
+        """
         results = []
-        for zone in self.get_all_hosted_zones_filtered_data():
-            zone_data = ih.cast_keys(zone, **ZONE_KEY_VALUE_CASTING)
-            zone_data = ih.rename_keys(zone_data, **ZONE_KEY_NAME_MAPPING)
-            for resource in self.get_record_sets_for_zone_filtered_data(zone_data['zone']):
-                resource_data = ih.cast_keys(resource, **RESOURCE_KEY_VALUE_CASTING)
-                resource_data = ih.rename_keys(resource_data, **RESOURCE_KEY_NAME_MAPPING)
-                resource_data.update(zone_data)
-                resource_data['subdomain'] = resource_data['subdomain'].replace(
-                    zone_data['domain'], ''
-                ).replace('\\052', '*').strip('.')
-                resource_data['external'] = 'no'
-                if resource_data['type'] == 'CNAME':
-                    if not resource_data['value'].endswith(zone_data['domain']):
-                        resource_data['external'] = 'yes'
-                elif resource_data['type'] == 'A':
-                    if resource_data['alias'] is not None:
-                        resource_data['external'] = 'yes'
-                if resource_data['subdomain']:
-                    resource_data['name'] = '{}.{}'.format(
-                        resource_data['subdomain'],
-                        resource_data['domain']
-                    )
-                else:
-                    resource_data['name'] = resource_data['domain']
-                results.append(resource_data)
+        types = {'A', 'CNAME'}
+        zone_data = serialize_zone(zone)
+        for record in self.get_record_sets_for_zone_full_data(zone_data['zone']):
+            if record['Type'] not in types:
+                continue
+            resource_data = serialize_record_set(record)
+            resource_data.update(zone_data)
+            resource_data['subdomain'] = resource_data['subdomain'].replace(
+                zone_data['domain'], ''
+            ).replace('\\052', '*').strip('.')
+            resource_data['external'] = 'no'
+            if resource_data['type'] == 'CNAME':
+                if not resource_data['value'].endswith(zone_data['domain']):
+                    resource_data['external'] = 'yes'
+            elif resource_data['type'] == 'A':
+                if resource_data['alias'] is not None:
+                    resource_data['external'] = 'yes'
+            if resource_data['subdomain']:
+                resource_data['name'] = '{}.{}'.format(
+                    resource_data['subdomain'],
+                    resource_data['domain']
+                )
+            else:
+                resource_data['name'] = resource_data['domain']
+            results.append(resource_data)
+        return results
+
+    def iter_record_sets_for_all_zones(self, max_workers=ah.MAX_WORKERS):
+        """Yield record set dicts for all hosted zones, fetching zones in parallel
+
+        - max_workers: max number of zones to fetch at once (default from
+          MAX_WORKERS setting)
+
+        Record sets are yielded as each zone finishes. All calls share the
+        profile's rate limiter (ROUTE53_REQUESTS_PER_SECOND setting) and
+        throttled calls are retried with backoff
+        """
+        for zone, results, exc in ah.concurrent_map(
+            self.get_record_sets_for_zone_serialized_data,
+            self.get_all_hosted_zones_filtered_data(),
+            max_workers=max_workers
+        ):
+            if exc is not None:
+                raise exc
+            for resource_data in results:
+                yield resource_data
+
+    def get_all_record_sets_for_all_zones(self, cache=False, max_workers=ah.MAX_WORKERS):
+        """For each hosted zone, get the record sets and return list of dicts
+
+        - cache: if True, cache results in self._cache['record_sets']
+        - max_workers: max number of zones to fetch at once (default from
+          MAX_WORKERS setting)
+        """
+        results = list(self.iter_record_sets_for_all_zones(max_workers))
         if cache:
             self._cache['record_sets'] = results
         return results
 
+    def iter_record_set_records(self, max_workers=ah.MAX_WORKERS):
+        """Yield RecordSetRecord objects for all hosted zones
+
+        - max_workers: max number of zones to fetch at once (default from
+          MAX_WORKERS setting)
+
+        Records have the same fields as the dicts from
+        self.iter_record_sets_for_all_zones (plus profile), but are read-only
+        and use __slots__ instead of a dict per record set
+        """
+        for data in self.iter_record_sets_for_all_zones(max_workers):
+            data['profile'] = self._profile
+            yield RecordSetRecord.from_dict(data)
+
+    def get_all_record_set_records(self, cache=False, max_workers=ah.MAX_WORKERS):
+        """Get record sets for all hosted zones as RecordSetRecord objects
+
+        - cache: if True, cache results in self._cache['record_set_records']
+        - max_workers: max number of zones to fetch at once (default from
+          MAX_WORKERS setting)
+        """
+        records = list(self.iter_record_set_records(max_workers))
+        if cache:
+            self._cache['record_set_records'] = records
+        return records
+
     def show_resource_info(self, item_format=ah.ROUTE53_RESOURCE_INFO_FORMAT,
                            force_refersh=False, cache=False):
         """
@@ -175,49 +285,78 @@ class Route53(object):
             self._cache['resource_strings'] = strings
         print('\n'.join(strings))
 
+    def _iter_collection_data(self):
+        """Yield dicts to store in the rh.Collection, one per record set value"""
+        for data in self.get_all_record_sets_for_all_zones():
+            value = data.get('value')
+            data.update(dict(profile=self._profile))
+            if type(value) == list:
+                for v in value:
+                    item = data.copy()
+                    item['value'] = v
+                    yield item
+            else:
+                yield data
 
     def update_collection(self):
-        """Update the rh.Collection object if redis-helper installed"""
+        """Update the rh.Collection object if redis-helper installed
+
+        The key fields and fingerprint ('fp' field, see ah.fingerprint) of
+        existing records for the profile are read in one pipeline (see
+        ah.read_collection_records) and compared to the current record sets by
+        (profile, zone, name, type, value), so only records that differ are
+        added, updated, or deleted. All of the writes
+        go through ah.write_collection_changes in one transaction, so readers
+        never see a partially updated collection
+        """
         if self._collection is None:
             return
 
-        updates = []
-        self._collection.clear_keyspace()
-        for data in self.get_all_record_sets_for_all_zones():
-            value = data.get('value')
-            data.update(dict(profile=self._profile))
-            try:
-                match = ah.IP_RX.match(value)
-            except TypeError:
-                if type(value) == list:
-                    matches = [ah.IP_RX.match(v) for v in value]
-                    assert len(matches) == len(value)
-                    ips = value
-                elif value is None:
-                    ips = []
-                else:
-                    raise
-            else:
-                if match:
-                    ips = [value]
-                else:
-                    ips = []
+        def _key(data):
+            return tuple([
+                str(data.get(field))
+                for field in ('profile', 'zone', 'name', 'type', 'value')
+            ])
 
-            if not ips:
-                updates.append(self._collection.add(**data))
-            else:
-                for ip in ips:
-                    data['value'] = ip
-                    existing = ah.AWS_IP.find(
-                        'ip:{}, name:{}'.format(ip, data['name']),
-                        include_meta=False
-                    )
-                    if not existing:
-                        updates.append(ah.AWS_IP.add(
-                            ip=ip,
-                            name=data['name'],
-                            source='route53',
-                            profile=self._profile
-                        ))
-                    updates.append(self._collection.add(**data))
-        return {'updates': updates}
+        existing = {}
+        for x in ah.read_collection_records(
+            self._collection, 'profile', self._profile,
+            ['profile', 'zone', 'name', 'type', 'value', 'fp']
+        ):
+            existing.setdefault(_key(x), []).append(x)
+
+        to_add = []
+        to_update = []
+        keys = set()
+        ip_entries = set()
+        for data in self._iter_collection_data():
+            key = _key(data)
+            if key in keys:
+                continue
+            keys.add(key)
+            data['fp'] = ah.fingerprint(data)
+            ip_entries.update(iter_record_set_ip_entries([data], self._profile))
+            old_data = existing.get(key)
+            if old_data is None:
+                to_add.append(data)
+                continue
+            if data['fp'] != old_data[0].get('fp'):
+                to_update.append((old_data[0]['_id'], data))
+
+        hash_ids_to_delete = [
+            x['_id']
+            for key, old_data in existing.items()
+            for x in (old_data if key not in keys else old_data[1:])
+        ]
+
+        with ah.COLLECTION_LOCK:
+            result = ah.write_collection_changes(
+                self._collection, to_add, to_update, hash_ids_to_delete
+            )
+        updates = result['updates']
+        deletes = result['deletes']
+
+        ip_result = sync_ip_entries(ip_entries, self._profile, sources=('route53',))
+        updates.extend(ip_result['updates'])
+        deletes.extend(ip_result['deletes'])
+        return {'updates': updates, 'deletes': deletes}
@@ -1,36 +1,44 @@
+import re
+import string
+import sys
+import time
 import aws_info_helper as ah
-import input_helper as ih
 import dt_helper as dh
 from functools import partial
-from os.path import isdir, dirname, basename, join
+from hashlib import md5
+from os.path import (
+    isdir, isfile, dirname, basename, join, getsize, commonprefix, abspath, normpath
+)
 from os import makedirs
-try:
-    ModuleNotFoundError
-except NameError:
-    class ModuleNotFoundError(ImportError):
-        pass
-
-try:
-    import redis_helper as rh
-    from redis import ConnectionError as RedisConnectionError
-except (ImportError, ModuleNotFoundError):
-    AWS_S3 = None
-    AWS_S3_LAST_FILE = None
-else:
-    try:
-        AWS_S3 = rh.Collection(
-            'aws',
-            's3',
-            index_fields='profile, bucket',
-        )
-        AWS_S3_LAST_FILE = rh.Collection(
-            'aws',
-            's3_last',
-            index_fields='profile, bucket, prefix',
-        )
-    except RedisConnectionError:
-        AWS_S3 = None
-        AWS_S3_LAST_FILE = None
+from aws_info_helper.cache import TTLCache
+from aws_info_helper.snapshot import snapshot_call
+from aws_info_helper.transform import compile_transform
+
+
+ah.register_collection(
+    'AWS_S3',
+    'aws',
+    's3',
+    index_fields='profile, bucket',
+)
+ah.register_collection(
+    'AWS_S3_LAST_FILE',
+    'aws',
+    's3_last',
+    index_fields='profile, bucket, prefix',
+)
+
+
+def __getattr__(name):
+    """Create the redis-helper collection(s) on first access"""
+    if name in ('AWS_S3', 'AWS_S3_LAST_FILE'):
+        return ah.get_collection(name)
+    raise AttributeError('module {} has no attribute {}'.format(repr(__name__), repr(name)))
+
+
+if sys.version_info < (3, 7):  # no module-level __getattr__
+    AWS_S3 = ah.get_collection('AWS_S3')
+    AWS_S3_LAST_FILE = ah.get_collection('AWS_S3_LAST_FILE')
 
 
 BUCKET_KEY_VALUE_CASTING = {
@@ -42,21 +50,207 @@ BUCKET_KEY_NAME_MAPPING = {
     'CreationDate': 'created'
 }
 
+serialize_bucket = compile_transform(
+    None,
+    value_casting=BUCKET_KEY_VALUE_CASTING,
+    name_mapping=BUCKET_KEY_NAME_MAPPING
+)
+
+
+_DIGITS_RX = re.compile(r'\d+')
+
+
+def _char_class(char):
+    """Return the characters a key could have instead of char at one position"""
+    for chars in (string.digits, string.ascii_lowercase, string.ascii_uppercase):
+        if char in chars:
+            return chars
+    return char
+
+
+def split_key_range(after, upto=None, keys=()):
+    """Split the keys k where after < k <= upto into lexical ranges
+
+    - after: key the range starts after (as in StartAfter)
+    - upto: last key the range can include (None for no end)
+    - keys: sorted keys listed up to 'after' (i.e. the last page of files)
+
+    Ranges are split at the shared prefix of keys plus each character (or
+    character class, like digits) that keys use right after it. If that gives
+    no boundaries past 'after', a shorter prefix is tried. Return a list of
+    (after, upto) tuples in order, covering every key of the range exactly once
+    """
+    keys = list(keys) + [after]
+    base = commonprefix([keys[0], keys[-1]])
+    shared = base
+    while True:
+        pos = len(base)
+        chars = set()
+        for key in keys:
+            if len(key) > pos:
+                chars.update(_char_class(key[pos]))
+        bounds = sorted(
+            base + char
+            for char in chars
+            if after < base + char and (upto is None or base + char < upto)
+        )
+        if bounds or not base:
+            break
+        base = base[:-1]
+    # Numbers earlier in the shared prefix (i.e. the 0 in data0/part3/) are
+    # likely numbered "directories" with siblings, so split on those too
+    for match in list(_DIGITS_RX.finditer(shared))[:-1]:
+        start = match.start()
+        for digit in string.digits:
+            bound = shared[:start] + digit
+            if after < bound and (upto is None or bound < upto):
+                bounds.append(bound)
+    bounds = sorted(set(bounds))
+    return list(zip([after] + bounds, bounds + [upto]))
+
+
+def get_transfer_config(multipart_chunksize=None, max_concurrency=None):
+    """Return a boto3 TransferConfig for download_file
+
+    - multipart_chunksize: size (in bytes) of each part of a multipart
+      transfer; files larger than this are downloaded in parts (default is
+      S3_MULTIPART_CHUNKSIZE from settings)
+    - max_concurrency: max number of threads transferring parts of a single
+      file (default is S3_MAX_CONCURRENCY from settings)
+    """
+    from boto3.s3.transfer import TransferConfig
+    chunksize = multipart_chunksize or ah.S3_MULTIPART_CHUNKSIZE
+    concurrency = max_concurrency or ah.S3_MAX_CONCURRENCY
+    return TransferConfig(
+        multipart_threshold=chunksize,
+        multipart_chunksize=chunksize,
+        max_concurrency=concurrency,
+        use_threads=concurrency > 1
+    )
+
+
+def _file_md5_etag(local_filename, chunksize=None):
+    """Return the ETag S3 would give local_filename if uploaded in chunksize
+    parts (or in one part if chunksize is None)
+    """
+    digests = []
+    with open(local_filename, 'rb') as fp:
+        while True:
+            data = fp.read(chunksize or -1)
+            if not data:
+                break
+            digests.append(md5(data).digest())
+            if not chunksize:
+                break
+    if not chunksize:
+        return (digests[0] if digests else md5().digest()).hex()
+    return '{}-{}'.format(md5(b''.join(digests)).hexdigest(), len(digests))
+
+
+def local_file_matches(local_filename, size=None, etag=None, multipart_chunksize=None):
+    """Return True if local_filename exists and matches an S3 object's size/ETag
+
+    - local_filename: path to local file
+    - size: size of the S3 object in bytes (skip check if None)
+    - etag: ETag of the S3 object (skip check if None)
+    - multipart_chunksize: part size to try first for multipart ETags (the
+      'S3_MULTIPART_CHUNKSIZE' setting, the 8MB default, and the smallest
+      whole-MB size giving the right number of parts are also tried)
+    """
+    if not isfile(local_filename):
+        return False
+    local_size = getsize(local_filename)
+    if size is not None and local_size != int(size):
+        return False
+    if not etag:
+        return True
+    etag = etag.strip('"')
+    if '-' not in etag:
+        return _file_md5_etag(local_filename) == etag
+    parts = int(etag.rsplit('-', 1)[1])
+    mb = 1024 * 1024
+    guess = -(-local_size // parts)
+    candidates = [
+        multipart_chunksize,
+        ah.S3_MULTIPART_CHUNKSIZE,
+        8 * mb,
+        -(-guess // mb) * mb,
+    ]
+    tried = set()
+    for chunksize in candidates:
+        if not chunksize or chunksize in tried:
+            continue
+        tried.add(chunksize)
+        if -(-local_size // chunksize) != parts:
+            continue
+        if _file_md5_etag(local_filename, chunksize) == etag:
+            return True
+    return False
+
+
+def _iter_download_items(files):
+    """Yield file names/dicts from the 'files' arg of S3.download_files"""
+    if callable(files):
+        while True:
+            batch = files()
+            if not batch:
+                return
+            for item in batch:
+                yield item
+    else:
+        for item in files:
+            if isinstance(item, list):
+                for sub_item in item:
+                    yield sub_item
+            else:
+                yield item
+
 
 class S3(object):
-    def __init__(self, profile_name='default'):
-        session = ah.get_session(profile_name)
-        self._client = session.client('s3')
+    def __init__(self, profile_name='default', snapshots=False):
+        self._client = ah.get_client('s3', profile_name)
         self._profile = profile_name
-        self._cache = {'_last_file':{}}
-        self._collection = AWS_S3
-        self._collection_last_file = AWS_S3_LAST_FILE
-        self.client_call = partial(ah.client_call, self._client)
+        self._cache = TTLCache(profile=profile_name, resource='s3')
+        self._last_files = TTLCache(
+            maxsize=ah.S3_LAST_FILE_CACHE_SIZE, ttl=0, profile=profile_name,
+            resource='s3_last_file'
+        )
+        self._rate_limiter = ah.get_rate_limiter(
+            's3', profile_name, self._client.meta.region_name
+        )
+        self.client_call = partial(
+            ah.client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.iter_client_call = partial(
+            ah.iter_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self.paginated_client_call = partial(
+            ah.paginated_client_call, self._client, rate_limiter=self._rate_limiter
+        )
+        self._snapshots = snapshots
+        if snapshots:
+            self.iter_client_call = snapshot_call(
+                self.iter_client_call, profile_name, self._client.meta.region_name,
+                lazy=True
+            )
+            self.paginated_client_call = snapshot_call(
+                self.paginated_client_call, profile_name, self._client.meta.region_name
+            )
+
+    @property
+    def _collection(self):
+        return ah.get_collection('AWS_S3')
+
+    @property
+    def _collection_last_file(self):
+        return ah.get_collection('AWS_S3_LAST_FILE')
 
     def get_cached(self, name=''):
         """Return entire cache or cache for a specific key name"""
         if name == '':
             return self._cache
+        elif name == '_last_file':
+            return self._last_files
         else:
             return self._cache.get(name, [])
 
@@ -74,14 +268,14 @@ class S3(object):
 
     @property
     def cached_last_files(self):
-        return self._cache.get('_last_file', {})
+        return self._last_files
 
     def get_all_buckets_full_data(self, cache=False):
         """Get all buckets with full data
 
         - cache: if True, cache results in self._cache['buckets']
         """
-        buckets = self.client_call('list_buckets', 'Buckets')
+        buckets = self.paginated_client_call('list_buckets', 'Buckets')
         if cache:
             self._cache['buckets'] = buckets
         return buckets
@@ -99,8 +293,115 @@ class S3(object):
             self._cache['bucket_names'] = bucket_names
         return bucket_names
 
+    def _list_shard(self, bucket, prefix, shard, limit=None):
+        """List a shard and return (files, child shards)
+
+        - bucket: name of S3 bucket
+        - prefix: only list files that start with this prefix
+        - shard: (after, upto) tuple from split_key_range
+        - limit: stop after this many files (None for no limit)
+
+        When a page of the shard is full, the rest of the shard is split into
+        child shards (see split_key_range) and returned for other workers to
+        list. Only a shard that can't be split is listed page by page
+        """
+        after, upto = shard
+        files = []
+        while True:
+            resp = self.client_call(
+                'list_objects_v2',
+                Bucket=bucket,
+                Prefix=prefix,
+                StartAfter=after
+            )
+            contents = resp.get('Contents', [])
+            page = [obj for obj in contents if upto is None or obj['Key'] <= upto]
+            files.extend(page)
+            if not resp.get('IsTruncated') or len(page) < len(contents) or not page:
+                return files, []
+            after = page[-1]['Key']
+            if limit and len(files) >= limit:
+                return files, [(after, upto)]
+            children = split_key_range(after, upto, [obj['Key'] for obj in page])
+            if len(children) > 1:
+                return files, children
+
+    def iter_bucket_files_sharded(self, bucket, prefix='', start_after='',
+                                  limit=None, workers=ah.MAX_WORKERS,
+                                  ordered=True):
+        """Yield files in a bucket, listing shards of the key space concurrently
+
+        - bucket: name of S3 bucket
+        - prefix: limit response to files that start with this prefix
+        - start_after: a specific file (key) to start listing after
+        - limit: if None, yield all files
+        - workers: max number of shards listed at once
+        - ordered: if True, yield files in the same (lexical) order as a
+          sequential listing; otherwise yield each shard as soon as it's done
+
+        The first page is listed on its own. If there is more, the rest of the
+        key space is split into lexical ranges (see split_key_range) that are
+        listed with StartAfter, and any range that fills a page is split again,
+        so flat buckets and single large prefixes are listed in parallel too.
+        At most 'workers' shards are listed at once (and with ordered, at most
+        4 * workers shards, or workers with a limit, are listed ahead of the
+        one being yielded), so stopping early (or hitting the limit) does not
+        list the rest of the bucket
+        """
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+        workers = workers or 1
+        ahead = workers if limit else 4 * workers
+        # Entries are [shard, future, expanded] lists in lexical order; the
+        # future is None until the shard is submitted, and expanded is True
+        # once the shard's children (if any) are in entries right after it
+        entries = [[(start_after, None), None, False]]
+        count = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                while entries:
+                    expanded = []
+                    for entry in entries:
+                        expanded.append(entry)
+                        if entry[1] is not None and not entry[2] and entry[1].done():
+                            entry[2] = True
+                            expanded.extend(
+                                [child, None, False] for child in entry[1].result()[1]
+                            )
+                    entries = expanded
+                    submitted = [entry for entry in entries if entry[1] is not None]
+                    running = [entry[1] for entry in submitted if not entry[2]]
+                    for entry in entries:
+                        if len(running) >= workers:
+                            break
+                        if ordered and len(submitted) >= ahead:
+                            break
+                        if entry[1] is None:
+                            entry[1] = executor.submit(
+                                self._list_shard, bucket, prefix, entry[0], limit
+                            )
+                            submitted.append(entry)
+                            running.append(entry[1])
+                    if ordered:
+                        done = entries[0] if entries[0][2] else None
+                    else:
+                        done = next((entry for entry in entries if entry[2]), None)
+                    if done is None:
+                        wait(running, return_when=FIRST_COMPLETED)
+                        continue
+                    entries.remove(done)
+                    for obj in done[1].result()[0]:
+                        yield obj
+                        count += 1
+                        if limit and count >= limit:
+                            return
+            finally:
+                for entry in entries:
+                    if entry[1] is not None:
+                        entry[1].cancel()
+
     def get_bucket_files_full_data(self, bucket, prefix='', start_after='',
-                                   limit=1500, start_after_last=False):
+                                   limit=1500, start_after_last=False,
+                                   workers=1, ordered=True):
         """List all the files in a bucket
 
         - bucket: name of S3 bucket
@@ -110,73 +411,130 @@ class S3(object):
         - start_after_last: if True and 'start_after' is empty string,
           automatically set 'start_after' to be the last file that was returned
           by get_bucket_files_full_data for the given bucket and prefix
+        - workers: if more than 1, list shards of the bucket concurrently with
+          iter_bucket_files_sharded
+        - ordered: if False (and workers is more than 1), files are returned in
+          the order their shards finish, so the "last file" saved for
+          start_after_last is only meaningful when ordered is True
         """
-        results = []
-        cached = self._cache['_last_file'].get((bucket, prefix))
-        if self._collection_last_file is not None:
-            found = self._collection_last_file.find(
-                'profile:{}, bucket:{}, prefix:{}'.format(self._profile, bucket, prefix),
-                get_fields='last'
-            )
-            if found:
-                found_id = found[0]['_id']
-                found_name = found[0]['last']
-            else:
-                found_id = None
-                found_name = None
-        else:
-            found_id = None
-            found_name = None
+        found_id, found_name = self._get_last_file_record(bucket, prefix)
         if start_after_last is True and start_after == '':
-            if cached:
-                start_after = cached
-            elif found_name:
-                start_after = found_name
-
-        func = partial(
-            self.client_call,
-            'list_objects_v2',
-            Bucket=bucket,
-            Prefix=prefix,
-            StartAfter=start_after
-        )
+            start_after = self._last_files.get((bucket, prefix)) or found_name or ''
 
-        if limit is not None and limit < 1000:
-            resp = func(MaxKeys=limit)
+        if workers and workers > 1:
+            results = list(self.iter_bucket_files_sharded(
+                bucket,
+                prefix=prefix,
+                start_after=start_after,
+                limit=limit,
+                workers=workers,
+                ordered=ordered
+            ))
         else:
-            resp = func()
-        results.extend(resp.get('Contents', []))
-
-        while 'NextContinuationToken' in resp:
-            token = resp['NextContinuationToken']
-            maxkeys = 1000
-            if limit:
-                current_len = len(results)
-                if current_len >= limit:
-                    break
-                maxkeys = limit - current_len
-                maxkeys = 1000 if maxkeys > 1000 else maxkeys
-            resp = func(ContinuationToken=token, MaxKeys=maxkeys)
-            results.extend(resp.get('Contents', []))
+            results = self.paginated_client_call(
+                'list_objects_v2',
+                'Contents',
+                max_items=limit,
+                Bucket=bucket,
+                Prefix=prefix,
+                StartAfter=start_after
+            )
         if results:
-            last_key = results[-1]['Key']
-            self._cache['_last_file'][(bucket, prefix)] = last_key
-            if self._collection_last_file is not None:
-                if found_id:
-                    self._collection_last_file.update(found_id, last=last_key)
-                else:
-                    self._collection_last_file.add(
-                        profile=self._profile, bucket=bucket, prefix=prefix, last=last_key
-                    )
+            self._save_last_file(bucket, prefix, results[-1]['Key'], found_id)
         return results
 
-    def download_file(self, bucket, filename, local_filename=''):
+    def iter_bucket_file_pages(self, bucket, prefix='', start_after='',
+                               start_after_last=False, page_size=1000,
+                               checkpoint_pages=ah.S3_CHECKPOINT_PAGES):
+        """Yield the files in a bucket one page (list of files) at a time
+
+        - bucket: name of S3 bucket
+        - prefix: limit response to files that start with this prefix
+        - start_after: a specific file (key) to start listing after
+        - start_after_last: if True and 'start_after' is empty string,
+          automatically set 'start_after' to be the last saved file for the
+          given bucket and prefix
+        - page_size: max number of files per page (up to 1000)
+        - checkpoint_pages: save the last file of the most recently consumed
+          page every this many pages (also saved when the listing ends or the
+          generator is closed)
+
+        A page only counts as consumed once the next page is requested, so if
+        the caller crashes while handling a page, resuming with start_after_last
+        starts with that page again. Only one page is held in memory at a time
+        """
+        found_id, found_name = self._get_last_file_record(bucket, prefix)
+        if start_after_last is True and start_after == '':
+            start_after = self._last_files.get((bucket, prefix)) or found_name or ''
+
+        last_key = None
+        saved_key = None
+        pages = 0
+        try:
+            for page in self.iter_client_call(
+                'list_objects_v2',
+                page_size=page_size,
+                Bucket=bucket,
+                Prefix=prefix,
+                StartAfter=start_after
+            ):
+                files = page.get('Contents', [])
+                if not files:
+                    continue
+                yield files
+                last_key = files[-1]['Key']
+                pages += 1
+                if checkpoint_pages and pages % checkpoint_pages == 0:
+                    found_id = self._save_last_file(bucket, prefix, last_key, found_id)
+                    saved_key = last_key
+        finally:
+            if last_key and last_key != saved_key:
+                self._save_last_file(bucket, prefix, last_key, found_id)
+
+    def _get_last_file_record(self, bucket, prefix):
+        """Return (_id, last) of the AWS_S3_LAST_FILE record for bucket/prefix
+
+        Both are None if there is no record (or no redis-helper)
+        """
+        if self._collection_last_file is None:
+            return None, None
+        found = self._collection_last_file.find(
+            'profile:{}, bucket:{}, prefix:{}'.format(self._profile, bucket, prefix),
+            get_fields='last'
+        )
+        if found:
+            return found[0]['_id'], found[0]['last']
+        return None, None
+
+    def _save_last_file(self, bucket, prefix, last_key, found_id=None):
+        """Save last_key as the last file for bucket/prefix and return the _id
+        of the AWS_S3_LAST_FILE record (if redis-helper installed)
+        """
+        self._last_files[(bucket, prefix)] = last_key
+        if self._collection_last_file is None:
+            return
+        if found_id:
+            self._collection_last_file.update(found_id, last=last_key)
+            return found_id
+        return self._collection_last_file.add(
+            profile=self._profile, bucket=bucket, prefix=prefix, last=last_key
+        )
+
+    def download_file(self, bucket, filename, local_filename='',
+                      multipart_chunksize=None, max_concurrency=None):
         """Download a file from S3
 
         - bucket: name of S3 bucket
         - filename: name of file (key) in S3 bucket
         - local_filename: local file name (including path) to save file as
             - if an existing directory is given, the file will be saved in there
+        - multipart_chunksize: size (in bytes) of each part for large files
+          (default is S3_MULTIPART_CHUNKSIZE from settings)
+        - max_concurrency: max number of threads downloading parts of the file
+          (default is S3_MAX_CONCURRENCY from settings)
+
+        The file is streamed to a temporary file next to local_filename and
+        renamed when complete
         """
         if not local_filename:
             local_filename = basename(filename)
@@ -186,15 +544,110 @@ class S3(object):
         if local_dir:
             if not isdir(local_dir):
                 makedirs(local_dir)
-        result = self.client_call(
+        self.client_call(
             'download_file',
             Bucket=bucket,
             Key=filename,
-            Filename=local_filename
+            Filename=local_filename,
+            Config=get_transfer_config(multipart_chunksize, max_concurrency)
         )
         return local_filename
 
-    def get_file_lister_for_bucket(self, bucket, prefix='', limit=1500):
+    def download_files(self, bucket, files, local_dir='', workers=ah.MAX_WORKERS,
+                       multipart_chunksize=None, max_concurrency=None,
+                       skip_matching=True, keep_paths=True):
+        """Download many files from S3 concurrently and return a summary dict
+
+        - bucket: name of S3 bucket
+        - files: list of file names (keys) or file dicts (from
+          get_bucket_files_full_data), an iterable of pages of file dicts (from
+          iter_bucket_file_pages), or a func that returns the next batch of
+          files when called (from get_file_lister_for_bucket)
+        - local_dir: local directory to save files in
+        - workers: max number of files downloaded at once
+        - multipart_chunksize: size (in bytes) of each part for large files
+          (default is S3_MULTIPART_CHUNKSIZE from settings)
+        - max_concurrency: max number of threads downloading parts of each
+          file (default is S3_MAX_CONCURRENCY from settings, lowered so that
+          workers * max_concurrency fits in MAX_POOL_CONNECTIONS)
+        - skip_matching: if True, don't download files whose local copy
+          already matches the size and ETag of the S3 object
+        - keep_paths: if True, save files at their full key path under
+          local_dir; otherwise only the base name of each key is used
+
+        Keys whose local path would not be under local_dir (i.e. '../x' or
+        '/etc/x') are not downloaded and go in 'errors'. Only 2 * workers files
+        are pulled from 'files' ahead of the downloads, so a lister or pages
+        are listed as downloads go instead of all up front.
+
+        The returned dict has keys 'downloaded' and 'skipped' (lists of local
+        file names), 'errors' (dict of key and exception), 'bytes',
+        'seconds', and 'bytes_per_second'
+        """
+        if not max_concurrency:
+            max_concurrency = min(
+                ah.S3_MAX_CONCURRENCY,
+                max(1, ah.MAX_POOL_CONNECTIONS // (workers or 1))
+            )
+        config = get_transfer_config(multipart_chunksize, max_concurrency)
+        root = join(abspath(local_dir), '')
+
+        def _download(item):
+            if isinstance(item, dict):
+                key, size, etag = item['Key'], item.get('Size'), item.get('ETag')
+            else:
+                key, size, etag = item, None, None
+            local_filename = normpath(join(local_dir, key if keep_paths else basename(key)))
+            if not abspath(local_filename).startswith(root):
+                raise ValueError('{} is not a file under {}'.format(repr(key), repr(root)))
+            if skip_matching and isfile(local_filename):
+                if size is None:
+                    # The local copy can only be checked against the object's
+                    # size and ETag, so if head_object fails it is downloaded
+                    try:
+                        head = self.client_call('head_object', Bucket=bucket, Key=key)
+                    except ah.ClientCallError:
+                        head = None
+                    if head:
+                        size, etag = head['ContentLength'], head['ETag']
+                if size is not None and local_file_matches(
+                    local_filename, size, etag, config.multipart_chunksize
+                ):
+                    return (local_filename, None)
+            local_dir_ = dirname(local_filename)
+            if local_dir_ and not isdir(local_dir_):
+                makedirs(local_dir_, exist_ok=True)
+            self.client_call(
+                'download_file',
+                Bucket=bucket,
+                Key=key,
+                Filename=local_filename,
+                Config=config
+            )
+            return (local_filename, getsize(local_filename))
+
+        summary = {'downloaded': [], 'skipped': [], 'errors': {}, 'bytes': 0}
+        start = time.time()
+        for item, result, exc in ah.concurrent_map(
+            _download, _iter_download_items(files), max_workers=workers,
+            max_pending=2 * (workers or 1)
+        ):
+            if exc is not None:
+                summary['errors'][item['Key'] if isinstance(item, dict) else item] = exc
+                continue
+            local_filename, nbytes = result
+            if nbytes is None:
+                summary['skipped'].append(local_filename)
+            else:
+                summary['downloaded'].append(local_filename)
+                summary['bytes'] += nbytes
+        summary['seconds'] = time.time() - start
+        summary['bytes_per_second'] = (
+            summary['bytes'] / summary['seconds'] if summary['seconds'] else 0
+        )
+        return summary
+
+    def get_file_lister_for_bucket(self, bucket, prefix='', limit=1500, workers=1):
         """Return a func that will list next limit files for a bucket at a prefix
 
         Wrapper to self.get_bucket_files_full_data
@@ -204,13 +657,13 @@ class S3(object):
             bucket,
             prefix=prefix,
             limit=limit,
-            start_after_last=True
+            start_after_last=True,
+            workers=workers
         )
 
     def clear_last_file_for_bucket_and_prefix(self, bucket, prefix=''):
         """Clear any 'last file' info for bucket/prefix combo"""
-        if (bucket, prefix) in self._cache['_last_file']:
-            del(self._cache['_last_file'][(bucket, prefix)])
+        self._last_files.pop((bucket, prefix), None)
 
         if self._collection_last_file is not None:
             found = self._collection_last_file.find(
@@ -221,9 +674,7 @@ class S3(object):
 
     def clear_last_files_for_bucket(self, bucket):
         """Clear any 'last file' info for bucket (across all prefixes)"""
-        # Technically, should try to iterate over keys in _cache['_last_file']
-        # and find the ones for that bucket only to delete... but meh
-        self._cache['_last_file'] = {}
+        self._last_files.invalidate_keys(lambda key: key[0] == bucket)
 
         if self._collection_last_file is not None:
             found_ids = self._collection_last_file.find(
@@ -235,19 +686,32 @@ class S3(object):
                 self._collection_last_file.delete_many(*found_ids)
 
     def update_collection(self):
-        """Update the rh.Collection object if redis-helper installed"""
+        """Update the rh.Collection object if redis-helper installed
+
+        The bucket names and fingerprints ('fp' field, see ah.fingerprint) of
+        existing records for the profile are read in one pipeline (see
+        ah.read_collection_records), so only new or changed buckets are written
+        """
         if self._collection is None:
             return
 
+        existing = {
+            str(x['bucket']): x
+            for x in ah.read_collection_records(
+                self._collection, 'profile', self._profile, ['bucket', 'fp']
+            )
+        }
         updates = []
         for bucket in self.get_all_buckets_full_data(cache=True):
-            data = ih.cast_keys(bucket, **BUCKET_KEY_VALUE_CASTING)
-            data = ih.rename_keys(data, **BUCKET_KEY_NAME_MAPPING)
-            data.update(dict(profile=self._profile))
-            found = self._collection.find(
-                'profile:{}, bucket:{}'.format(self._profile, data['bucket']),
-            )
-            if not found:
-                updates.append(self._collection.add(**data))
+            data = serialize_bucket(bucket)
+            data['profile'] = self._profile
+            data['fp'] = ah.fingerprint(data)
+            old_data = existing.get(data['bucket'])
+            if old_data is not None and old_data.get('fp') == data['fp']:
+                continue
+            with ah.COLLECTION_LOCK:
+                if old_data is None:
+                    updates.append(self._collection.add(**data))
+                else:
+                    updates.extend(self._collection.update(old_data['_id'], **data) or [])
         return {'updates': updates}
-
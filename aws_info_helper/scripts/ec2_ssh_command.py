@@ -1,8 +1,12 @@
+import sys
 import click
 import aws_info_helper as ah
 import bg_helper as bh
 import input_helper as ih
+from aws_info_helper import ssh
 from aws_info_helper.ec2 import INSTANCE_KEY_NAME_MAPPING
+from aws_info_helper.snapshot import snapshot_note
+from aws_info_helper.transform import compile_transform
 
 
 @click.command()
@@ -30,17 +34,33 @@ from aws_info_helper.ec2 import INSTANCE_KEY_NAME_MAPPING
     '--private-ip', '-P', 'private_ip', is_flag=True, default=False,
     help='SSH using private IP instead of public IP'
 )
+@click.option(
+    '--parallel', '-j', 'parallel', default=1, type=click.INT,
+    help='Number of instances to run the command on at once (output of each is shown when it finishes)'
+)
+@click.option(
+    '--prefix', '-x', 'prefix', is_flag=True, default=False,
+    help='With --parallel, start each output line with the instance instead of grouping it under a header'
+)
+@click.option(
+    '--fresh', '-F', 'fresh', is_flag=True, default=False,
+    help='Ignore local snapshots and fetch everything from AWS'
+)
 @click.option(
     '--profile', '-p', 'profile', default='default',
     help='Name of AWS profile to use'
 )
 def main(**kwargs):
     """For matching instances, issue a command on the instance via SSH"""
-    ec2 = ah.EC2(kwargs['profile'])
+    # Snapshots are only used when there is no redis collection to keep in sync
+    ec2 = ah.EC2(
+        kwargs['profile'],
+        snapshots=ah.AWS_EC2 is None and not kwargs['fresh']
+    )
     find = kwargs['find']
     command = kwargs['command']
     use_private_ip = kwargs['private_ip']
-    matched_instances = []
+    parallel = max(kwargs['parallel'] or 1, 1)
     local_pems = bh.tools.ssh_pem_files()
 
     if not command:
@@ -59,37 +79,27 @@ def main(**kwargs):
         ec2.update_collection()
         running_instances = ah.AWS_EC2.find(
             'status:running',
-            get_fields='name, status, pem, id, ip, ip_private, sshuser',
+            get_fields='name, status, pem, id, ip, ip_private, ami, sshuser',
             include_meta=False,
             limit=ah.AWS_EC2.size
         )
     else:
-        instances = ec2.get_all_instances_filtered_data()
+        transform = compile_transform(
+            'Tags__Value, State__Name, KeyName, InstanceId, ImageId, PublicIpAddress, PrivateIpAddress',
+            name_mapping=INSTANCE_KEY_NAME_MAPPING
+        )
         running_instances = [
-            ih.rename_keys(
-                ih.filter_keys(
-                    instance,
-                    'Tags__Value, State__Name, KeyName, InstanceId, PublicIpAddress, PrivateIpAddress'
-                ),
-                **INSTANCE_KEY_NAME_MAPPING
-            )
-            for instance in ih.find_items(instances, 'State__Name:running')
+            transform(instance)
+            for instance in ec2.iter_instances_filtered_data()
+            if instance['State__Name'] == 'running'
         ]
+        note = snapshot_note()
+        if note:
+            print(note, file=sys.stderr)
 
-    for term in ih.string_to_list(find):
-        for item in ih.find_items(running_instances, 'name:${}'.format(term)):
-            if item not in matched_instances:
-                matched_instances.append(item)
-        for item in ih.find_items(running_instances, 'id:${}'.format(term)):
-            if item not in matched_instances:
-                matched_instances.append(item)
-        for item in ih.find_items(running_instances, 'ip:${}'.format(term)):
-            if item not in matched_instances:
-                matched_instances.append(item)
-        for item in ih.find_items(running_instances, 'ip_private:${}'.format(term)):
-            if item not in matched_instances:
-                matched_instances.append(item)
-    if not find:
+    if find:
+        matched_instances = ec2.find_instances(find, running_instances)
+    else:
         matched_instances = running_instances
 
     ih.sort_by_keys(matched_instances, 'name, ip')
@@ -108,6 +118,7 @@ def main(**kwargs):
             wrap=False
         )
 
+    targets = []
     for instance in matched_instances:
         pem_name = instance['pem']
         ip = instance['ip'] if not use_private_ip else instance['ip_private']
@@ -117,29 +128,68 @@ def main(**kwargs):
         if not pem_file:
             print('Could not find {} pem in ~/.ssh for {}.'.format(repr(pem_name), repr(instance)))
             continue
+        targets.append(dict(
+            instance=instance, ip=ip, pem_file=pem_file, user=instance.get('sshuser')
+        ))
 
-        sshuser = instance.get('sshuser')
-        if not sshuser:
-            sshuser = bh.tools.ssh_determine_aws_user_for_server(ip, pem_file)
-        if not sshuser and not kwargs['quiet']:
+    # Find SSH users that aren't known yet (from the local cache, then
+    # concurrently) and save in one batch
+    user_cache = ssh.SSHUserCache()
+    for target in targets:
+        if target['user']:
+            user_cache.set(target['instance']['id'], target['instance'].get('ami'), target['user'])
+    users = ssh.determine_ssh_users(
+        {
+            t['instance']['id']: (t['ip'], t['pem_file'], t['instance'].get('ami'))
+            for t in targets if not t['user']
+        },
+        max_workers=parallel,
+        cache=user_cache
+    )
+    if users:
+        ec2.save_ssh_users(users)
+    for target in targets:
+        if not target['user']:
+            target['user'] = users.get(target['instance']['id'])
+        if not target['user'] and not kwargs['quiet']:
             print('--------------------------------------------------')
-            print('\nCould not determine SSH user for {}'.format(repr(instance)))
-            continue
-        else:
-            if ah.AWS_EC2:
-                hash_id = ah.AWS_EC2.get_hash_id_for_unique_value(instance['id'])
-                ah.AWS_EC2.update(hash_id, sshuser=sshuser)
+            print('\nCould not determine SSH user for {}'.format(repr(target['instance'])))
+    targets = [target for target in targets if target['user']]
+
+    if parallel > 1 and command:
+        statuses = []
+        for target, status, output in ssh.iter_ssh_results(
+            targets, command, max_workers=parallel, timeout=kwargs['timeout']
+        ):
+            instance = target['instance']
+            label = '{} ({}) at {}'.format(instance['id'], instance['name'], target['ip'])
+            statuses.append((label, status))
+            if status == 255:
+                # ssh itself failed, so don't trust the cached user next time
+                user_cache.forget(instance['id'])
+            if not kwargs['quiet']:
+                print(ssh.format_ssh_output(
+                    label, output, status, prefixed=kwargs['prefix']
+                ))
+        print('--------------------------------------------------')
+        print(ssh.summarize_exit_statuses(statuses))
+        user_cache.save()
+        if any(status != 0 for _, status in statuses):
+            sys.exit(1)
+        return
 
+    for target in targets:
+        instance = target['instance']
         if not kwargs['quiet']:
             print('--------------------------------------------------')
             print(
                 '\nInstance {} ({}) at {} with pem {} and user {}\n'.format(
-                    instance['id'], instance['name'], ip, pem_name, sshuser
+                    instance['id'], instance['name'], target['ip'],
+                    instance['pem'], target['user']
                 )
             )
 
-        bh.tools.ssh_to_server(ip, user=sshuser, pem_file=pem_file, command=command, timeout=kwargs['timeout'], verbose=not kwargs['quiet'])
-
+        bh.tools.ssh_to_server(target['ip'], user=target['user'], pem_file=target['pem_file'], command=command, timeout=kwargs['timeout'], verbose=not kwargs['quiet'])
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,7 @@
 import click
 import input_helper as ih
-from aws_info_helper import EC2, AWS_EC2, AWS_IP, get_profiles
+import aws_info_helper as ah
+from aws_info_helper import EC2, EC2_REGIONS, MAX_WORKERS, update_collection_for_profiles
 
 
 @click.command()
@@ -12,21 +13,32 @@ from aws_info_helper import EC2, AWS_EC2, AWS_IP, get_profiles
     '--all', '-a', 'all', is_flag=True, default=False,
     help='Update info from all profiles found in ~/.aws/credentials'
 )
+@click.option(
+    '--workers', '-w', 'workers', type=click.INT, default=MAX_WORKERS,
+    help='Number of profiles to update concurrently when using --all'
+)
+@click.option(
+    '--regions', '-r', 'regions', default='',
+    help="Comma-separated region names to update, or 'all' for every enabled region (default from EC2_REGIONS setting)"
+)
 @click.option(
     '--profile', '-p', 'profile', default='default',
     help='Name of AWS profile to use'
 )
 def main(**kwargs):
     """Update info in AWS_EC2 and AWS_IP redis-helper collections"""
+    regions = kwargs['regions'] or EC2_REGIONS
     if kwargs['all'] is True:
-        for profile in get_profiles():
-            ec2 = EC2(profile)
-            ec2.update_collection()
+        results = update_collection_for_profiles(
+            EC2, max_workers=kwargs['workers'], regions=regions
+        )
+        for profile, exc in sorted(results['errors'].items()):
+            print('Error updating profile {}: {}'.format(repr(profile), repr(exc)))
     else:
         ec2 = EC2(kwargs['profile'])
-        ec2.update_collection()
+        results = ec2.update_collection(regions=regions)
     if kwargs['non_interactive'] is not True:
-        ih.start_ipython(ec2=AWS_EC2, ip=AWS_IP)
+        ih.start_ipython(ec2=ah.AWS_EC2, ip=ah.AWS_IP, results=results)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,48 @@
+import click
+import input_helper as ih
+import aws_info_helper as ah
+from aws_info_helper import EC2_REGIONS, MAX_WORKERS, update_collection_for_profiles
+from aws_info_helper.ip_index import IPCollection, IPIndex
+
+
+@click.command()
+@click.option(
+    '--non-interactive', '-n', 'non_interactive', is_flag=True, default=False,
+    help='Do not start an ipython session at the end'
+)
+@click.option(
+    '--all', '-a', 'all', is_flag=True, default=False,
+    help='Update info from all profiles found in ~/.aws/credentials'
+)
+@click.option(
+    '--workers', '-w', 'workers', type=click.INT, default=MAX_WORKERS,
+    help='Number of profiles to update concurrently when using --all'
+)
+@click.option(
+    '--regions', '-r', 'regions', default='',
+    help="Comma-separated region names to update, or 'all' for every enabled region (default from EC2_REGIONS setting)"
+)
+@click.option(
+    '--profile', '-p', 'profile', default='default',
+    help='Name of AWS profile to use'
+)
+def main(**kwargs):
+    """Rebuild the AWS_IP redis-helper collection from instances, elastic ips,
+    and Route53 record sets (without updating AWS_EC2 or AWS_ROUTE53)
+    """
+    regions = kwargs['regions'] or EC2_REGIONS
+    if kwargs['all'] is True:
+        results = update_collection_for_profiles(
+            IPCollection, max_workers=kwargs['workers'], regions=regions
+        )
+        for profile, exc in sorted(results['errors'].items()):
+            print('Error updating profile {}: {}'.format(repr(profile), repr(exc)))
+    else:
+        results = IPCollection(kwargs['profile']).update_collection(regions=regions)
+    print('{} added, {} deleted'.format(len(results['updates']), len(results['deletes'])))
+    if kwargs['non_interactive'] is not True:
+        ih.start_ipython(ip=ah.AWS_IP, index=IPIndex.from_collection(), results=results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
+import sys
 import click
 import input_helper as ih
+import aws_info_helper as ah
 from aws_info_helper import Route53
+from aws_info_helper.snapshot import snapshot_note
 
 
 @click.command()
@@ -8,14 +11,25 @@ from aws_info_helper import Route53
     '--non-interactive', '-n', 'non_interactive', is_flag=True, default=False,
     help='Do not start an ipython session at the end'
 )
+@click.option(
+    '--fresh', '-F', 'fresh', is_flag=True, default=False,
+    help='Ignore local snapshots and fetch everything from AWS'
+)
 @click.option(
     '--profile', '-p', 'profile', default='default',
     help='Name of AWS profile to use'
 )
 def main(**kwargs):
     """Get info about Route53 resources"""
-    route53 = Route53(kwargs['profile'])
+    # Snapshots are only used when there is no redis collection to keep in sync
+    route53 = Route53(
+        kwargs['profile'],
+        snapshots=ah.AWS_ROUTE53 is None and not kwargs['fresh']
+    )
     route53.show_resource_info(cache=True)
+    note = snapshot_note()
+    if note:
+        print(note, file=sys.stderr)
     if kwargs['non_interactive'] is not True:
         ih.start_ipython(route53=route53)
 
@@ -1,6 +1,7 @@
 import click
 import input_helper as ih
-from aws_info_helper import Route53, AWS_ROUTE53, AWS_IP, get_profiles
+import aws_info_helper as ah
+from aws_info_helper import Route53, MAX_WORKERS, update_collection_for_profiles
 
 
 @click.command()
@@ -12,6 +13,10 @@ from aws_info_helper import Route53, AWS_ROUTE53, AWS_IP, get_profiles
     '--all', '-a', 'all', is_flag=True, default=False,
     help='Update info from all profiles found in ~/.aws/credentials'
 )
+@click.option(
+    '--workers', '-w', 'workers', type=click.INT, default=MAX_WORKERS,
+    help='Number of profiles to update concurrently when using --all'
+)
 @click.option(
     '--profile', '-p', 'profile', default='default',
     help='Name of AWS profile to use'
@@ -19,14 +24,14 @@ from aws_info_helper import Route53, AWS_ROUTE53, AWS_IP, get_profiles
 def main(**kwargs):
     """Update info in AWS_ROUTE53 and AWS_IP redis-helper collections"""
     if kwargs['all'] is True:
-        for profile in get_profiles():
-            route53 = Route53(profile)
-            route53.update_collection()
+        results = update_collection_for_profiles(Route53, max_workers=kwargs['workers'])
+        for profile, exc in sorted(results['errors'].items()):
+            print('Error updating profile {}: {}'.format(repr(profile), repr(exc)))
     else:
         route53 = Route53(kwargs['profile'])
-        route53.update_collection()
+        results = route53.update_collection()
     if kwargs['non_interactive'] is not True:
-        ih.start_ipython(route53=AWS_ROUTE53, ip=AWS_IP)
+        ih.start_ipython(route53=ah.AWS_ROUTE53, ip=ah.AWS_IP, results=results)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,7 @@
 import click
 import input_helper as ih
-from aws_info_helper import S3, AWS_S3, AWS_S3_LAST_FILE, get_profiles
+import aws_info_helper as ah
+from aws_info_helper import S3, MAX_WORKERS, update_collection_for_profiles
 
 
 @click.command()
@@ -12,6 +13,10 @@ from aws_info_helper import S3, AWS_S3, AWS_S3_LAST_FILE, get_profiles
     '--all', '-a', 'all', is_flag=True, default=False,
     help='Update info from all profiles found in ~/.aws/credentials'
 )
+@click.option(
+    '--workers', '-w', 'workers', type=click.INT, default=MAX_WORKERS,
+    help='Number of profiles to update concurrently when using --all'
+)
 @click.option(
     '--profile', '-p', 'profile', default='default',
     help='Name of AWS profile to use'
@@ -19,14 +24,14 @@ from aws_info_helper import S3, AWS_S3, AWS_S3_LAST_FILE, get_profiles
 def main(**kwargs):
     """Update info in AWS_S3 redis-helper collection"""
     if kwargs['all'] is True:
-        for profile in get_profiles():
-            s3 = S3(profile)
-            s3.update_collection()
+        results = update_collection_for_profiles(S3, max_workers=kwargs['workers'])
+        for profile, exc in sorted(results['errors'].items()):
+            print('Error updating profile {}: {}'.format(repr(profile), repr(exc)))
     else:
         s3 = S3(kwargs['profile'])
-        s3.update_collection()
+        results = s3.update_collection()
     if kwargs['non_interactive'] is not True:
-        ih.start_ipython(s3=AWS_S3, s3_last_file=AWS_S3_LAST_FILE)
+        ih.start_ipython(s3=ah.AWS_S3, s3_last_file=ah.AWS_S3_LAST_FILE, results=results)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,253 @@
+import atexit
+import hashlib
+import mmap
+import os
+import pickle
+import threading
+import time
+import aws_info_helper as ah
+from glob import glob
+from os.path import expanduser, isdir, join
+
+
+# Client methods whose results may be saved in local snapshots, mapped to the
+# resource type whose TTL applies (parameter values are never saved)
+SNAPSHOT_METHODS = {
+    'describe_addresses': 'ec2',
+    'describe_availability_zones': 'ec2',
+    'describe_customer_gateways': 'ec2',
+    'describe_instances': 'ec2',
+    'describe_internet_gateways': 'ec2',
+    'describe_key_pairs': 'ec2',
+    'describe_nat_gateways': 'ec2',
+    'describe_network_acls': 'ec2',
+    'describe_network_interfaces': 'ec2',
+    'describe_regions': 'ec2',
+    'describe_route_tables': 'ec2',
+    'describe_security_groups': 'ec2',
+    'describe_subnets': 'ec2',
+    'describe_tags': 'ec2',
+    'describe_volume_status': 'ec2',
+    'describe_volumes': 'ec2',
+    'describe_vpcs': 'ec2',
+    'list_hosted_zones': 'route53',
+    'list_resource_record_sets': 'route53',
+    'list_buckets': 's3',
+    'describe_parameters': 'ssm',
+}
+SNAPSHOT_TTLS = {
+    'ec2': ah.SNAPSHOT_TTL_EC2,
+    'route53': ah.SNAPSHOT_TTL_ROUTE53,
+    's3': ah.SNAPSHOT_TTL_S3,
+    'ssm': ah.SNAPSHOT_TTL_SSM,
+}
+
+
+class SnapshotCache(object):
+    def __init__(self, directory=None, stale_ttl=None, refresh_wait=None):
+        """Persistent cache of client call results, one file per call
+
+        - directory: where snapshot files are saved (default is SNAPSHOT_DIR
+          from settings, or ~/.cache/aws-info-helper/snapshots)
+        - stale_ttl: number of seconds past its TTL that a snapshot may still
+          be returned while a fresh copy is fetched in the background (default
+          is SNAPSHOT_STALE_TTL from settings)
+        - refresh_wait: max number of seconds to wait at exit for background
+          refreshes to finish (default is SNAPSHOT_REFRESH_WAIT from settings)
+
+        Files are pickled with the highest protocol and read through mmap.
+        Their age comes from the file mtime, so nothing is loaded to check it
+        """
+        self._directory = expanduser(
+            directory or ah.SNAPSHOT_DIR or '~/.cache/aws-info-helper/snapshots'
+        )
+        self._stale_ttl = ah.SNAPSHOT_STALE_TTL if stale_ttl is None else stale_ttl
+        self._refresh_wait = (
+            ah.SNAPSHOT_REFRESH_WAIT if refresh_wait is None else refresh_wait
+        )
+        self._refreshing = set()
+        self._threads = []
+        self._served = {}
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def get_path(self, profile_name, region_name, method_name, params):
+        """Return the snapshot file path for a call
+
+        - profile_name: name of AWS profile
+        - region_name: name of AWS region
+        - method_name: name of the client method
+        - params: dict of all other args the result depends on
+        """
+        digest = hashlib.sha1(
+            repr(sorted(params.items())).encode('utf-8')
+        ).hexdigest()[:16]
+        return join(
+            self._directory, profile_name, region_name or 'global',
+            '{}-{}.pickle'.format(method_name, digest)
+        )
+
+    def load(self, path):
+        """Return (data, age_in_seconds) for a snapshot file, or (None, None)"""
+        try:
+            with open(path, 'rb') as fp:
+                age = time.time() - os.fstat(fp.fileno()).st_mtime
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return pickle.loads(mm), age
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None, None
+
+    def save(self, path, data):
+        """Atomically write data to a snapshot file"""
+        dirname = os.path.dirname(path)
+        if not isdir(dirname):
+            os.makedirs(dirname, exist_ok=True)
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as fp:
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def _refresh(self, path, fetch):
+        try:
+            data = fetch()
+            if data:
+                self.save(path, data)
+        except Exception as e:
+            print(repr(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(path)
+
+    def get_or_fetch(self, path, fetch, ttl):
+        """Return snapshot data at path, calling fetch() if missing or too old
+
+        - path: snapshot file path from get_path
+        - fetch: func that returns fresh data
+        - ttl: number of seconds a snapshot is fresh for
+
+        A snapshot older than ttl (but within stale_ttl past it) is returned as
+        is, while fetch() runs in a background thread to replace it. At exit,
+        the process waits up to refresh_wait seconds for those threads (see
+        wait_for_refreshes), so short-lived CLIs still refresh stale snapshots.
+        Empty results are not saved
+        """
+        data, age = self.load(path)
+        if age is not None and age < ttl:
+            with self._lock:
+                self._served[path] = (age, False)
+            return data
+        if age is not None and age < ttl + self._stale_ttl:
+            with self._lock:
+                self._served[path] = (age, True)
+                start = path not in self._refreshing
+                self._refreshing.add(path)
+            if start:
+                # A daemon thread that is joined with a timeout at exit, since
+                # non-daemon threads are joined without one before atexit runs
+                thread = threading.Thread(target=self._refresh, args=(path, fetch))
+                thread.daemon = True
+                with self._lock:
+                    if not self._threads:
+                        atexit.register(self.wait_for_refreshes, self._refresh_wait)
+                    self._threads = [x for x in self._threads if x.is_alive()]
+                    self._threads.append(thread)
+                thread.start()
+            return data
+        data = fetch()
+        if data:
+            self.save(path, data)
+        return data
+
+    def wait_for_refreshes(self, timeout=None):
+        """Wait for background refreshes to finish and return True if they all
+        did (False if timeout seconds passed first)
+
+        - timeout: max number of seconds to wait in all (None waits for as
+          long as they take)
+        """
+        with self._lock:
+            threads = list(self._threads)
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(deadline - time.time(), 0))
+        return not any(thread.is_alive() for thread in threads)
+
+    def served_info(self):
+        """Return (oldest age in seconds, True if any was past its TTL) of the
+        snapshots returned by get_or_fetch so far, or (None, False) if none
+        were
+        """
+        with self._lock:
+            served = list(self._served.values())
+        if not served:
+            return None, False
+        return max(age for age, _ in served), any(stale for _, stale in served)
+
+    def clear(self, profile_name='*', region_name='*', method_name='*'):
+        """Delete matching snapshot files and return how many were deleted"""
+        paths = glob(join(
+            self._directory, profile_name, region_name or 'global',
+            '{}-*.pickle'.format(method_name)
+        ))
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+
+
+_snapshot_cache = None
+_snapshot_cache_lock = threading.Lock()
+
+
+def get_snapshot_cache():
+    """Return the shared SnapshotCache instance"""
+    global _snapshot_cache
+    with _snapshot_cache_lock:
+        if _snapshot_cache is None:
+            _snapshot_cache = SnapshotCache()
+        return _snapshot_cache
+
+
+def snapshot_note():
+    """Return a line saying how old the snapshots returned so far are (empty
+    string if no snapshots were returned), for CLI output
+    """
+    if _snapshot_cache is None:
+        return ''
+    age, stale = _snapshot_cache.served_info()
+    if age is None:
+        return ''
+    return '(from local snapshots up to {} old{}; use --fresh to fetch from AWS)'.format(
+        '{}s'.format(int(age)) if age < 120 else '{}m'.format(int(age // 60)),
+        ', past their TTL and refreshing in the background' if stale else ''
+    )
+
+
+def snapshot_call(func, profile_name, region_name, lazy=False):
+    """Wrap a paginated_client_call (or iter_client_call) partial so results of
+    SNAPSHOT_METHODS are read from / saved to local snapshots
+
+    - func: partial of ah.paginated_client_call or ah.iter_client_call
+    - profile_name: name of AWS profile the client uses
+    - region_name: name of AWS region the client uses
+    - lazy: if True, func is an iter_client_call partial and the wrapper
+      returns an iterator too
+    """
+    def wrapper(method_name, main_key='', **kwargs):
+        resource = SNAPSHOT_METHODS.get(method_name)
+        if resource is None:
+            return func(method_name, main_key, **kwargs)
+
+        cache = get_snapshot_cache()
+        params = dict(kwargs, main_key=main_key)
+        path = cache.get_path(profile_name, region_name, method_name, params)
+        data = cache.get_or_fetch(
+            path,
+            lambda: list(func(method_name, main_key, **kwargs)),
+            SNAPSHOT_TTLS[resource]
+        )
+        return iter(data) if lazy else data
+
+    return wrapper
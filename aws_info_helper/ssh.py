@@ -0,0 +1,286 @@
+import json
+import os
+import subprocess
+import threading
+import aws_info_helper as ah
+import bg_helper as bh
+from os.path import dirname, expanduser, isdir
+
+
+def get_configured_hosts():
+    """Return the set of Hosts from ~/.ssh/config (empty if there is no file)"""
+    try:
+        return bh.tools.ssh_configured_hosts()
+    except (IOError, OSError):
+        return set()
+
+
+def get_ssh_args(ip, user=None, pem_file=None, command='', configured_hosts=None):
+    """Return the list of args for an ssh subprocess
+
+    - ip: IP address or hostname of server
+    - user: remote SSH user (not needed for Hosts in ~/.ssh/config)
+    - pem_file: absolute path to pem file (not needed for Hosts in
+      ~/.ssh/config)
+    - command: command to run on the remote server
+    - configured_hosts: set of Hosts from ~/.ssh/config (default from
+      get_configured_hosts)
+
+    The same options as bh.tools.ssh_to_server are used, plus BatchMode, so a
+    host that asks for a password fails instead of waiting for input
+    """
+    if configured_hosts is None:
+        configured_hosts = get_configured_hosts()
+    args = [
+        'ssh', '-o', 'StrictHostKeyChecking no', '-o', 'ConnectTimeout=2',
+        '-o', 'BatchMode=yes',
+    ]
+    if ip in configured_hosts:
+        args.append(ip)
+    else:
+        assert user, 'Must specify user since {} is not in ~/.ssh/config'.format(ip)
+        assert pem_file, 'Must specify pem_file since {} is not in ~/.ssh/config'.format(ip)
+        args.extend(['-i', pem_file, '{}@{}'.format(user, ip)])
+    if command:
+        args.append(command)
+    return args
+
+
+def run_ssh_command(ip, user=None, pem_file=None, command='', timeout=None,
+                    configured_hosts=None):
+    """Run a command on a server via SSH and return (exit status, output)
+
+    - ip: IP address or hostname of server
+    - user: remote SSH user
+    - pem_file: absolute path to pem file
+    - command: command to run on the remote server
+    - timeout: number of seconds to wait before killing the ssh process
+    - configured_hosts: set of Hosts from ~/.ssh/config
+
+    Output has stdout and stderr combined. If the timeout is reached, the exit
+    status is None
+    """
+    args = get_ssh_args(ip, user, pem_file, command, configured_hosts)
+    try:
+        proc = subprocess.run(
+            args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return None, 'Timeout of {} reached when running: {}'.format(timeout, command)
+    return proc.returncode, proc.stdout.decode('utf-8', 'replace').strip()
+
+
+class SSHUserCache(object):
+    def __init__(self, path=None):
+        """Persistent cache of the SSH user for (instance id, AMI) pairs
+
+        - path: JSON file the cache is kept in (default is SSH_USER_CACHE_FILE
+          from settings, or ~/.cache/aws-info-helper/ssh-users.json)
+
+        The user found for an instance is also remembered for its AMI, so
+        other instances launched from the same AMI don't need to be probed. An
+        instance's entry is dropped when its AMI changes
+        """
+        self._path = expanduser(
+            path or ah.SSH_USER_CACHE_FILE or '~/.cache/aws-info-helper/ssh-users.json'
+        )
+        self._data = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self._path, 'r') as fp:
+                    self._data = json.load(fp)
+            except (IOError, OSError, ValueError):
+                self._data = {}
+            self._data.setdefault('instances', {})
+            self._data.setdefault('amis', {})
+        return self._data
+
+    def get(self, instance_id, ami=None):
+        """Return the cached SSH user for an instance (or its AMI), or None
+
+        - instance_id: id of the EC2 instance
+        - ami: id of the AMI the instance was launched from
+        """
+        with self._lock:
+            data = self._load()
+            entry = data['instances'].get(instance_id)
+            if entry is not None:
+                if entry.get('ami') == ami:
+                    return entry['user']
+                del data['instances'][instance_id]
+                self._dirty = True
+            if ami:
+                return data['amis'].get(ami)
+
+    def set(self, instance_id, ami, user):
+        """Cache the SSH user for an instance and its AMI"""
+        with self._lock:
+            data = self._load()
+            if data['instances'].get(instance_id) != {'ami': ami, 'user': user}:
+                data['instances'][instance_id] = {'ami': ami, 'user': user}
+                self._dirty = True
+            if ami and data['amis'].get(ami) != user:
+                data['amis'][ami] = user
+                self._dirty = True
+
+    def forget(self, instance_id):
+        """Drop the cached SSH user for an instance (i.e. after it stopped working)"""
+        with self._lock:
+            data = self._load()
+            entry = data['instances'].pop(instance_id, None)
+            if entry is not None:
+                self._dirty = True
+                if entry.get('ami') and data['amis'].get(entry['ami']) == entry['user']:
+                    del data['amis'][entry['ami']]
+
+    def save(self):
+        """Atomically write the cache file if anything changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = dirname(self._path)
+            if directory and not isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self._path, os.getpid())
+            with open(tmp_path, 'w') as fp:
+                json.dump(self._data, fp, indent=2, sort_keys=True)
+            os.replace(tmp_path, self._path)
+            self._dirty = False
+
+
+def _probe_ssh_users(hosts, max_workers):
+    def _determine(key):
+        ip, pem_file, _ = hosts[key]
+        return bh.tools.ssh_determine_aws_user_for_server(ip, pem_file)
+
+    users = {}
+    for key, user, exc in ah.concurrent_map(_determine, hosts, max_workers=max_workers):
+        if exc is not None:
+            print('Could not determine SSH user for {}: {}'.format(key, repr(exc)))
+        users[key] = user
+    return users
+
+
+def determine_ssh_users(hosts, max_workers=ah.MAX_WORKERS, cache=None):
+    """Determine the default AWS SSH user of many servers concurrently
+
+    - hosts: dict of instance ids and (ip, pem_file, ami) tuples
+    - max_workers: max number of servers to check at once (default from
+      MAX_WORKERS setting)
+    - cache: an SSHUserCache to check before probing and to save found users
+      to (None to always probe)
+
+    Return a dict of instance ids and the user found (None if no user worked).
+    Each server may take a few attempts (see
+    bh.tools.ssh_determine_aws_user_for_server), so only one instance per AMI
+    is probed at first and the others get the user it found. Instances whose
+    AMI probe failed are then probed on their own
+    """
+    users = {}
+    pending = {}
+    for key, (ip, pem_file, ami) in hosts.items():
+        user = cache.get(key, ami) if cache is not None else None
+        if user:
+            users[key] = user
+        else:
+            pending[key] = (ip, pem_file, ami)
+
+    first = {}
+    for key in sorted(pending):
+        first.setdefault(pending[key][2] or key, key)
+    found = _probe_ssh_users({key: pending[key] for key in first.values()}, max_workers)
+    ami_users = {
+        pending[key][2]: user
+        for key, user in found.items()
+        if user and pending[key][2]
+    }
+    rest = {}
+    for key, host in pending.items():
+        if key in found:
+            users[key] = found[key]
+        elif ami_users.get(host[2]):
+            users[key] = ami_users[host[2]]
+        else:
+            rest[key] = host
+    users.update(_probe_ssh_users(rest, max_workers))
+
+    if cache is not None:
+        for key, user in users.items():
+            if user:
+                cache.set(key, hosts[key][2], user)
+        cache.save()
+    return users
+
+
+def iter_ssh_results(targets, command, max_workers=ah.MAX_WORKERS, timeout=None):
+    """Run a command on many servers concurrently and yield results as each
+    server finishes
+
+    - targets: list of dicts with 'ip', 'user', and 'pem_file' keys (other
+      keys are passed through)
+    - command: command to run on each server
+    - max_workers: max number of ssh processes to run at once (default from
+      MAX_WORKERS setting)
+    - timeout: number of seconds to wait for each server
+
+    Yield (target, exit status, output) tuples. Output of each server is
+    buffered, so it is never interleaved with output of other servers
+    """
+    configured_hosts = get_configured_hosts()
+
+    def _run(i):
+        target = targets[i]
+        return run_ssh_command(
+            target['ip'], target['user'], target['pem_file'], command,
+            timeout=timeout, configured_hosts=configured_hosts
+        )
+
+    for i, result, exc in ah.concurrent_map(
+        _run, range(len(targets)), max_workers=max_workers
+    ):
+        if exc is not None:
+            yield targets[i], -1, repr(exc)
+        else:
+            yield (targets[i],) + result
+
+
+def format_ssh_output(label, output, status, prefixed=False):
+    """Return output from a server as a string ready to print
+
+    - label: string identifying the server
+    - output: output from run_ssh_command
+    - status: exit status from run_ssh_command
+    - prefixed: if True, start every line with the label (easy to grep);
+      otherwise put the label and exit status above the output
+    """
+    if prefixed:
+        lines = output.splitlines() or ['']
+        return '\n'.join('{}: {}'.format(label, line) for line in lines)
+    return '--------------------------------------------------\n{} (exit status {})\n{}'.format(
+        label, status, output
+    )
+
+
+def summarize_exit_statuses(results):
+    """Return a summary string for a list of (label, exit status) tuples"""
+    by_status = {}
+    for label, status in results:
+        by_status.setdefault(status, []).append(label)
+    lines = ['{} of {} succeeded'.format(len(by_status.get(0, [])), len(results))]
+    for status in sorted(by_status, key=lambda s: (s is None, s or 0)):
+        if status == 0:
+            continue
+        lines.append('- {}: {}'.format(
+            'timed out' if status is None else 'exit status {}'.format(status),
+            ', '.join(sorted(by_status[status]))
+        ))
+    return '\n'.join(lines)
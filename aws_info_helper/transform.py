@@ -0,0 +1,139 @@
+import input_helper as ih
+
+
+def _collapse(data):
+    """Return the only item of a 1-item list, None for an empty list, or data"""
+    data_len = len(data)
+    if data_len == 1:
+        return data[0]
+    elif data_len == 0:
+        return None
+    return data
+
+
+def compile_getter(key, condition=None):
+    """Return a single-var func that gets the value at key from a dict
+
+    - key: name of a key (nested.key.name supported)
+    - condition: a single-variable func returning a bool
+
+    The returned func gives the same result as ih.get_value_at_key(some_dict,
+    key, condition), but the key is only split once
+    """
+    if '.' not in key:
+        def get(some_dict):
+            data = some_dict.get(key)
+            if type(data) in (list, tuple):
+                if condition:
+                    data = [x for x in data if condition(x)]
+                return _collapse(data)
+            if condition:
+                return data if condition(data) else None
+            return data
+        return get
+
+    first_key, *subkeys = key.split('.')
+
+    def get(some_dict):
+        data = some_dict.get(first_key, {})
+        data_type = type(data)
+        for subkey in subkeys:
+            try:
+                data = data.get(subkey, {})
+            except AttributeError:
+                if data_type in (list, tuple):
+                    if condition:
+                        data = [x.get(subkey) for x in data if condition(x)]
+                    else:
+                        data = [x.get(subkey) for x in data]
+                    data = _collapse(data)
+                else:
+                    data = None
+            else:
+                if condition:
+                    if type(data) in (list, tuple):
+                        data = _collapse([x for x in data if condition(x)])
+                    else:
+                        data = data if condition(data) else None
+        if data == {}:
+            data = None
+        return data
+    return get
+
+
+def compile_steps(filter_keys, conditions=None, value_casting=None, name_mapping=None):
+    """Return list of (name, getter, cast) tuples for compile_transform
+
+    - filter_keys: the keys that should be read from full data with nesting
+      allowed
+    - conditions: dict of key names and single-var funcs that return bool
+    - value_casting: dict of key names and single-var funcs that return casted
+      value for that key name
+    - name_mapping: dict of key names and new key names they should be mapped to
+
+    Key names in conditions, value_casting, and name_mapping use '__' between
+    nested key name parts (same as ih.filter_keys, ih.cast_keys, and
+    ih.rename_keys)
+    """
+    conditions = conditions or {}
+    value_casting = value_casting or {}
+    name_mapping = name_mapping or {}
+    steps = []
+    for key in ih.get_list_from_arg_strings(filter_keys):
+        key_dunder = key.replace('.', '__')
+        steps.append((
+            name_mapping.get(key_dunder, key_dunder),
+            compile_getter(key, conditions.get(key_dunder)),
+            value_casting.get(key_dunder),
+        ))
+    return steps
+
+
+def compile_transform(filter_keys=None, conditions=None, value_casting=None,
+                      name_mapping=None):
+    """Return a single-var func that filters, casts, and renames a dict in one
+    pass
+
+    - filter_keys: the keys that should be read from full data with nesting
+      allowed; if None, every top-level key is kept (conditions are ignored)
+    - conditions: dict of key names and single-var funcs that return bool
+    - value_casting: dict of key names and single-var funcs that return casted
+      value for that key name
+    - name_mapping: dict of key names and new key names they should be mapped to
+
+    transform(data) returns the same dict as
+    ih.rename_keys(ih.cast_keys(ih.filter_keys(data, filter_keys, **conditions),
+    **value_casting), **name_mapping), except values are not deep copied. Key
+    specs are parsed once, when compiled, instead of for every dict
+    """
+    if filter_keys is None:
+        value_casting = value_casting or {}
+        name_mapping = name_mapping or {}
+
+        def transform(data):
+            result = {}
+            for key, value in data.items():
+                cast = value_casting.get(key)
+                if cast is not None:
+                    try:
+                        value = cast(value)
+                    except Exception:
+                        pass
+                result[name_mapping.get(key, key)] = value
+            return result
+        return transform
+
+    steps = compile_steps(filter_keys, conditions, value_casting, name_mapping)
+
+    def transform(data):
+        result = {}
+        for name, get, cast in steps:
+            value = get(data)
+            if cast is not None:
+                try:
+                    value = cast(value)
+                except Exception:
+                    pass
+            result[name] = value
+        return result
+    return transform
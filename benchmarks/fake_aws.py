@@ -0,0 +1,189 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from botocore import xform_name
+from botocore.awsrequest import AWSResponse
+
+
+class FakeAWS(object):
+    def __init__(self, fleet, latency=0):
+        """Answer boto3 client calls from a synthetic fleet, without any HTTP
+
+        - fleet: dict from synthetic.make_fleet
+        - latency: number of seconds to sleep in every call (to stand in for
+          the network round trip)
+
+        Responses are returned from the 'before-call' event, the same way
+        botocore.stub.Stubber does it, so params are still validated and
+        serialized by the real client. Unlike Stubber, calls don't have to be
+        queued in order, so paginated and concurrent calls work
+        """
+        self._fleet = fleet
+        self._latency = latency
+        self._calls = Counter()
+        self._lock = threading.Lock()
+        self._record_sets = {
+            zone_id.split('/')[-1]: (records, {
+                (r['Name'], r['Type']): i for i, r in enumerate(records)
+            })
+            for zone_id, records in fleet['record_sets'].items()
+        }
+        self._objects = {
+            bucket: ([o['Key'] for o in objects], objects)
+            for bucket, objects in fleet['objects'].items()
+        }
+        self._parameters = {p['Name']: p for p in fleet['parameters']}
+
+    @property
+    def calls(self):
+        """Return a Counter of 'service.method' names and number of calls"""
+        with self._lock:
+            return self._calls.copy()
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+    def register(self, session):
+        """Answer all calls made by clients created from a boto3 session
+
+        Must be called before any client is created from the session
+        """
+        session.events.register('before-parameter-build', self._save_params)
+        session.events.register('before-call', self._respond)
+
+    def _save_params(self, params, context, **kwargs):
+        context['fake_aws_params'] = dict(params)
+
+    def _respond(self, model, context, **kwargs):
+        method_name = xform_name(model.name)
+        service = model.service_model.service_name
+        with self._lock:
+            self._calls['{}.{}'.format(service, method_name)] += 1
+        handler = getattr(self, '_{}_{}'.format(service, method_name), None)
+        if handler is None:
+            raise NotImplementedError('FakeAWS has no response for {}.{}'.format(
+                service, method_name
+            ))
+        if self._latency:
+            time.sleep(self._latency)
+        response = handler(**context.get('fake_aws_params', {}))
+        response.setdefault('ResponseMetadata', {'HTTPStatusCode': 200})
+        return AWSResponse(None, 200, {}, None), response
+
+    def _page(self, items, start, limit):
+        """Return (items for the page, next start index or None)"""
+        end = start + limit
+        return items[start:end], (end if end < len(items) else None)
+
+    def _ec2_describe_instances(self, MaxResults=1000, NextToken=None, **kwargs):
+        reservations, next_start = self._page(
+            self._fleet['reservations'], int(NextToken or 0), MaxResults
+        )
+        response = {'Reservations': reservations}
+        if next_start is not None:
+            response['NextToken'] = str(next_start)
+        return response
+
+    def _ec2_describe_addresses(self, **kwargs):
+        return {'Addresses': self._fleet['addresses']}
+
+    def _route53_list_hosted_zones(self, MaxItems='100', Marker=None, **kwargs):
+        zones, next_start = self._page(
+            self._fleet['zones'], int(Marker or 0), int(MaxItems)
+        )
+        response = {
+            'HostedZones': zones,
+            'IsTruncated': next_start is not None,
+            'MaxItems': MaxItems,
+        }
+        if next_start is not None:
+            response['NextMarker'] = str(next_start)
+        return response
+
+    def _route53_list_resource_record_sets(self, HostedZoneId, MaxItems='300',
+                                           StartRecordName=None,
+                                           StartRecordType=None, **kwargs):
+        records, index = self._record_sets[HostedZoneId.split('/')[-1]]
+        start = index.get((StartRecordName, StartRecordType), 0)
+        page, next_start = self._page(records, start, int(MaxItems))
+        response = {
+            'ResourceRecordSets': page,
+            'IsTruncated': next_start is not None,
+            'MaxItems': MaxItems,
+        }
+        if next_start is not None:
+            response['NextRecordName'] = records[next_start]['Name']
+            response['NextRecordType'] = records[next_start]['Type']
+        return response
+
+    def _s3_list_buckets(self, **kwargs):
+        return {
+            'Buckets': self._fleet['buckets'],
+            'Owner': {'DisplayName': 'benchmark', 'ID': 'abc123'},
+        }
+
+    def _s3_list_objects_v2(self, Bucket, Prefix='', StartAfter='', Delimiter='',
+                            MaxKeys=1000, ContinuationToken=None, **kwargs):
+        keys, objects = self._objects.get(Bucket, ([], []))
+        after = ContinuationToken or StartAfter
+        if after.endswith(Delimiter or '\0'):
+            # The token is a common prefix; skip everything under it
+            i = bisect_right(keys, after + '\U0010ffff')
+        else:
+            i = bisect_right(keys, after)
+        i = max(i, bisect_left(keys, Prefix))
+        contents = []
+        prefixes = []
+        count = 0
+        last = None
+        while i < len(keys) and keys[i].startswith(Prefix) and count < MaxKeys:
+            rest = keys[i][len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                last = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                prefixes.append({'Prefix': last})
+                i = bisect_right(keys, last + '\U0010ffff')
+            else:
+                last = keys[i]
+                contents.append(objects[i])
+                i += 1
+            count += 1
+        response = {
+            'Name': Bucket,
+            'Prefix': Prefix,
+            'MaxKeys': MaxKeys,
+            'KeyCount': count,
+            'IsTruncated': i < len(keys) and keys[i].startswith(Prefix),
+        }
+        if contents:
+            response['Contents'] = contents
+        if prefixes:
+            response['CommonPrefixes'] = prefixes
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = last
+        return response
+
+    def _ssm_describe_parameters(self, MaxResults=50, NextToken=None, **kwargs):
+        parameters, next_start = self._page(
+            self._fleet['parameters'], int(NextToken or 0), MaxResults
+        )
+        response = {'Parameters': parameters}
+        if next_start is not None:
+            response['NextToken'] = str(next_start)
+        return response
+
+    def _ssm_get_parameters(self, Names, **kwargs):
+        found = [name for name in Names if name in self._parameters]
+        return {
+            'Parameters': [
+                {
+                    'Name': name,
+                    'Type': self._parameters[name]['Type'],
+                    'Value': self._fleet['values'][name],
+                    'Version': 1,
+                }
+                for name in found
+            ],
+            'InvalidParameters': [name for name in Names if name not in self._parameters],
+        }
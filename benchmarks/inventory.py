@@ -0,0 +1,285 @@
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from fnmatch import fnmatch
+from os.path import abspath, dirname, isfile, join
+import click
+
+os.environ['AWS_CONFIG_FILE'] = os.devnull
+os.environ['AWS_SHARED_CREDENTIALS_FILE'] = os.devnull
+os.environ['AWS_ACCESS_KEY_ID'] = 'benchmark'
+os.environ['AWS_SECRET_ACCESS_KEY'] = 'benchmark'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+import aws_info_helper as ah
+from fake_aws import FakeAWS
+from synthetic import make_fleet
+
+
+BASELINE_FILE = join(dirname(abspath(__file__)), 'baseline.json')
+SIZE_OPTIONS = (
+    'instances', 'addresses', 'zones', 'records', 'buckets', 'objects', 'parameters'
+)
+
+
+class Case(object):
+    def __init__(self, name, func, items, setup=None, prepare=None):
+        """A benchmarked call
+
+        - name: name shown in the report and saved in the baseline
+        - func: func with no args to time
+        - items: number of items func handles (for throughput)
+        - setup: func with no args to call (untimed) before every run
+        - prepare: func with no args to call (untimed) once before the runs
+        """
+        self.name = name
+        self.func = func
+        self.items = items
+        self.setup = setup
+        self.prepare = prepare
+
+
+def connect_fake_redis():
+    """Point redis-helper at an in-memory fakeredis server and return it"""
+    try:
+        import fakeredis
+        import redis_helper as rh
+    except ImportError as e:
+        raise click.ClickException(
+            '{} (pip install fakeredis redis-helper)'.format(e)
+        )
+    rh.REDIS = fakeredis.FakeStrictRedis()
+    return rh.REDIS
+
+
+def get_cases(fleet, redis):
+    """Return the list of Case objects for a fleet"""
+    ec2 = ah.EC2()
+    route53 = ah.Route53()
+    s3 = ah.S3()
+    ssm = ah.ParameterStore()
+    instance_count = sum(len(r['Instances']) for r in fleet['reservations'])
+    record_count = sum(
+        len([r for r in records if r['Type'] in ('A', 'CNAME')])
+        for records in fleet['record_sets'].values()
+    )
+    bucket = fleet['buckets'][0]['Name'] if fleet['buckets'] else ''
+    object_count = len(fleet['objects'].get(bucket, []))
+
+    def fresh(update):
+        def _setup():
+            redis.flushdb()
+        def _prepare():
+            redis.flushdb()
+            update()
+        return _setup, _prepare
+
+    cases = [
+        Case('ec2.get_all_instances_full_data',
+             ec2.get_all_instances_full_data, instance_count),
+        Case('ec2.get_all_instances_filtered_data',
+             ec2.get_all_instances_filtered_data, instance_count),
+        Case('ec2.get_all_instances_serialized_data',
+             ec2.get_all_instances_serialized_data, instance_count),
+        Case('ec2.get_all_instance_records',
+             ec2.get_all_instance_records, instance_count),
+        Case('ec2.get_elastic_addresses_filtered_data',
+             ec2.get_elastic_addresses_filtered_data, len(fleet['addresses'])),
+        Case('route53.get_all_record_sets_for_all_zones',
+             route53.get_all_record_sets_for_all_zones, record_count),
+        Case('s3.get_bucket_files_full_data',
+             lambda: s3.get_bucket_files_full_data(bucket, limit=None), object_count),
+        Case('s3.get_bucket_files_full_data[workers=8]',
+             lambda: s3.get_bucket_files_full_data(bucket, limit=None, workers=8),
+             object_count),
+        Case('ssm.get_all_values',
+             ssm.get_all_values, len(fleet['parameters'])),
+    ]
+    for name, update, items in (
+        ('ec2', ec2.update_collection, instance_count),
+        ('route53', route53.update_collection, record_count),
+        ('s3', s3.update_collection, len(fleet['buckets'])),
+    ):
+        setup, prepare = fresh(update)
+        cases.append(Case(
+            '{}.update_collection[new]'.format(name), update, items, setup=setup
+        ))
+        cases.append(Case(
+            '{}.update_collection[unchanged]'.format(name), update, items,
+            prepare=prepare
+        ))
+    return cases
+
+
+def run_case(case, fake, repeat=3, memory=True):
+    """Return dict of seconds (best of repeat), per_second, calls, and peak_mb"""
+    if case.prepare:
+        case.prepare()
+    times = []
+    calls = {}
+    for _ in range(repeat):
+        if case.setup:
+            case.setup()
+        gc.collect()
+        fake.reset()
+        start = time.perf_counter()
+        case.func()
+        times.append(time.perf_counter() - start)
+        calls = dict(fake.calls)
+    seconds = min(times)
+    result = {
+        'seconds': round(seconds, 4),
+        'per_second': round(case.items / seconds, 1) if seconds else None,
+        'calls': calls,
+        'peak_mb': None,
+    }
+    if memory:
+        if case.setup:
+            case.setup()
+        gc.collect()
+        tracemalloc.start()
+        case.func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_mb'] = round(peak / 1024 / 1024, 2)
+    return result
+
+
+def compare(result, base, tolerance):
+    """Return (text, regressed) comparing a result to its baseline result
+
+    Only making more API calls than the baseline counts as a regression, since
+    call counts are the same on every run and machine. Throughput is compared
+    too, and marked 'slower' if it dropped by more than tolerance, but timings
+    of the millisecond cases are too noisy to fail on
+    """
+    if not base:
+        return '', False
+    notes = []
+    if result['per_second'] and base.get('per_second'):
+        ratio = result['per_second'] / base['per_second']
+        notes.append('{:.2f}x{}'.format(ratio, ' slower' if ratio < 1 - tolerance else ''))
+    calls = sum(result['calls'].values())
+    base_calls = sum(base.get('calls', {}).values())
+    regressed = calls > base_calls
+    if calls != base_calls:
+        notes.append('calls {:+d}'.format(calls - base_calls))
+    if result['peak_mb'] is not None and base.get('peak_mb'):
+        notes.append('mem {:.2f}x'.format(result['peak_mb'] / base['peak_mb']))
+    return ' '.join(notes), regressed
+
+
+@click.command()
+@click.option('--instances', default=1000, type=int, help='Number of EC2 instances')
+@click.option('--addresses', default=200, type=int, help='Number of elastic ips')
+@click.option('--zones', default=10, type=int, help='Number of hosted zones')
+@click.option('--records', default=100, type=int, help='Number of record sets per zone')
+@click.option('--buckets', default=200, type=int, help='Number of buckets')
+@click.option('--objects', default=20000, type=int, help='Number of objects in the listed bucket')
+@click.option('--parameters', default=300, type=int, help='Number of Parameter Store parameters')
+@click.option(
+    '--repeat', '-n', 'repeat', default=3, type=int,
+    help='Number of timed runs per case (the best is reported)'
+)
+@click.option(
+    '--latency', '-l', 'latency', default=0.0, type=float,
+    help='Seconds each fake API call sleeps, to stand in for network round trips'
+)
+@click.option(
+    '--only', '-o', 'only', default='',
+    help='Only run cases whose names match this glob (i.e. "ec2.*")'
+)
+@click.option(
+    '--rate-limits', '-r', 'rate_limits', is_flag=True, default=False,
+    help='Keep the *_REQUESTS_PER_SECOND rate limits (off by default)'
+)
+@click.option(
+    '--no-memory', '-M', 'no_memory', is_flag=True, default=False,
+    help='Skip the extra tracemalloc run per case that measures peak memory'
+)
+@click.option(
+    '--baseline', '-b', 'baseline', default=BASELINE_FILE,
+    help='Path to the baseline JSON file to compare against'
+)
+@click.option(
+    '--save', '-s', 'save', is_flag=True, default=False,
+    help='Save these results as the new baseline'
+)
+@click.option(
+    '--check', '-c', 'check', is_flag=True, default=False,
+    help='Exit with status 1 if any case made more API calls than the baseline '
+    '(ignored with --save)'
+)
+@click.option(
+    '--tolerance', '-t', 'tolerance', default=0.25, type=float,
+    help='Throughput drop (fraction of baseline) allowed before a case is marked slower'
+)
+def main(**kwargs):
+    """Time inventory fetches and collection updates against fake AWS and Redis
+
+    Clients answer from a synthetic fleet (see fake_aws.FakeAWS) and
+    redis-helper collections are stored in fakeredis, so nothing leaves the
+    machine. For each case, report throughput (best of --repeat runs), peak
+    memory, and API call counts, and compare them to the saved baseline
+    """
+    sizes = {name: kwargs[name] for name in SIZE_OPTIONS}
+    fleet = make_fleet(**sizes)
+    fake = FakeAWS(fleet, latency=kwargs['latency'])
+    fake.register(ah.get_session())
+    if not kwargs['rate_limits']:
+        for service in ah.REQUESTS_PER_SECOND:
+            ah.REQUESTS_PER_SECOND[service] = 1e9
+    redis = connect_fake_redis()
+
+    baseline = {}
+    if isfile(kwargs['baseline']):
+        with open(kwargs['baseline'], 'r') as fp:
+            baseline = json.load(fp)
+        if baseline.get('sizes') != sizes:
+            print('Baseline sizes {} differ from these, so it is not compared\n'.format(
+                baseline.get('sizes')
+            ))
+            baseline = {}
+
+    results = {}
+    regressions = []
+    print('{:<45} {:>7} {:>9} {:>11} {:>8} {:>6}  {}'.format(
+        'case', 'items', 'seconds', 'items/s', 'peak MB', 'calls', 'vs baseline'
+    ))
+    for case in get_cases(fleet, redis):
+        if kwargs['only'] and not fnmatch(case.name, kwargs['only']):
+            continue
+        result = run_case(case, fake, kwargs['repeat'], not kwargs['no_memory'])
+        results[case.name] = result
+        notes, regressed = compare(
+            result, baseline.get('results', {}).get(case.name), kwargs['tolerance']
+        )
+        if regressed:
+            regressions.append(case.name)
+        print('{:<45} {:>7} {:>9.4f} {:>11} {:>8} {:>6}  {}'.format(
+            case.name, case.items, result['seconds'], result['per_second'],
+            result['peak_mb'] if result['peak_mb'] is not None else '-',
+            sum(result['calls'].values()), notes
+        ))
+
+    if kwargs['save']:
+        if kwargs['only'] and baseline:
+            results = dict(baseline['results'], **results)
+        with open(kwargs['baseline'], 'w') as fp:
+            json.dump(
+                {'sizes': sizes, 'python': sys.version.split()[0], 'results': results},
+                fp, indent=2, sort_keys=True
+            )
+            fp.write('\n')
+        print('\nSaved baseline to {}'.format(kwargs['baseline']))
+    if regressions:
+        print('\nMore API calls than baseline: {}'.format(', '.join(regressions)))
+        if kwargs['check'] and not kwargs['save']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import ipaddress
+import random
+import time
+import click
+from aws_info_helper.ip_index import IPEntry, IPIndex
+
+
+def make_entries(count, seed=0):
+    """Return list of IPEntry tuples for count random ips in 10.0.0.0/8"""
+    rand = random.Random(seed)
+    return [
+        IPEntry(
+            str(ipaddress.IPv4Address((10 << 24) + rand.randrange(1 << 24))),
+            'ec2', 'i-{:017x}'.format(i), None, 'default'
+        )
+        for i in range(count)
+    ]
+
+
+def scan_network(entries, network):
+    """Check every entry against a network, like a loop over the inventory"""
+    network = ipaddress.IPv4Network(network, strict=False)
+    return [entry for entry in entries if ipaddress.IPv4Address(entry.ip) in network]
+
+
+@click.command()
+@click.option(
+    '--count', '-c', 'count', default=100000, type=int,
+    help='Number of indexed ips'
+)
+@click.option(
+    '--lookups', '-l', 'lookups', default=1000000, type=int,
+    help='Number of ips to look up in a batch (about half are known)'
+)
+@click.option(
+    '--networks', '-n', 'networks', default=1000, type=int,
+    help='Number of /20 networks to query'
+)
+def main(**kwargs):
+    """Time batch ip lookups and network (CIDR) queries on an IPIndex"""
+    entries = make_entries(kwargs['count'])
+    rand = random.Random(1)
+    start = time.time()
+    index = IPIndex(entries)
+    index.find_in_network('10.0.0.0/32')
+    print('{:<22} {:8.3f}s'.format('build', time.time() - start))
+
+    known = [entry.ip for entry in entries]
+    ips = [
+        rand.choice(known) if i % 2 else
+        str(ipaddress.IPv4Address((10 << 24) + rand.randrange(1 << 24)))
+        for i in range(kwargs['lookups'])
+    ]
+    start = time.time()
+    found = index.lookup_many(ips)
+    elapsed = time.time() - start
+    print('{:<22} {:8.3f}s {:12.0f} ips/s ({} known)'.format(
+        'lookup_many', elapsed, len(ips) / elapsed, len(found)
+    ))
+
+    networks = [
+        '10.{}.{}.0/20'.format(rand.randrange(256), rand.randrange(16) << 4)
+        for _ in range(kwargs['networks'])
+    ]
+    start = time.time()
+    results = index.find_in_networks(networks)
+    elapsed = time.time() - start
+    print('{:<22} {:8.3f}s {:12.0f} networks/s ({} entries)'.format(
+        'find_in_networks', elapsed, len(networks) / elapsed,
+        sum(len(x) for x in results.values())
+    ))
+
+    start = time.time()
+    scanned = scan_network(entries, networks[0])
+    elapsed = time.time() - start
+    print('{:<22} {:8.3f}s {:12.0f} networks/s'.format(
+        'scan (1 network)', elapsed, 1 / elapsed
+    ))
+    assert sorted(scanned) == sorted(results[networks[0]])
+
+
+if __name__ == '__main__':
+    main()
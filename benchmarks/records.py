@@ -0,0 +1,69 @@
+import gc
+import time
+import tracemalloc
+import click
+import input_helper as ih
+from aws_info_helper import ec2
+from synthetic import make_instances
+
+
+def serialize_dicts(instances):
+    """Same steps as EC2.iter_instances_filtered_data and
+    EC2.iter_instances_serialized_data
+    """
+    results = []
+    for instance in instances:
+        data = ih.filter_keys(instance, ec2.ah.EC2_INSTANCE_KEYS, **ec2.INSTANCE_FILTER_KEY_CONDITIONS)
+        data = ih.cast_keys(data, **ec2.INSTANCE_KEY_VALUE_CASTING)
+        data = ih.rename_keys(data, **ec2.INSTANCE_KEY_NAME_MAPPING)
+        data.update(dict(profile='default', region='us-east-1'))
+        results.append(data)
+    return results
+
+
+def serialize_records(instances):
+    """Same steps as EC2.iter_instance_records"""
+    return [
+        ec2.make_instance_record(instance, profile='default', region='us-east-1')
+        for instance in instances
+    ]
+
+
+def measure(func, instances):
+    """Return (seconds, bytes held by results, number of allocations)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    results = func(instances)
+    elapsed = time.time() - start
+    held, _ = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocations = sum(stat.count for stat in snapshot.statistics('filename'))
+    return elapsed, held, allocations, results
+
+
+@click.command()
+@click.option(
+    '--count', '-c', 'count', default=10000, type=int,
+    help='Number of synthetic instances'
+)
+def main(**kwargs):
+    """Compare memory/allocations of serialized instance dicts vs InstanceRecord"""
+    count = kwargs['count']
+    instances = make_instances(count)
+    dict_results = None
+    for name, func in (('dicts', serialize_dicts), ('records', serialize_records)):
+        elapsed, held, allocations, results = measure(func, instances)
+        if dict_results is None:
+            dict_results = results
+        else:
+            assert [r.to_dict() for r in results] == dict_results
+        print('{:<8} {:8.3f}s {:8.0f} bytes/record {:6.1f} live allocations/record'.format(
+            name, elapsed, held / count, allocations / count
+        ))
+        del results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import re
+import subprocess
+import sys
+import time
+import click
+
+
+SCRIPT_MODULES = [
+    'aws_info_helper.scripts.ec2_info',
+    'aws_info_helper.scripts.ec2_ssh_command',
+    'aws_info_helper.scripts.ec2_update_collection',
+    'aws_info_helper.scripts.ip_update_collection',
+    'aws_info_helper.scripts.route53_info',
+    'aws_info_helper.scripts.route53_update_collection',
+    'aws_info_helper.scripts.s3_update_collection',
+]
+IMPORTTIME_RX = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def time_help(module, repeat=3):
+    """Return best wall time (in seconds) of 'python -m module --help'"""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.run(
+            [sys.executable, '-m', module, '--help'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def top_imports(module, count=10):
+    """Return list of (cumulative_us, name) for slowest top-level imports"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    results = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RX.match(line)
+        if match:
+            results.append((int(match.group(2)), match.group(4)))
+    results.sort(reverse=True)
+    return results[:count]
+
+
+@click.command()
+@click.option(
+    '--repeat', '-r', 'repeat', default=3, type=int,
+    help='Number of runs per script (best time is reported)'
+)
+@click.option(
+    '--importtime', '-i', 'importtime', is_flag=True, default=False,
+    help='Also show the slowest imports for each script module'
+)
+def main(**kwargs):
+    """Time '--help' for each console script (nothing should touch AWS or redis)"""
+    for module in SCRIPT_MODULES:
+        elapsed = time_help(module, kwargs['repeat'])
+        print('{:<50} {:8.3f}s'.format(module, elapsed))
+        if kwargs['importtime']:
+            for cumulative, name in top_imports(module):
+                print('    {:<46} {:8.3f}s'.format(name, cumulative / 1e6))
+
+
+if __name__ == '__main__':
+    main()
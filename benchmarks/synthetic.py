@@ -0,0 +1,186 @@
+import datetime
+import random
+
+
+def make_instance(i):
+    """Return a describe_instances style instance dict"""
+    return {
+        'Architecture': 'x86_64',
+        'CpuOptions': {'CoreCount': 2, 'ThreadsPerCore': 2},
+        'ImageId': 'ami-{:017x}'.format(i % 50),
+        'InstanceId': 'i-{:017x}'.format(i),
+        'InstanceType': random.choice(['t3.micro', 'm5.large', 'c5.xlarge']),
+        'KeyName': 'key-{}'.format(i % 7),
+        'LaunchTime': datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(minutes=i),
+        'Placement': {'AvailabilityZone': 'us-east-1{}'.format('abc'[i % 3]), 'Tenancy': 'default'},
+        'PrivateDnsName': 'ip-10-0-{}-{}.ec2.internal'.format(i // 256 % 256, i % 256),
+        'PrivateIpAddress': '10.0.{}.{}'.format(i // 256 % 256, i % 256),
+        'PublicDnsName': 'ec2-54-0-{}-{}.compute-1.amazonaws.com'.format(i // 256 % 256, i % 256),
+        'PublicIpAddress': '54.0.{}.{}'.format(i // 256 % 256, i % 256),
+        'SecurityGroups': [
+            {'GroupId': 'sg-{:08x}'.format(i % 11), 'GroupName': 'web'},
+            {'GroupId': 'sg-{:08x}'.format(i % 13 + 100), 'GroupName': 'ssh'},
+        ],
+        'State': {'Code': 16, 'Name': 'running'},
+        'SubnetId': 'subnet-{:08x}'.format(i % 5),
+        'Tags': [
+            {'Key': 'Name', 'Value': 'host-{}'.format(i)},
+            {'Key': 'env', 'Value': 'prod'},
+        ],
+        'VpcId': 'vpc-{:08x}'.format(i % 3),
+    }
+
+
+def make_instances(count, seed=0):
+    """Return a list of count synthetic instance dicts"""
+    random.seed(seed)
+    return [make_instance(i) for i in range(count)]
+
+
+def make_reservations(instances, per_reservation=3):
+    """Return describe_instances style reservations holding the instances"""
+    return [
+        {
+            'ReservationId': 'r-{:017x}'.format(i),
+            'OwnerId': '123456789012',
+            'Instances': instances[i:i + per_reservation],
+        }
+        for i in range(0, len(instances), per_reservation)
+    ]
+
+
+def make_address(i, instance_count):
+    """Return a describe_addresses style address dict (every 5th is unattached)"""
+    address = {
+        'AllocationId': 'eipalloc-{:017x}'.format(i),
+        'Domain': 'vpc',
+        'PublicIp': '3.0.{}.{}'.format(i // 256 % 256, i % 256),
+    }
+    if i % 5 and instance_count:
+        address['AssociationId'] = 'eipassoc-{:017x}'.format(i)
+        address['InstanceId'] = 'i-{:017x}'.format(i * 7 % instance_count)
+    return address
+
+
+def make_zone(i, record_count):
+    """Return a list_hosted_zones style zone dict"""
+    return {
+        'Id': '/hostedzone/Z{:012X}'.format(i),
+        'Name': 'zone{}.example.com.'.format(i),
+        'CallerReference': 'ref-{}'.format(i),
+        'Config': {'PrivateZone': False},
+        'ResourceRecordSetCount': record_count + 2,
+    }
+
+
+def make_record_sets(zone, count):
+    """Return list_resource_record_sets style record sets for a zone, sorted the
+    way Route53 returns them
+
+    The zone has SOA and NS records, then a mix of A records, alias A records,
+    CNAMEs inside the zone, and CNAMEs to other domains
+    """
+    domain = zone['Name']
+    records = [
+        {'Name': domain, 'Type': 'NS', 'TTL': 172800, 'ResourceRecords': [
+            {'Value': 'ns-{}.awsdns-{}.com.'.format(n, n)} for n in range(4)
+        ]},
+        {'Name': domain, 'Type': 'SOA', 'TTL': 900, 'ResourceRecords': [
+            {'Value': 'ns-0.awsdns-0.com. hostmaster. 1 7200 900 1209600 86400'}
+        ]},
+    ]
+    for i in range(count):
+        name = 'host{}.{}'.format(i, domain)
+        kind = i % 4
+        if kind == 0:
+            record = {'Name': name, 'Type': 'A', 'TTL': 300, 'ResourceRecords': [
+                {'Value': '54.0.{}.{}'.format(i // 256 % 256, i % 256)}
+            ]}
+        elif kind == 1:
+            record = {'Name': name, 'Type': 'A', 'AliasTarget': {
+                'HostedZoneId': 'Z35SXDOTRQ7X7K',
+                'DNSName': 'lb-{}.us-east-1.elb.amazonaws.com.'.format(i),
+                'EvaluateTargetHealth': False,
+            }}
+        elif kind == 2:
+            record = {'Name': name, 'Type': 'CNAME', 'TTL': 300, 'ResourceRecords': [
+                {'Value': 'host{}.{}'.format(i - 2, domain)}
+            ]}
+        else:
+            record = {'Name': name, 'Type': 'CNAME', 'TTL': 300, 'ResourceRecords': [
+                {'Value': 'site-{}.herokudns.com'.format(i)}
+            ]}
+        records.append(record)
+    return sorted(records, key=lambda r: (r['Name'], r['Type']))
+
+
+def make_bucket(i):
+    """Return a list_buckets style bucket dict"""
+    return {
+        'Name': 'bucket-{:05d}'.format(i),
+        'CreationDate': datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(hours=i),
+    }
+
+
+def make_objects(count, prefixes=8, subprefixes=10):
+    """Return list_objects_v2 style object dicts sorted by key, spread over
+    prefixes/subprefixes (so the bucket can be listed in shards)
+    """
+    objects = []
+    for i in range(count):
+        key = 'data{}/part{}/file-{:08d}.json'.format(
+            i % prefixes, i // prefixes % subprefixes, i
+        )
+        objects.append({
+            'Key': key,
+            'LastModified': datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(seconds=i),
+            'ETag': '"{:032x}"'.format(i),
+            'Size': 1024 + i % 4096,
+            'StorageClass': 'STANDARD',
+        })
+    return sorted(objects, key=lambda o: o['Key'])
+
+
+def make_parameter(i):
+    """Return a (describe_parameters style dict, value) tuple"""
+    name = '/app{}/{}/key{}'.format(i % 10, ('dev', 'stage', 'prod')[i % 3], i)
+    return {
+        'Name': name,
+        'Type': 'SecureString' if i % 2 else 'String',
+        'LastModifiedDate': datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(minutes=i),
+        'Version': 1,
+        'Tier': 'Standard',
+        'DataType': 'text',
+    }, 'value-{}'.format(i)
+
+
+def make_fleet(instances=1000, addresses=200, zones=10, records=100, buckets=200,
+               objects=20000, parameters=300, seed=0):
+    """Return a dict of synthetic resources for benchmarks/fake_aws.py
+
+    - instances: number of EC2 instances
+    - addresses: number of elastic ips
+    - zones: number of hosted zones
+    - records: number of record sets per hosted zone (plus SOA and NS)
+    - buckets: number of buckets
+    - objects: number of objects in the first bucket
+    - parameters: number of Parameter Store parameters
+    """
+    instance_list = make_instances(instances, seed)
+    zone_list = [make_zone(i, records) for i in range(zones)]
+    parameter_list = [make_parameter(i) for i in range(parameters)]
+    bucket_list = [make_bucket(i) for i in range(buckets)]
+    return {
+        'reservations': make_reservations(instance_list),
+        'addresses': [make_address(i, instances) for i in range(addresses)],
+        'zones': zone_list,
+        'record_sets': {
+            zone['Id']: make_record_sets(zone, records) for zone in zone_list
+        },
+        'buckets': bucket_list,
+        'objects': {
+            bucket_list[0]['Name']: make_objects(objects)
+        } if bucket_list else {},
+        'parameters': [p for p, _ in parameter_list],
+        'values': {p['Name']: value for p, value in parameter_list},
+    }
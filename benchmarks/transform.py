@@ -0,0 +1,59 @@
+import time
+import click
+import input_helper as ih
+from aws_info_helper import ec2
+from aws_info_helper.transform import compile_transform
+from synthetic import make_instances
+
+
+def chain(instances):
+    """filter_keys -> cast_keys -> rename_keys, like the original
+    EC2.iter_instances_serialized_data
+    """
+    results = []
+    for instance in instances:
+        data = ih.filter_keys(instance, ec2.ah.EC2_INSTANCE_KEYS, **ec2.INSTANCE_FILTER_KEY_CONDITIONS)
+        data = ih.cast_keys(data, **ec2.INSTANCE_KEY_VALUE_CASTING)
+        data = ih.rename_keys(data, **ec2.INSTANCE_KEY_NAME_MAPPING)
+        results.append(data)
+    return results
+
+
+def compiled(instances):
+    """One compiled transform, like EC2.iter_instances_serialized_data"""
+    transform = compile_transform(
+        ec2.ah.EC2_INSTANCE_KEYS,
+        ec2.INSTANCE_FILTER_KEY_CONDITIONS,
+        ec2.INSTANCE_KEY_VALUE_CASTING,
+        ec2.INSTANCE_KEY_NAME_MAPPING
+    )
+    return [transform(instance) for instance in instances]
+
+
+@click.command()
+@click.option(
+    '--count', '-c', 'count', default=100000, type=int,
+    help='Number of synthetic instances'
+)
+@click.option(
+    '--no-casting', '-n', 'no_casting', is_flag=True, default=False,
+    help='Skip value casting (LaunchTime formatting) to compare only the key handling'
+)
+def main(**kwargs):
+    """Compare the filter/cast/rename chain to a compiled transform"""
+    if kwargs['no_casting']:
+        ec2.INSTANCE_KEY_VALUE_CASTING = {}
+    instances = make_instances(kwargs['count'])
+    results = {}
+    for name, func in (('chain', chain), ('compiled', compiled)):
+        start = time.time()
+        results[name] = func(instances)
+        elapsed = time.time() - start
+        print('{:<10} {:8.3f}s {:10.0f} instances/s'.format(
+            name, elapsed, kwargs['count'] / elapsed
+        ))
+    assert results['chain'] == results['compiled']
+
+
+if __name__ == '__main__':
+    main()
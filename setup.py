@@ -33,6 +33,7 @@ setup(
     entry_points={
         'console_scripts': [
             'ah-collection-update-ec2=aws_info_helper.scripts.ec2_update_collection:main',
+            'ah-collection-update-ip=aws_info_helper.scripts.ip_update_collection:main',
             'ah-collection-update-route53=aws_info_helper.scripts.route53_update_collection:main',
             'ah-collection-update-s3=aws_info_helper.scripts.s3_update_collection:main',
             'ah-info-ec2=aws_info_helper.scripts.ec2_info:main',
@@ -0,0 +1,69 @@
+import os
+import boto3
+import pytest
+import aws_info_helper as ah
+from os.path import abspath, dirname, join
+
+os.environ['AWS_CONFIG_FILE'] = os.devnull
+os.environ['AWS_SHARED_CREDENTIALS_FILE'] = os.devnull
+os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    """Point redis-helper at an empty in-memory fakeredis server, so no test
+    uses a real Redis (collections are None if fakeredis isn't installed)
+    """
+    try:
+        import fakeredis
+        import redis_helper as rh
+    except ImportError:
+        monkeypatch.setattr(ah, '_collections', dict.fromkeys(ah._collection_specs))
+        yield None
+        return
+    if not isinstance(rh.REDIS, fakeredis.FakeStrictRedis):
+        rh.REDIS = fakeredis.FakeStrictRedis()
+        ah._collections.clear()
+    rh.REDIS.flushdb()
+    yield rh.REDIS
+    rh.REDIS.flushdb()
+
+
+@pytest.fixture
+def fake_aws(monkeypatch):
+    """Return a func that takes a fleet (from benchmarks/synthetic.py) and
+    makes clients from ah.get_client answer from it (see benchmarks/fake_aws.py)
+    """
+    monkeypatch.syspath_prepend(join(dirname(dirname(abspath(__file__))), 'benchmarks'))
+    from fake_aws import FakeAWS
+    for service in ah.REQUESTS_PER_SECOND:
+        monkeypatch.setitem(ah.REQUESTS_PER_SECOND, service, 1e9)
+    monkeypatch.setattr(ah, '_rate_limiters', {})
+
+    def _fake(fleet, latency=0):
+        fake = FakeAWS(fleet, latency=latency)
+        session = boto3.Session()
+        fake.register(session)
+        monkeypatch.setattr(ah, '_sessions', {'default': session})
+        monkeypatch.setattr(ah, '_clients', {})
+        return fake
+
+    return _fake
+
+
+@pytest.fixture
+def make_fleet(fake_aws):
+    """Return synthetic.make_fleet (with every count defaulting to 0)"""
+    from synthetic import make_fleet as _make_fleet
+
+    def _make(**kwargs):
+        sizes = dict(
+            instances=0, addresses=0, zones=0, records=0, buckets=0, objects=0,
+            parameters=0
+        )
+        sizes.update(kwargs)
+        return _make_fleet(**sizes)
+
+    return _make
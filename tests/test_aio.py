@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+import weakref
+import pytest
+import aws_info_helper as ah
+from aws_info_helper import aio
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.fixture
+def concurrency(monkeypatch):
+    """Return a func that sets ASYNC_MAX_CONCURRENCY with a new pool/semaphores"""
+    def _set(value):
+        monkeypatch.setattr(ah, 'ASYNC_MAX_CONCURRENCY', value)
+        monkeypatch.setattr(aio, '_executor', None)
+        monkeypatch.setattr(aio, '_semaphores', weakref.WeakKeyDictionary())
+    _set(ah.ASYNC_MAX_CONCURRENCY)
+    yield _set
+    if aio._executor is not None:
+        aio._executor.shutdown(wait=True)
+
+
+def test_run_blocking_limits_calls_in_flight(concurrency):
+    concurrency(3)
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return i
+
+    async def main():
+        return await asyncio.gather(*[aio.run_blocking(work, i) for i in range(12)])
+
+    assert _run(main()) == list(range(12))
+    assert running[1] == 3
+
+
+def test_async_wrapper_methods(concurrency, fake_aws, make_fleet):
+    fake = fake_aws(make_fleet(instances=7))
+    ec2 = aio.AsyncEC2('default')
+
+    async def main():
+        return await asyncio.gather(
+            ec2.get_all_instances_filtered_data(),
+            ec2.iter_instances_filtered_data()
+        )
+
+    instances, iterated = _run(main())
+    assert len(instances) == 7
+    assert isinstance(iterated, list) and iterated == instances
+    assert fake.calls['ec2.describe_instances'] == 2
+    assert ec2.cached_instances == []
+    assert aio.AsyncEC2.wrap(ec2.sync).sync is ec2.sync
+
+
+def test_call_for_profiles_collects_results_and_errors(concurrency, fake_aws, make_fleet):
+    fake_aws(make_fleet(instances=4))
+    summary = _run(aio.call_for_profiles(
+        aio.AsyncEC2, 'get_all_instances_filtered_data', ['default', 'no-such-profile']
+    ))
+    assert len(summary['results']['default']) == 4
+    assert list(summary['errors']) == ['no-such-profile']
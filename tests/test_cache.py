@@ -0,0 +1,14 @@
+from aws_info_helper import cache
+
+
+def test_stats_keep_tags_apart_from_counters():
+    c = cache.TTLCache(maxsize=1, size='large', hits='tag', resource='test-stats')
+    c['a'] = 1
+    c['b'] = 2
+    assert c.get('b') == 2
+    assert c.get('a') is None
+    assert c.stats == {
+        'hits': 1, 'misses': 1, 'evictions': 1, 'expirations': 0, 'size': 1,
+        'tags': {'size': 'large', 'hits': 'tag', 'resource': 'test-stats'},
+    }
+    assert cache.get_stats(resource='test-stats') == [c.stats]
@@ -0,0 +1,63 @@
+import pytest
+import aws_info_helper as ah
+from botocore.stub import Stubber
+
+
+@pytest.fixture
+def ec2_client():
+    client = ah.get_session().client('ec2', region_name='us-east-1')
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_client_error_raises(ec2_client):
+    client, stubber = ec2_client
+    stubber.add_client_error('describe_addresses', 'UnauthorizedOperation')
+    with pytest.raises(ah.ClientCallError) as excinfo:
+        ah.client_call(client, 'describe_addresses', 'Addresses')
+    assert excinfo.value.method_name == 'describe_addresses'
+
+
+def test_allowed_error_returns_empty(ec2_client):
+    client, stubber = ec2_client
+    stubber.add_client_error('describe_addresses', 'InvalidAddress.NotFound')
+    assert ah.client_call(
+        client, 'describe_addresses', 'Addresses',
+        allowed_errors=('InvalidAddress.NotFound',)
+    ) == []
+
+
+def test_throttling_error_is_retried(ec2_client, monkeypatch):
+    client, stubber = ec2_client
+    monkeypatch.setattr(ah.time, 'sleep', lambda seconds: None)
+    stubber.add_client_error('describe_addresses', 'RequestLimitExceeded')
+    stubber.add_response('describe_addresses', {'Addresses': [{'PublicIp': '1.2.3.4'}]})
+    assert ah.client_call(client, 'describe_addresses', 'Addresses') == [
+        {'PublicIp': '1.2.3.4'}
+    ]
+
+
+@pytest.mark.parametrize('allowed_errors', [(), ('AuthFailure',)])
+def test_failed_page_is_not_end_of_pagination(ec2_client, allowed_errors):
+    client, stubber = ec2_client
+    stubber.add_response('describe_instances', {
+        'Reservations': [{'ReservationId': 'r-1', 'Instances': []}],
+        'NextToken': 'page-2',
+    })
+    stubber.add_client_error('describe_instances', 'AuthFailure')
+    with pytest.raises(ah.ClientCallError):
+        list(ah.iter_client_call(
+            client, 'describe_instances', 'Reservations',
+            allowed_errors=allowed_errors
+        ))
+
+
+def test_get_value_of_missing_parameter():
+    ssm = ah.ParameterStore()
+    with Stubber(ssm._client) as stubber:
+        stubber.add_client_error('get_parameter', 'ParameterNotFound')
+        assert ssm.get_value('/missing') is None
+        stubber.add_client_error('get_parameter', 'AccessDeniedException')
+        with pytest.raises(ah.ClientCallError):
+            ssm.get_value('/secret')
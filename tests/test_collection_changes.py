@@ -0,0 +1,129 @@
+import pytest
+import aws_info_helper as ah
+
+pytest.importorskip('fakeredis')
+
+
+def _records(collection, terms=''):
+    return sorted(
+        (x['name'], x['type'], x['value'], x['external'])
+        for x in collection.find(
+            terms, get_fields='name, type, value, external', limit=None
+        )
+    )
+
+
+def test_write_collection_changes_matches_collection_methods(redis):
+    collection = ah.AWS_ROUTE53
+    keep = collection.add(name='a.example.com', type='A', value='1.1.1.1', external='no')
+    gone = collection.add(name='b.example.com', type='A', value='2.2.2.2', external='no')
+
+    result = ah.write_collection_changes(
+        collection,
+        adds=[dict(name='c.example.com', type='CNAME', value='x.other.com', external='yes')],
+        updates=[(keep, dict(type='CNAME', value='a.other.com', external='yes'))],
+        deletes=[gone]
+    )
+    assert len(result['updates']) == 4
+    assert result['deletes'] == [gone]
+    assert collection.size == 2
+    assert _records(collection, 'type:CNAME') == [
+        ('a.example.com', 'CNAME', 'a.other.com', 'yes'),
+        ('c.example.com', 'CNAME', 'x.other.com', 'yes'),
+    ]
+    assert _records(collection, 'type:A') == []
+    assert collection.old_data_for_hash_id(keep)
+
+    # Collection methods still work on records written in the transaction
+    collection.delete(result['updates'][0])
+    assert _records(collection, 'external:yes') == [
+        ('a.example.com', 'CNAME', 'a.other.com', 'yes'),
+    ]
+
+
+def test_write_collection_changes_writes_nothing_if_any_change_is_invalid(redis):
+    collection = ah.AWS_ROUTE53
+    hash_id = collection.add(name='a.example.com', type='A', value='1.1.1.1', external='no')
+    with pytest.raises(Exception):
+        ah.write_collection_changes(
+            collection,
+            adds=[dict(name='b.example.com', type='A', value='2.2.2.2', external='no')],
+            updates=[(hash_id, dict(external='maybe'))],
+            deletes=[hash_id]
+        )
+    assert _records(collection) == [('a.example.com', 'A', '1.1.1.1', 'no')]
+
+
+def test_route53_update_collection_matches_a_fresh_build(redis, fake_aws, make_fleet):
+    fleet = make_fleet(zones=2, records=12)
+    fake_aws(fleet)
+    ah.Route53().update_collection()
+    collection = ah.AWS_ROUTE53
+
+    zone_id = fleet['zones'][0]['Id']
+    record_sets = fleet['record_sets'][zone_id]
+    by_name = {record['Name']: record for record in record_sets}
+    record_sets.remove(by_name['host0.zone0.example.com.'])
+    by_name['host4.zone0.example.com.']['ResourceRecords'] = [{'Value': '54.9.9.9'}]
+    ah.Route53().update_collection()
+    updated = _records(collection)
+
+    redis.flushdb()
+    ah.Route53().update_collection()
+    assert updated == _records(collection)
+    assert ('host4.zone0.example.com', 'A', '54.9.9.9', 'no') in updated
+    assert not [x for x in updated if x[0] == 'host0.zone0.example.com']
+
+
+def _instances(collection):
+    return sorted(
+        (x['id'], x['type'], x['sg'], x.get('sshuser'))
+        for x in collection.find(
+            '', get_fields='id, type, sg, sshuser', limit=None
+        )
+    )
+
+
+def test_ec2_update_collection_matches_a_fresh_build(redis, fake_aws, make_fleet):
+    fleet = make_fleet(instances=12, addresses=4)
+    fake_aws(fleet)
+    ah.EC2().update_collection()
+    collection = ah.AWS_EC2
+
+    instances = fleet['reservations'][0]['Instances']
+    removed = instances.pop(0)
+    instances[0]['InstanceType'] = 'x1.huge'
+    result = ah.EC2().update_collection()
+    assert collection.get_hash_id_for_unique_value(removed['InstanceId']) is None
+    assert len([x for x in result['updates'] if ' type: ' in x]) == 1
+    updated = _instances(collection)
+
+    redis.flushdb()
+    ah.EC2().update_collection()
+    assert updated == _instances(collection)
+    assert len(updated) == 11
+
+
+def test_ec2_save_ssh_users(redis, fake_aws, make_fleet):
+    fake_aws(make_fleet(instances=3))
+    ec2 = ah.EC2()
+    ec2.update_collection()
+    ids = [x[0] for x in _instances(ah.AWS_EC2)]
+    updates = ec2.save_ssh_users({ids[0]: 'ubuntu', ids[1]: '', 'i-missing': 'root'})
+    assert len(updates) == 1
+    assert [x[3] for x in _instances(ah.AWS_EC2)] == ['ubuntu', None, None]
+    assert [
+        x['id'] for x in ah.AWS_EC2.find('sshuser:ubuntu', get_fields='id', limit=None)
+    ] == [ids[0]]
+
+
+def test_read_collection_records_does_not_write_get_stats(redis, fake_aws, make_fleet):
+    fake_aws(make_fleet(instances=5))
+    ah.EC2().update_collection()
+    collection = ah.AWS_EC2
+    redis.delete(collection._get_id_stats_hash_key, collection._get_field_stats_hash_key)
+    records = ah.read_collection_records(collection, 'profile', 'default', ['id', 'fp'])
+    assert ah.read_collection_records(collection, 'profile', 'other', ['id']) == []
+    assert not redis.exists(collection._get_id_stats_hash_key)
+    assert sorted(x['id'] for x in records) == [x[0] for x in _instances(collection)]
+    assert all(x['_id'].startswith(collection._base_key) and x['fp'] for x in records)
@@ -0,0 +1,60 @@
+import pytest
+import aws_info_helper as ah
+from aws_info_helper.ip_index import IPEntry, IPIndex
+
+pytest.importorskip('fakeredis')
+
+
+def test_from_collection_with_and_without_profile(redis):
+    ah.AWS_IP.add(ip='1.1.1.1', source='ec2', instance='i-1', profile='p1')
+    ah.AWS_IP.add(ip='2.2.2.2', source='route53', name='a.example.com', profile='p1')
+    ah.AWS_IP.add(ip='3.3.3.3', source='eip', instance='i-3', profile='p2')
+
+    index = IPIndex.from_collection('p1')
+    assert len(index) == 2
+    assert '3.3.3.3' not in index
+    assert index.lookup('2.2.2.2') == [
+        IPEntry('2.2.2.2', 'route53', None, 'a.example.com', 'p1')
+    ]
+
+    index = IPIndex.from_collection()
+    assert len(index) == 3
+    assert index.lookup('3.3.3.3') == [IPEntry('3.3.3.3', 'eip', 'i-3', None, 'p2')]
+
+
+def test_update_collection_for_profiles_rebuilds_ip_index(redis, fake_aws, make_fleet):
+    from aws_info_helper.ip_index import IPCollection
+    fake_aws(make_fleet(instances=5, addresses=5, zones=1, records=4))
+    results = ah.update_collection_for_profiles(
+        IPCollection, profiles=['default', 'no-such-profile']
+    )
+    assert list(results['errors']) == ['no-such-profile']
+    index = IPIndex.from_collection('default')
+    assert len(results['updates']) == len(ah.AWS_IP.find('', limit=None)) > 5
+    assert {'ec2', 'eip', 'route53'} == {
+        entry.source for ip in index._ips for entry in index.lookup(ip)
+    }
+
+
+def test_sync_ip_entries_adds_and_deletes_in_one_batch(redis):
+    from aws_info_helper.ip_index import get_existing_ip_entries, sync_ip_entries
+    keep = ah.AWS_IP.add(ip='1.1.1.1', source='ec2', instance='i-1', profile='p1')
+    dupe = ah.AWS_IP.add(ip='1.1.1.1', source='ec2', instance='i-1', profile='p1')
+    gone = ah.AWS_IP.add(ip='2.2.2.2', source='eip', instance='i-2', profile='p1')
+    other = ah.AWS_IP.add(ip='3.3.3.3', source='route53', name='a.example.com', profile='p1')
+
+    result = sync_ip_entries(
+        [
+            IPEntry('1.1.1.1', 'ec2', 'i-1', None, 'p1'),
+            IPEntry('4.4.4.4', 'ec2', 'i-4', None, 'p1'),
+        ],
+        'p1',
+        sources=('ec2', 'eip')
+    )
+    assert len(result['updates']) == 1
+    assert sorted(result['deletes']) == sorted([dupe, gone])
+    assert get_existing_ip_entries('p1') == {
+        IPEntry('1.1.1.1', 'ec2', 'i-1', None, 'p1'): [keep],
+        IPEntry('3.3.3.3', 'route53', None, 'a.example.com', 'p1'): [other],
+        IPEntry('4.4.4.4', 'ec2', 'i-4', None, 'p1'): result['updates'],
+    }
@@ -0,0 +1,21 @@
+import pickle
+import pytest
+from aws_info_helper.records import record_class, record_maker
+
+Pair = record_class('Pair', 'ip, name, profile')
+
+
+def test_record_is_read_only_after_construction():
+    make = record_maker(Pair, 'PublicIpAddress, Tags.Value', name_mapping={
+        'PublicIpAddress': 'ip', 'Tags__Value': 'name'
+    })
+    record = make({'PublicIpAddress': '1.2.3.4', 'Tags': [{'Value': 'web'}]}, profile='p')
+    assert dict(record) == {'ip': '1.2.3.4', 'name': 'web', 'profile': 'p'}
+    with pytest.raises(AttributeError):
+        record.ip = '5.6.7.8'
+    with pytest.raises(AttributeError):
+        del record.name
+    with pytest.raises(AttributeError):
+        record.other = 1
+    assert record['ip'] == '1.2.3.4'
+    assert pickle.loads(pickle.dumps(record)) == record
@@ -0,0 +1,65 @@
+import aws_info_helper as ah
+
+
+def test_failed_head_object_forces_download(tmpdir, fake_aws, make_fleet):
+    fake_aws(make_fleet())
+    s3 = ah.S3()
+    tmpdir.join('a.txt').write('old')
+    tmpdir.join('b.txt').write('old')
+    calls = []
+
+    def client_call(method_name, **kwargs):
+        calls.append((method_name, kwargs['Key']))
+        if method_name == 'head_object':
+            if kwargs['Key'] == 'a.txt':
+                raise ah.ClientCallError(method_name, 'AccessDenied')
+            return {'ContentLength': 3, 'ETag': '"149603e6c03516362a8da23f624db945"'}
+        with open(kwargs['Filename'], 'w') as fp:
+            fp.write('new')
+
+    s3.client_call = client_call
+    summary = s3.download_files('bucket', ['a.txt', 'b.txt'], local_dir=str(tmpdir))
+    assert summary['errors'] == {}
+    assert summary['downloaded'] == [str(tmpdir.join('a.txt'))]
+    assert summary['skipped'] == [str(tmpdir.join('b.txt'))]
+    assert tmpdir.join('a.txt').read() == 'new'
+    assert ('download_file', 'b.txt') not in calls
+
+
+def test_keys_outside_local_dir_are_not_downloaded(tmpdir, fake_aws, make_fleet):
+    fake_aws(make_fleet())
+    s3 = ah.S3()
+    local_dir = tmpdir.mkdir('out')
+    calls = []
+
+    def client_call(method_name, **kwargs):
+        calls.append((method_name, kwargs['Key']))
+        if method_name == 'head_object':
+            raise ah.ClientCallError(method_name, 'NotFound')
+        with open(kwargs['Filename'], 'w') as fp:
+            fp.write('new')
+
+    s3.client_call = client_call
+    keys = ['../x.txt', '/etc/x.txt', 'a/../../x.txt', 'a/b.txt']
+    summary = s3.download_files(
+        'bucket', keys, local_dir=str(local_dir), keep_paths=True
+    )
+    assert sorted(summary['errors']) == ['../x.txt', '/etc/x.txt', 'a/../../x.txt']
+    assert summary['downloaded'] == [str(local_dir.join('a', 'b.txt'))]
+    assert [x[1] for x in calls if x[0] == 'download_file'] == ['a/b.txt']
+    assert not tmpdir.join('x.txt').exists()
+
+
+def test_concurrent_map_pulls_items_lazily_with_max_pending():
+    pulled = []
+
+    def items():
+        for i in range(20):
+            pulled.append(i)
+            yield i
+
+    results = ah.concurrent_map(lambda x: x * 2, items(), max_workers=2, max_pending=3)
+    first = next(results)
+    assert first[2] is None and first[1] == first[0] * 2
+    assert len(pulled) <= 4
+    assert sorted(x[1] for x in [first] + list(results)) == [x * 2 for x in range(20)]
@@ -0,0 +1,84 @@
+import random
+import pytest
+import aws_info_helper as ah
+from aws_info_helper.s3 import split_key_range
+
+
+def make_objects(keys):
+    return [{'Key': key, 'Size': 1, 'ETag': '"x"'} for key in sorted(keys)]
+
+
+KEY_SETS = {
+    'flat': ['file-{:06d}'.format(i) for i in range(5000)],
+    'one-prefix': ['logs/2024/{:05d}.gz'.format(i) for i in range(4000)],
+    'nested': ['data{}/part{}/f{}'.format(i % 3, i % 7, i) for i in range(3500)],
+    'mixed': [
+        ''.join(random.Random(i).choice('aZ09-_./ ~é') for _ in range(8)) + str(i)
+        for i in range(3000)
+    ],
+}
+
+
+@pytest.fixture
+def bucket(make_fleet, fake_aws):
+    def _bucket(keys):
+        fleet = make_fleet(buckets=1)
+        fleet['objects'] = {'bucket': make_objects(keys)}
+        return fake_aws(fleet)
+    return _bucket
+
+
+def test_split_key_range_covers_every_key():
+    keys = sorted(KEY_SETS['mixed'] + KEY_SETS['flat'][:50])
+    after, upto = keys[10], keys[-10]
+    shards = split_key_range(after, upto, keys[:10])
+    assert len(shards) > 1
+    covered = [
+        [key for key in keys if lo < key and (hi is None or key <= hi)]
+        for lo, hi in shards
+    ]
+    assert sum(covered, []) == [key for key in keys if after < key <= upto]
+
+
+@pytest.mark.parametrize('name', sorted(KEY_SETS))
+@pytest.mark.parametrize('ordered', [True, False])
+def test_sharded_listing_matches_sequential(bucket, name, ordered):
+    bucket(KEY_SETS[name])
+    s3 = ah.S3()
+    expected = [obj['Key'] for obj in s3.paginated_client_call(
+        'list_objects_v2', 'Contents', Bucket='bucket'
+    )]
+    keys = [obj['Key'] for obj in s3.iter_bucket_files_sharded(
+        'bucket', workers=4, ordered=ordered
+    )]
+    if ordered:
+        assert keys == expected
+    else:
+        assert sorted(keys) == expected
+
+
+def test_sharded_listing_with_prefix_start_after_and_limit(bucket):
+    bucket(KEY_SETS['nested'])
+    s3 = ah.S3()
+    expected = [obj['Key'] for obj in s3.paginated_client_call(
+        'list_objects_v2', 'Contents', Bucket='bucket', Prefix='data1/',
+        StartAfter='data1/part3/f1000'
+    )]
+    keys = [obj['Key'] for obj in s3.iter_bucket_files_sharded(
+        'bucket', prefix='data1/', start_after='data1/part3/f1000', limit=700,
+        workers=4
+    )]
+    assert keys == expected[:700]
+
+
+def test_limit_bounds_requests(bucket):
+    fake = bucket(KEY_SETS['flat'])
+    s3 = ah.S3()
+    files = s3.get_bucket_files_full_data('bucket', limit=1500, workers=4)
+    assert [obj['Key'] for obj in files] == KEY_SETS['flat'][:1500]
+    assert fake.calls['s3.list_objects_v2'] <= 1 + 2 * 4
+
+    fake.reset()
+    files = s3.get_bucket_files_full_data('bucket', limit=500, workers=4)
+    assert len(files) == 500
+    assert fake.calls['s3.list_objects_v2'] == 1
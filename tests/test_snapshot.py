@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from aws_info_helper.snapshot import SnapshotCache
+
+
+def test_stale_snapshot_is_marked_and_refreshed_in_the_background(tmpdir):
+    cache = SnapshotCache(str(tmpdir), stale_ttl=3600, refresh_wait=5)
+    path = cache.get_path('default', 'us-east-1', 'describe_instances', {})
+    assert cache.served_info() == (None, False)
+
+    cache.save(path, ['old'])
+    assert cache.get_or_fetch(path, lambda: ['new'], ttl=60) == ['old']
+    age, stale = cache.served_info()
+    assert age < 60 and stale is False
+
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    started = threading.Event()
+    release = threading.Event()
+    threads = []
+
+    def fetch():
+        threads.append(threading.current_thread())
+        started.set()
+        release.wait(5)
+        return ['new']
+
+    assert cache.get_or_fetch(path, fetch, ttl=60) == ['old']
+    assert started.wait(5)
+    age, stale = cache.served_info()
+    assert age >= 120 and stale is True
+    assert cache.wait_for_refreshes(0.01) is False
+
+    release.set()
+    assert cache.wait_for_refreshes(5) is True
+    assert cache.load(path)[0] == ['new']
+
+
+def test_stale_snapshot_is_refreshed_before_a_short_process_exits(tmpdir):
+    path = str(tmpdir.join('default', 'global', 'list_buckets-x.pickle'))
+    code = '''
+import sys, time
+from aws_info_helper.snapshot import SnapshotCache
+cache = SnapshotCache(sys.argv[1], stale_ttl=3600, refresh_wait=5)
+def fetch():
+    time.sleep(0.5)
+    return ['new']
+print(cache.get_or_fetch(sys.argv[2], fetch, ttl=60))
+'''
+    cache = SnapshotCache(str(tmpdir))
+    cache.save(path, ['old'])
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    output = subprocess.check_output([sys.executable, '-c', code, str(tmpdir), path])
+    assert output.strip() == b"['old']"
+    assert cache.load(path)[0] == ['new']